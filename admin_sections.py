@@ -0,0 +1,140 @@
+import base64
+import json
+from datetime import date
+from sqlalchemy import tuple_
+from models import Absence, Event, MenuItem
+
+
+def encode_cursor(values):
+    """Curseur opaque : valeurs de la clé de tri de la dernière ligne renvoyée"""
+    raw = json.dumps([value.isoformat() if isinstance(value, date) else value for value in values])
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token, columns):
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        values = json.loads(raw)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Curseur invalide")
+    if not isinstance(values, list) or len(values) != len(columns):
+        raise ValueError("Curseur invalide")
+    decoded = []
+    for column, value in zip(columns, values):
+        if value is not None and column.type.python_type is date:
+            value = date.fromisoformat(value)
+        decoded.append(value)
+    return decoded
+
+
+def parse_date(value, name):
+    try:
+        return date.fromisoformat(value) if value else None
+    except ValueError:
+        raise ValueError(f"Date invalide pour {name} : {value}")
+
+
+class AdminSection:
+    """Liste paginée par clé (keyset) d'une section du tableau de bord.
+
+    La clé de tri suit l'index de la table (l'id, alias du rowid SQLite, termine
+    chaque index) : une page se lit par une recherche dans l'index suivie d'au plus
+    limit lignes, quel que soit le rang de la page, sans OFFSET ni COUNT.
+    """
+
+    def __init__(self, name, order_by, query, serialize):
+        self.name = name
+        self.order_by = order_by
+        self.query = query
+        self._serialize = serialize
+
+    def page(self, args, limit):
+        """Retourne {'items', 'next'} ; ValueError si un filtre ou le curseur est invalide"""
+        query = self.query(args)
+        cursor = args.get('cursor')
+        if cursor:
+            query = query.filter(tuple_(*self.order_by) > tuple_(*decode_cursor(cursor, self.order_by)))
+        rows = query.order_by(*self.order_by).limit(limit + 1).all()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            next_cursor = encode_cursor([getattr(last, column.key) for column in self.order_by])
+        return {'items': [self._serialize(row) for row in rows], 'next': next_cursor}
+
+
+def _search(query, column, args):
+    text = (args.get('q') or '').strip()
+    if text:
+        query = query.filter(column.ilike(f"%{text}%"))
+    return query
+
+
+def _absences_query(args):
+    start = parse_date(args.get('from'), 'from') or Absence.week_start()
+    query = Absence.query.filter(Absence.date_fin >= start)
+    end = parse_date(args.get('to'), 'to')
+    if end:
+        query = query.filter(Absence.date_debut <= end)
+    return _search(query, Absence.professeur, args)
+
+
+def _events_query(args):
+    query = Event.query.filter(Event.date >= (parse_date(args.get('from'), 'from') or date.today()))
+    end = parse_date(args.get('to'), 'to')
+    if end:
+        query = query.filter(Event.date <= end)
+    return _search(query, Event.title, args)
+
+
+def _menu_query(args):
+    query = MenuItem.query.filter(MenuItem.date >= (parse_date(args.get('from'), 'from') or date.today()))
+    end = parse_date(args.get('to'), 'to')
+    if end:
+        query = query.filter(MenuItem.date <= end)
+    if args.get('category'):
+        query = query.filter(MenuItem.category == args['category'])
+    return _search(query, MenuItem.name, args)
+
+
+SECTIONS = {section.name: section for section in (
+    AdminSection(
+        'absences', (Absence.date_fin, Absence.date_debut, Absence.id), _absences_query,
+        lambda absence: {
+            'id': absence.id,
+            'professeur': absence.professeur,
+            'date_debut': absence.date_debut.isoformat(),
+            'date_fin': absence.date_fin.isoformat(),
+        }
+    ),
+    AdminSection(
+        'events', (Event.date, Event.id), _events_query,
+        lambda event: {
+            'id': event.id,
+            'title': event.title,
+            'date': event.date.isoformat(),
+            'description': event.description,
+        }
+    ),
+    AdminSection(
+        'menu', (MenuItem.date, MenuItem.category, MenuItem.order, MenuItem.id), _menu_query,
+        lambda item: {
+            'id': item.id,
+            'date': item.date.isoformat(),
+            'category': item.category,
+            'name': item.name,
+            'description': item.description,
+            'icons': item.icons,
+        }
+    ),
+)}
+
+# Section à recharger après chaque action du tableau de bord (les autres restent en place)
+ACTION_SECTIONS = {
+    'submit_absence': 'absences',
+    'delete_absence': 'absences',
+    'submit_event': 'events',
+    'delete_event': 'events',
+    'submit_menu_item': 'menu',
+    'delete_menu_item': 'menu',
+}
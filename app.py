@@ -1,19 +1,56 @@
 from datetime import datetime, date, timedelta
-from flask import Flask, render_template, redirect, url_for, request, flash, jsonify
+from flask import (Flask, Response, render_template, redirect, url_for, request, flash, jsonify, session, send_file,
+                   abort, get_flashed_messages)
 from flask_login import login_user, login_required, logout_user, current_user
 from config import Config
 from extensions import db, csrf, login_manager, logger
-from models import User, Absence, WidgetConfig, Event, SiteConfig, WeatherConfig, MenuItem
+from models import User, Absence, WidgetConfig, Event, SiteConfig, WeatherConfig, MenuItem, DataVersion
 from forms import (LoginForm, AbsenceForm, WidgetConfigForm, EventForm, 
-                  ChangePasswordForm, SiteConfigForm, WeatherConfigForm, CTSForm, MenuItemForm)
-import requests
+                  ChangePasswordForm, SiteConfigForm, WeatherConfigForm, CTSForm, MenuItemForm, ImportForm,
+                  split_codes)
+from cts import (fetch_stop_monitoring, stop_monitoring_cache, last_known_arrivals, fetch_departure_boards,
+                 estimated_timetable_cache, last_known_boards, boards_digest, fallback_boards_cache)
+from refresher import refresher
+from weather import weather_cache
+from http_client import upstream
+from stream import broadcaster, format_event
+from config_cache import config_cache
+from page_cache import home_page_cache
+from importer import import_file, RowValidator
+from menu_cache import menu_cache, menu_week_start
+from fanout import home_fanout
+from snapshots import snapshot_store
+from sqlite_tuning import sqlite_tuning, read_only
+from metrics import metrics, cache_counters
+from profiler import profiler
+from admin_sections import SECTIONS, ACTION_SECTIONS
+from stop_catalogue import stop_catalogue
+from timetable import offline_timetable
+import csv
+import migrations
+import click
+import queue
+import time
 
 app = Flask(__name__)
 app.config.from_object(Config)
 
 db.init_app(app)
+sqlite_tuning.init_app(app)
+metrics.init_app(app)
+profiler.init_app(app)
 csrf.init_app(app)
 login_manager.init_app(app)
+weather_cache.configure(app.config)
+upstream.configure(app.config)
+snapshot_store.configure(app.config)
+stop_catalogue.configure(app.config)
+offline_timetable.configure(app.config)
+refresher.configure(app.config)
+broadcaster.configure(app.config)
+config_cache.check_interval = app.config['CONFIG_CACHE_CHECK_INTERVAL']
+menu_cache.check_interval = app.config['CONFIG_CACHE_CHECK_INTERVAL']
+home_fanout.configure(app.config)
 
 @login_manager.user_loader
 def load_user(user_id):
@@ -25,6 +62,8 @@ def initialize_database():
         with app.app_context():
             # Vérifie si les tables existent déjà
             db.create_all()
+            # Met à niveau les bases existantes (index, contraintes)
+            migrations.upgrade(db.engine)
             
             # Initialisation de l'utilisateur admin
             admin = User.query.filter_by(identifiant='admin').first()
@@ -56,17 +95,51 @@ def initialize_database():
         logger.error(f"Erreur fatale d'initialisation de la base de données: {e}")
         raise SystemExit(1)
 
-@app.context_processor
-def utility_processor():
-    def get_absence_status(absence, jour):
-        return getattr(absence, jour, False)
-    return {'get_absence_status': get_absence_status}
+def release_process_resources(close=False):
+    """Abandonne les connexions du pool (base, HTTP) pour que le processus ouvre les siennes.
+
+    Dans un worker fraîchement forké, close=False laisse intactes les sockets
+    héritées, qui appartiennent toujours au processus maître.
+    """
+    with app.app_context():
+        db.engine.dispose(close=close)
+    sqlite_tuning.dispose(close=close)
+    upstream.reset()
+    metrics.reset()
+
+@app.cli.command('db-upgrade')
+def db_upgrade_command():
+    """Crée les tables manquantes et applique les migrations du schéma"""
+    db.create_all()
+    version = migrations.upgrade(db.engine)
+    click.echo(f"Schéma à jour (version {version})")
+
+@app.cli.command('check-queries')
+def check_queries_command():
+    """Affiche le plan d'exécution des requêtes de l'affichage"""
+    for result in migrations.check_hot_queries(db.engine):
+        status = 'index' if result['uses_index'] else 'PARCOURS COMPLET'
+        click.echo(f"{result['query']} [{status}]")
+        for line in result['plan']:
+            click.echo(f"    {line}")
+
+@app.cli.command('import-data')
+@click.argument('kind', type=click.Choice(['absences', 'events', 'menu']))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+def import_data_command(kind, path):
+    """Importe un fichier CSV ou iCalendar (absences, événements, menus)"""
+    with open(path, 'rb') as stream:
+        report = import_file(kind, stream, path, app.config['IMPORT_BATCH_SIZE'], app.config['IMPORT_MAX_ERRORS'])
+    click.echo(f"{report.summary()} ({report.rows_per_second} lignes/s)")
+    for line, message in report.errors:
+        click.echo(f"  ligne {line} : {message}")
 
 @app.context_processor
 def inject_config():
+    configs = config_cache.get()
     return {
-        'site_config': SiteConfig.get_config(),
-        'weather_city': app.config['WEATHER_CITY'],
+        'site_config': configs.site,
+        'weather_city': configs.weather.city,
         'current_datetime': datetime.now()
     }
 
@@ -74,7 +147,8 @@ def inject_config():
 def inject_models():
     """Injecte les modèles nécessaires dans les templates"""
     return {
-        'MenuItem': MenuItem
+        'MenuItem': MenuItem,
+        'Absence': Absence
     }
 
 @app.errorhandler(404)
@@ -108,67 +182,333 @@ def handle_unhandled_error(error):
     logger.error(f'Erreur non gérée: {error}', exc_info=True)
     return render_template('errors/500.html'), 500
 
+def home_cache_key():
+    """Clé du cache de l'accueil, construite sans accès à la base ; None si non cachable"""
+    if not app.config['HOME_CACHE_ENABLED'] or '_user_id' in session:
+        return None
+    # Version de l'affichage (données, configuration, jour, transports) tenue à jour en arrière-plan
+    display = refresher.get('display')
+    if display is None:
+        return None
+    return display, int(time.time() // app.config['HOME_CACHE_BUCKET'])
+
 @app.route('/')
+@read_only
 def home():
+    cache_key = home_cache_key()
+    if cache_key:
+        page = home_page_cache.get(cache_key)
+        if page:
+            return home_page_cache.response(page, request, 'HIT')
     try:
-        config = WidgetConfig.query.first() or WidgetConfig()
+        start = time.perf_counter()
+        configs = config_cache.get()
+        config = configs.widget
+        # Les widgets dépendant d'API externes sont lancés avant les lectures locales, puis attendus
+        # seulement pendant le reste de l'échéance : la page ne dépasse pas HOME_DEADLINE au total
+        pending = home_fanout.submit(app, home_widget_loaders(configs))
         context = {
             'config': config,
-            'absences': Absence.query.all(),
+            'absences_by_day': get_week_absences_by_day(),
             'events': Event.get_upcoming_events(),
-            'menu_items': MenuItem.get_todays_menu() if config.show_menu_cantine else [],
-            'cts_arrivals': get_cts_arrivals(config) if config.has_valid_transport_config() else [],
-            'active_widgets': config.get_all_active_widgets()
+            'menu_items': menu_cache.day() if config.show_menu_cantine else [],
+            'active_widgets': config.get_all_active_widgets(),
+            'display_etag': display_etag(DataVersion.get_versions())
         }
-        return render_template('home.html', **context)
+        widgets = home_fanout.collect(pending)
+        context['cts_boards'] = widgets.values.get('transport', [])
+        context['weather'] = widgets.values.get('weather')
+        html = render_template('home.html', **context)
+        # Un widget hors délai (chargement encore en cours) : page gardée peu de temps, le
+        # temps que les données arrivent. Un échec rendu avec sa valeur de repli est une page complète
+        if cache_key:
+            ttl = app.config['HOME_CACHE_DEGRADED_TTL'] if widgets.missed else None
+            page = home_page_cache.put(cache_key, html, time.perf_counter() - start, ttl)
+            return home_page_cache.response(page, request)
+        return html
     except Exception as e:
         logger.error(f'Erreur page d\'accueil: {str(e)}')
         return f"Erreur : {str(e)}", 500
 
-def get_cts_arrivals(config):
-    if not config.show_transports:
-        logger.info("Widget transport désactivé")
-        return []
-    
-    if not config.cts_stop_code:
-        logger.warning("Code d'arrêt CTS non configuré")
-        return []
-    
-    try:
-        endpoint = f"{app.config['CTS_BASE_URL']}/v1/siri/2.0/stop-monitoring"
-        api_token = config.cts_api_token or app.config['CTS_API_TOKEN']
-        
-        if not api_token:
-            logger.error("Token API CTS manquant")
-            return []
-
-        params = {
-            "MonitoringRef": config.cts_stop_code,
-            "VehicleMode": config.cts_vehicle_mode or "undefined",
-            "PreviewInterval": "PT2H",
-            "MaximumStopVisits": 10
-        }
+@DataVersion.on_commit
+def invalidate_home_page(sections):
+    home_page_cache.invalidate()
+
+def get_week_absences_by_day():
+    week_start = Absence.week_start()
+    return Absence.group_by_day(Absence.get_week_absences(week_start), week_start)
+
+def get_cts_boards(config, fetch_missing=False):
+    """Tableaux de départs affichés (accueil, /get_updates, /get_transport)"""
+    return current_cts_boards(config, fetch_missing)[0]
+
+def current_cts_boards(config, fetch_missing=False):
+    """(tableaux, empreinte) : seul endroit qui choisit entre instantané, appel direct et repli.
+
+    L'instantané d'arrière-plan est servi s'il correspond aux arrêts configurés et reste
+    récent ; trop ancien, il cède la place aux horaires de repli. Sans instantané pour ces
+    arrêts, le rafraîchissement est demandé et, avec fetch_missing (accueil, sous l'échéance
+    commune), l'API est interrogée directement, via le cache CTS partagé.
+    """
+    if not config.has_valid_transport_config():
+        return [], 0
+    snapshot = refresher.get('cts')
+    if cts_snapshot_matches(snapshot, config):
+        if not cts_realtime_is_stale():
+            return snapshot['boards'], snapshot['digest']
+    else:
+        refresher.trigger('cts')
+        if fetch_missing:
+            try:
+                boards = fetch_cts_boards(config, config.cts_api_token or app.config['CTS_API_TOKEN'])
+                return boards, boards_digest(boards)
+            except Exception as e:
+                logger.warning(f"API CTS indisponible, horaires de repli affichés: {e}")
+    return fallback_cts_boards(config)
+
+def cts_realtime_is_stale():
+    last_success = refresher.last_success('cts')
+    return last_success is not None and time.time() - last_success > app.config['CTS_REALTIME_MAX_AGE']
+
+def cts_snapshot_matches(snapshot, config):
+    return bool(snapshot) and snapshot['stop_code'] == config.cts_stop_code \
+        and snapshot['vehicle_mode'] == (config.cts_vehicle_mode or 'undefined') \
+        and snapshot.get('stops') == config.transport_stops() \
+        and snapshot.get('lines') == config.transport_lines()
+
+def home_widget_loaders(configs):
+    """Widgets de l'accueil alimentés par des API externes : {nom: (chargement, valeur de repli)}"""
+    loaders = {}
+    widget_config = configs.widget
+    weather_config = configs.weather
+    if widget_config.has_valid_transport_config():
+        # Repli None : la page affiche « horaires en cours de chargement »
+        loaders['transport'] = (lambda: get_cts_boards(widget_config, fetch_missing=True), None)
+    if weather_config.show_weather:
+        loaders['weather'] = (lambda: load_weather(weather_config), None)
+    return loaders
 
-        logger.info(f"Requête CTS: {endpoint} avec arrêt {config.cts_stop_code}")
-        response = requests.get(
-            endpoint, 
-            params=params,
-            auth=(api_token, ""),
-            timeout=5
+def fetch_cts_boards(config, api_token):
+    """Un seul arrêt : stop-monitoring ; plusieurs arrêts ou lignes filtrées : un seul estimated-timetable"""
+    if config.uses_departure_boards():
+        return fetch_departure_boards(
+            config.transport_stops(),
+            config.transport_lines(),
+            config.cts_vehicle_mode,
+            api_token,
+            preview_interval="PT1H",
+            max_visits=10
         )
-        
-        if response.status_code == 200:
-            data = response.json()
-            visits = data["ServiceDelivery"]["StopMonitoringDelivery"][0].get("MonitoredStopVisit", [])
-            visits = visits[:10]
-            logger.info(f"Nombre de passages trouvés après limitation : {len(visits)}")
-            return visits
-        
-        logger.error(f"Erreur CTS: statut {response.status_code}, réponse: {response.text}")
-        return []
-    except Exception as e:
-        logger.error(f"Erreur CTS: {str(e)}")
-        return []
+    departures = fetch_stop_monitoring(
+        config.cts_stop_code,
+        config.cts_vehicle_mode,
+        api_token,
+        preview_interval="PT2H",
+        max_visits=10
+    )
+    return [{'code': config.cts_stop_code, 'name': config.cts_stop_display or config.cts_stop_code, 'departures': departures}]
+
+def fallback_cts_boards(config):
+    """Horaires de repli et leur empreinte, calculés au plus une fois par minute et par configuration"""
+    now = time.time()
+    key = (config.cts_stop_code, config.cts_vehicle_mode, tuple(config.transport_stops()),
+           tuple(config.transport_lines()), int(now // 60))
+
+    def load():
+        boards = build_fallback_cts_boards(config)
+        return (boards, boards_digest(boards)), 60 - now % 60
+
+    return fallback_boards_cache.get_or_load(key, load)
+
+def build_fallback_cts_boards(config):
+    """Temps réel indisponible ou trop ancien : horaires théoriques, à défaut derniers passages connus"""
+    boards = offline_timetable.boards(config.transport_stops())
+    if all(board['departures'] for board in boards):
+        return boards
+    known = last_known_cts_boards(config)
+    return [board if board['departures'] else stale_board(known_board)
+            for board, known_board in zip(boards, known)]
+
+def stale_board(board):
+    """Derniers passages connus, affichés comme horaires non garantis (ni temps réel, ni à jour)"""
+    departures = [departure._replace(realtime=False) for departure in board['departures']]
+    return dict(board, departures=departures, scheduled=True)
+
+def last_known_cts_boards(config):
+    if config.uses_departure_boards():
+        return last_known_boards(config.transport_stops(), config.transport_lines(), config.cts_vehicle_mode)
+    departures = last_known_arrivals(config.cts_stop_code, config.cts_vehicle_mode)
+    return [{'code': config.cts_stop_code, 'name': config.cts_stop_display or config.cts_stop_code, 'departures': departures}]
+
+def load_weather(weather_config):
+    """Météo en cache seulement : une absence déclenche la tâche de fond, jamais un appel pendant le rendu"""
+    payload = weather_cache.get(weather_config.city, weather_config.api_key)
+    if payload is None:
+        refresher.trigger('weather')
+    return payload
+
+def refresh_cts_snapshot():
+    """Tâche de fond : récupère les passages des arrêts configurés"""
+    config = config_cache.get().widget
+    if not config.has_valid_transport_config():
+        return None
+    boards = fetch_cts_boards(config, config.cts_api_token or app.config['CTS_API_TOKEN'])
+    # Relevé des départs temps réel, base des horaires théoriques de repli : un seul worker écrit
+    # les relevés partagés (les autres reçoivent les mêmes passages)
+    if refresher.is_owner():
+        offline_timetable.observe(boards)
+    return {
+        'stop_code': config.cts_stop_code,
+        'vehicle_mode': config.cts_vehicle_mode or 'undefined',
+        'stops': config.transport_stops(),
+        'lines': config.transport_lines(),
+        'boards': boards,
+        # Version des transports dans l'ETag de l'affichage (voir transport_version)
+        'digest': boards_digest(boards)
+    }
+
+def refresh_weather_snapshot():
+    """Tâche de fond : récupère la météo de la ville configurée"""
+    weather_config = config_cache.get().weather
+    if not weather_config.show_weather:
+        return None
+    return {
+        'city': weather_config.city,
+        'data': weather_cache.refresh(weather_config.city, weather_config.api_key)
+    }
+
+def refresh_stop_catalogue():
+    """Tâche de fond : recharge le catalogue des arrêts CTS quand il a plus de CTS_CATALOGUE_MAX_AGE secondes"""
+    config = config_cache.get().widget
+    return stop_catalogue.refresh(config.cts_api_token or app.config['CTS_API_TOKEN'])
+
+def refresh_offline_timetable():
+    """Tâche de fond : compile les horaires théoriques des arrêts affichés"""
+    config = config_cache.get().widget
+    return offline_timetable.refresh(config.cts_api_token or app.config['CTS_API_TOKEN'], config.transport_stops())
+
+def purge_past_absences():
+    """Tâche de fond : les semaines passées ne sont ni conservées ni parcourues"""
+    purged = Absence.purge_before(Absence.week_start())
+    db.session.commit()
+    return {'purged': purged}
+
+refresher.add_job('cts', app.config['REFRESH_CTS_INTERVAL'], refresh_cts_snapshot)
+refresher.add_job('weather', app.config['REFRESH_WEATHER_INTERVAL'], refresh_weather_snapshot)
+refresher.add_job('cts_catalogue', 3600, refresh_stop_catalogue, single_owner=True)
+refresher.add_job('cts_timetable', app.config['CTS_TIMETABLE_INTERVAL'], refresh_offline_timetable,
+                  single_owner=True)
+refresher.add_job('absences_purge', 6 * 3600, purge_past_absences, single_owner=True)
+
+@app.before_request
+def start_background_refresh():
+    if app.config['REFRESH_ENABLED']:
+        refresher.ensure_started(app)
+
+@app.after_request
+def notify_display_change(response):
+    # Une écriture admin est diffusée sans attendre le prochain contrôle de version
+    if request.method == 'POST' and request.endpoint == 'admin_dashboard':
+        refresher.trigger('display')
+    return response
+
+@app.route('/admin/cache-stats')
+@login_required
+def cache_stats():
+    return jsonify({
+        'cts_stop_monitoring': stop_monitoring_cache.stats(),
+        'cts_estimated_timetable': estimated_timetable_cache.stats(),
+        'cts_fallback': fallback_boards_cache.stats(),
+        'weather': weather_cache.stats(),
+        'stream': broadcaster.stats(),
+        'home_page': home_page_cache.stats(),
+        'menu': menu_cache.stats(),
+        'sqlite': sqlite_tuning.stats(),
+        'cts_catalogue': stop_catalogue.stats(),
+        'cts_timetable': offline_timetable.stats()
+    })
+
+@metrics.add_collector
+def collect_cache_metrics():
+    return (cache_counters('cts_stop_monitoring', stop_monitoring_cache.stats())
+            + cache_counters('cts_estimated_timetable', estimated_timetable_cache.stats())
+            + cache_counters('weather', weather_cache.stats(), hits=('hits', 'stale_hits'))
+            + cache_counters('home_page', home_page_cache.stats()))
+
+@app.route('/metrics')
+def metrics_endpoint():
+    token = app.config['METRICS_TOKEN']
+    if token and request.headers.get('Authorization') != f"Bearer {token}":
+        return Response('Non autorisé\n', status=401, mimetype='text/plain')
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/admin/upstream-stats')
+@login_required
+def upstream_stats():
+    return jsonify(dict(upstream.stats(), home_widgets=home_fanout.stats()))
+
+@app.route('/admin/profiles')
+@login_required
+def list_profiles():
+    return jsonify({'enabled': profiler.enabled, 'profiles': profiler.list_profiles()})
+
+@app.route('/admin/profiles/<profile_id>')
+@login_required
+def download_profile(profile_id):
+    """Profil complet (trace SQL, statistiques) ; ?format=pstats pour le fichier cProfile brut"""
+    pstats_format = request.args.get('format') == 'pstats'
+    extension = '.prof' if pstats_format else '.json'
+    path = profiler.path(profile_id, extension)
+    if path is None:
+        abort(404)
+    return send_file(path, as_attachment=True, download_name=profile_id + extension,
+                     mimetype='application/octet-stream' if pstats_format else 'application/json')
+
+@app.route('/admin/refresh-status')
+@login_required
+def refresh_status():
+    return jsonify(refresher.status())
+
+@app.route('/admin/cts/stops')
+@login_required
+def search_cts_stops():
+    """Recherche d'arrêts dans le catalogue local (saisie au fil de l'eau) : q, line, mode, limit"""
+    limit = min(max(request.args.get('limit', 10, type=int), 1), 50)
+    stops = stop_catalogue.search(request.args.get('q', ''), request.args.get('line') or None,
+                                  request.args.get('mode') or None, limit)
+    return jsonify({
+        'loaded': stop_catalogue.index is not None,
+        'stops': [stop.as_dict() for stop in stops]
+    })
+
+@app.route('/admin/sections/<name>')
+@login_required
+@read_only
+def admin_section(name):
+    """Page d'une liste du tableau de bord ; ?cursor= (champ next de la page précédente), q, from, to"""
+    section = SECTIONS.get(name)
+    if section is None:
+        abort(404)
+    try:
+        limit = int(request.args.get('limit', app.config['ADMIN_PAGE_SIZE']))
+        limit = min(max(limit, 1), app.config['ADMIN_PAGE_MAX'])
+        return jsonify(section.page(request.args, limit))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+def section_response(action, forms):
+    """Réponse JSON d'une action envoyée par le tableau de bord : seule la section touchée est rechargée"""
+    if action == 'submit_import':
+        section = forms['import_form'].kind.data
+    else:
+        section = ACTION_SECTIONS.get(action)
+    form_name = {'submit_absence': 'absence_form', 'submit_event': 'event_form',
+                 'submit_menu_item': 'menu_form'}.get(action)
+    return jsonify({
+        'section': section,
+        'messages': get_flashed_messages(with_categories=True),
+        'errors': forms[form_name].errors if form_name else {}
+    })
 
 @app.route('/login', methods=['GET','POST'])
 def login():
@@ -201,23 +541,16 @@ def admin_dashboard():
         'weather_form': WeatherConfigForm(),
         'widget_form': WidgetConfigForm(),
         'cts_form': CTSForm(),
-        'menu_form': MenuItemForm()
-    }
-    
-    configs = {
-        'widget': WidgetConfig.query.first() or WidgetConfig(),
-        'site': SiteConfig.get_config(),
-        'weather': WeatherConfig.get_config()
+        'menu_form': MenuItemForm(),
+        'import_form': ImportForm()
     }
     
-    # Pré-remplissage des formulaires
-    if not forms['widget_form'].is_submitted():
-        widget_config = configs['widget']
-        forms['widget_form'].show_menu_cantine.data = widget_config.show_menu_cantine
-        forms['widget_form'].show_transports.data = widget_config.show_transports
-        forms['widget_form'].cts_stop_code.data = widget_config.cts_stop_code
-        forms['widget_form'].cts_vehicle_mode.data = widget_config.cts_vehicle_mode
-        forms['widget_form'].cts_api_token.data = widget_config.cts_api_token
+    if request.method == 'POST':
+        configs = editable_configs()
+    else:
+        # Affichage : instantané du cache de configuration, sans requête ni création de ligne
+        snapshot = config_cache.get()
+        configs = {'widget': snapshot.widget, 'site': snapshot.site, 'weather': snapshot.weather}
 
     # Pré-remplissage des formulaires
     if not forms['widget_form'].is_submitted():
@@ -245,10 +578,17 @@ def admin_dashboard():
                         widget_config.cts_stop_code = forms['widget_form'].cts_stop_code.data
                         widget_config.cts_vehicle_mode = forms['widget_form'].cts_vehicle_mode.data
                         widget_config.cts_api_token = forms['widget_form'].cts_api_token.data
+                        widget_config.cts_stop_codes = ','.join(split_codes(forms['widget_form'].cts_stop_codes.data))
+                        widget_config.cts_line_refs = ','.join(split_codes(forms['widget_form'].cts_line_refs.data))
                 widget_config.cts_stop_display = forms['widget_form'].cts_stop_display.data
 
+                DataVersion.mark_changed('config')
                 db.session.commit()
+                refresher.trigger('cts')
                 flash('Configuration widgets mise à jour', 'success')
+            else:
+                for errors in forms['widget_form'].errors.values():
+                    flash(', '.join(errors), 'error')
             return redirect(url_for('admin_dashboard'))
         
         # Traitement du formulaire de recherche CTS pour prévisualisation
@@ -263,7 +603,7 @@ def admin_dashboard():
                 "MaximumStopVisits": 5
             }
             try:
-                response = requests.get(endpoint, params=params,
+                response = upstream.get(endpoint, params=params,
                                         auth=(configs['widget'].cts_api_token or app.config['CTS_API_TOKEN'], ""))
                 if response.status_code == 200:
                     data = response.json()
@@ -281,22 +621,26 @@ def admin_dashboard():
             
             # Si l'admin clique sur "Utiliser ce stop pour l'affichage", on enregistre les infos dans le widget
             if 'submit_cts_save' in request.form:
+                if stop_catalogue.is_known(cts_stop_code) is False:
+                    flash(f"Arrêt « {cts_stop_code} » inconnu du réseau CTS", 'error')
+                    return redirect(url_for('admin_dashboard'))
                 widget_config = configs['widget']
                 widget_config.cts_stop_code = cts_stop_code
                 widget_config.cts_vehicle_mode = cts_vehicle_mode
+                DataVersion.mark_changed('config')
                 db.session.commit()
+                refresher.trigger('cts')
                 flash("Le code d'arrêt CTS a été enregistré pour l'affichage sur la page d'accueil", 'success')
                 return redirect(url_for('admin_dashboard'))
             
             return render_template(
                 'admin_dashboard.html',
-                absences=Absence.query.all(),
                 widget_config=configs['widget'],
-                future_events=Event.get_upcoming_events(),
                 **forms,
                 cts_results=cts_results,
                 searched_cts_stop=cts_stop_code,
-                searched_vehicle_mode=cts_vehicle_mode
+                searched_vehicle_mode=cts_vehicle_mode,
+                refresh_status=refresher.status()
             )
         
         # Traitement des autres formulaires (absences, événements, site, météo, etc.)
@@ -309,46 +653,155 @@ def admin_dashboard():
             'submit_site': handle_site_config,
             'submit_weather': handle_weather_config,
             'submit_menu_item': handle_menu_item_creation,
-            'delete_menu_item': handle_menu_item_deletion
+            'delete_menu_item': handle_menu_item_deletion,
+            'submit_import': handle_bulk_import
         }
         for action, handler in form_handlers.items():
             if action in request.form:
-                return handler(request, forms, configs)
+                response = handler(request, forms, configs)
+                if request.accept_mimetypes.best == 'application/json' and action != 'submit_password':
+                    return section_response(action, forms)
+                return response
     
+    # Absences, événements et plats sont chargés page par page depuis /admin/sections/<nom>
     return render_template(
         'admin_dashboard.html',
-        absences=Absence.query.all(),
         widget_config=configs['widget'],
-        future_events=Event.get_upcoming_events(),
-        menu_items=MenuItem.get_todays_menu(),
-        **forms
+        refresh_status=refresher.status(),
+        profiles=profiler.list_profiles()[:10] if profiler.enabled else None,
+        **forms,
+        **menu_planner_context(request.args.get('menu_week'))
     )
 
+def editable_configs():
+    """Lignes de configuration modifiables par les formulaires, créées si elles manquent encore"""
+    configs = {}
+    for name, model in (('widget', WidgetConfig), ('site', SiteConfig), ('weather', WeatherConfig)):
+        row = model.query.first()
+        if row is None:
+            row = model()
+            db.session.add(row)
+        configs[name] = row
+    return configs
+
+def parse_menu_week(value):
+    """Lundi de la semaine demandée (semaine courante par défaut), None si la date est invalide"""
+    try:
+        return menu_week_start(date.fromisoformat(value)) if value else menu_week_start()
+    except (TypeError, ValueError):
+        return None
+
+def menu_planner_context(value):
+    week_start = parse_menu_week(value) or menu_week_start()
+    current = menu_week_start()
+    return {
+        'planner_week': week_start,
+        'planner_days': menu_cache.week(week_start),
+        'planner_weeks': [current, current + timedelta(days=7)]
+    }
+
+def serialize_menu_week(week_start):
+    return {
+        'week': week_start.isoformat(),
+        'days': {
+            day.isoformat(): {
+                category: [{
+                    'id': item.id,
+                    'name': item.name,
+                    'description': item.description,
+                    'icons': item.icons
+                } for item in items]
+                for category, items in categories.items()
+            }
+            for day, categories in menu_cache.week(week_start).items()
+        }
+    }
+
+def parse_menu_lines(text):
+    """Lignes du planning saisies sous la forme 'catégorie ; nom ; description ; icônes'"""
+    rows = []
+    for values in csv.reader((text or '').splitlines(), delimiter=';'):
+        values = [value.strip() for value in values]
+        if any(values):
+            rows.append(dict(zip(('category', 'name', 'description', 'icons'), values)))
+    return rows
+
+@app.route('/admin/menu/week', methods=['GET', 'POST'])
+@login_required
+def menu_week():
+    """Planning des menus d'une semaine : lecture, ou remplacement des jours transmis"""
+    payload = request.get_json(silent=True) if request.is_json else None
+    week_value = payload.get('week') if isinstance(payload, dict) else request.values.get('week')
+    week_start = parse_menu_week(week_value)
+    if week_start is None:
+        return jsonify({'error': 'Semaine invalide'}), 400
+    if request.method == 'GET':
+        return jsonify(serialize_menu_week(week_start))
+
+    if payload is not None:
+        submitted = payload.get('days') or {}
+    else:
+        submitted = {key[4:]: parse_menu_lines(value) for key, value in request.form.items() if key.startswith('day-')}
+
+    week_days = {week_start + timedelta(days=offset) for offset in range(7)}
+    validate = RowValidator('menu')
+    days, errors = {}, []
+    for day_value, rows in submitted.items():
+        try:
+            day = date.fromisoformat(day_value)
+        except ValueError:
+            day = None
+        if day not in week_days:
+            errors.append(f"{day_value} : jour hors de la semaine du {week_start.strftime('%d/%m/%Y')}")
+            continue
+        days[day] = []
+        for position, row in enumerate(rows or [], start=1):
+            icons = row.get('icons') or ''
+            row = dict(row, date=day.isoformat(), icons=''.join(icons) if isinstance(icons, list) else icons)
+            values, error = validate(row)
+            if error:
+                errors.append(f"{day.strftime('%d/%m')} plat {position} : {error}")
+            else:
+                days[day].append(values)
+
+    if not errors and days:
+        MenuItem.replace_days(days)
+        DataVersion.mark_changed('menu')
+        db.session.commit()
+    if payload is not None:
+        if errors:
+            return jsonify({'errors': errors}), 400
+        return jsonify(serialize_menu_week(week_start))
+    if errors:
+        for error in errors[:10]:
+            flash(error, 'error')
+    else:
+        flash(f"Menus de la semaine du {week_start.strftime('%d/%m/%Y')} enregistrés", 'success')
+    return redirect(url_for('admin_dashboard', menu_week=week_start.isoformat()))
+
 def handle_absence_deletion(request, forms, configs):
     absence_id = request.form.get('delete_absence')
     absence = Absence.query.get(absence_id)
     if absence:
         db.session.delete(absence)
+        DataVersion.mark_changed('absences')
         db.session.commit()
         flash('Absence supprimée avec succès', 'success')
     return redirect(url_for('admin_dashboard'))
 
 def handle_absence_update(request, forms, configs):
     if forms['absence_form'].validate_on_submit():
-        professeur = forms['absence_form'].professeur.data
-        jours = request.form.getlist('jours')
-        absence = Absence.query.filter_by(professeur=professeur).first()
+        professeur = forms['absence_form'].professeur.data.strip()
+        date_debut = forms['absence_form'].date_debut.data
+        absence = Absence.query.filter_by(professeur=professeur, date_debut=date_debut).first()
         if not absence:
-            absence = Absence(professeur=professeur)
+            absence = Absence(professeur=professeur, date_debut=date_debut)
             db.session.add(absence)
             flash(f'Nouvelle absence ajoutée pour {professeur}', 'success')
         else:
             flash(f'Absence mise à jour pour {professeur}', 'info')
-        absence.lundi = 'lundi' in jours
-        absence.mardi = 'mardi' in jours
-        absence.mercredi = 'mercredi' in jours
-        absence.jeudi = 'jeudi' in jours
-        absence.vendredi = 'vendredi' in jours
+        absence.date_fin = forms['absence_form'].date_fin.data
+        DataVersion.mark_changed('absences')
         db.session.commit()
     return redirect(url_for('admin_dashboard'))
 
@@ -358,9 +811,11 @@ def handle_weather_config(request, forms, configs):
         weather_config.api_key = forms['weather_form'].api_key.data
         weather_config.city = forms['weather_form'].city.data
         weather_config.show_weather = forms['weather_form'].show_weather.data
+        DataVersion.mark_changed('config')
         db.session.commit()
         app.config['WEATHER_API_KEY'] = weather_config.api_key
         app.config['WEATHER_CITY'] = weather_config.city
+        refresher.trigger('weather')
         flash('Configuration météo mise à jour', 'success')
     return redirect(url_for('admin_dashboard'))
 
@@ -384,6 +839,7 @@ def handle_event_creation(request, forms, configs):
             description=forms['event_form'].description.data
         )
         db.session.add(evt)
+        DataVersion.mark_changed('events')
         db.session.commit()
         flash('Événement ajouté', 'success')
     return redirect(url_for('admin_dashboard'))
@@ -393,6 +849,7 @@ def handle_event_deletion(request, forms, configs):
     evt = Event.query.get(event_id)
     if evt:
         db.session.delete(evt)
+        DataVersion.mark_changed('events')
         db.session.commit()
         flash('Événement supprimé', 'warning')
     return redirect(url_for('admin_dashboard'))
@@ -401,6 +858,7 @@ def handle_site_config(request, forms, configs):
     if forms['site_form'].validate_on_submit():
         site_config = configs['site']
         site_config.site_name = forms['site_form'].site_name.data
+        DataVersion.mark_changed('config')
         db.session.commit()
         flash('Nom de l\'établissement mis à jour', 'success')
     return redirect(url_for('admin_dashboard'))
@@ -415,6 +873,7 @@ def handle_menu_item_creation(request, forms, configs):
             date=forms['menu_form'].date.data
         )
         db.session.add(menu_item)
+        DataVersion.mark_changed('menu')
         db.session.commit()
         flash('Plat ajouté au menu', 'success')
     return redirect(url_for('admin_dashboard'))
@@ -424,76 +883,197 @@ def handle_menu_item_deletion(request, forms, configs):
     menu_item = MenuItem.query.get(item_id)
     if menu_item:
         db.session.delete(menu_item)
+        DataVersion.mark_changed('menu')
         db.session.commit()
         flash('Plat supprimé du menu', 'success')
     return redirect(url_for('admin_dashboard'))
 
+def handle_bulk_import(request, forms, configs):
+    form = forms['import_form']
+    if form.validate_on_submit():
+        upload = form.file.data
+        try:
+            report = import_file(form.kind.data, upload.stream, upload.filename or '',
+                                 app.config['IMPORT_BATCH_SIZE'], app.config['IMPORT_MAX_ERRORS'])
+        except (ValueError, UnicodeDecodeError) as e:
+            flash(f"Import impossible : {e}", 'error')
+            return redirect(url_for('admin_dashboard'))
+        flash(report.summary(), 'success' if not report.failed else 'warning')
+        for line, message in report.errors[:10]:
+            flash(f"Ligne {line} : {message}", 'error')
+    else:
+        for errors in form.errors.values():
+            flash(', '.join(errors), 'error')
+    return redirect(url_for('admin_dashboard'))
+
+def display_etag(versions):
+    """Identifie l'état affiché : version des données, jour courant et contenu des transports"""
+    return f"{versions[DataVersion.GLOBAL]}.{date.today().isoformat()}.{transport_version()}"
+
+def transport_version():
+    """Empreinte des passages affichés, et non l'heure du dernier appel CTS propre à chaque worker :
+    tous les workers donnent le même ETag (et le même identifiant d'événement SSE) pour le même contenu"""
+    return current_cts_boards(config_cache.get().widget)[1]
+
+def parse_display_etag(value):
+    try:
+        version, day, transport = value.split('.')
+        return int(version), day, int(transport)
+    except (AttributeError, ValueError):
+        return None
+
+def build_display_delta(widget_config, versions, previous):
+    """Rend uniquement les sections de l'accueil modifiées depuis l'état `previous`"""
+    since, day, transport = previous
+    delta = {'version': display_etag(versions), 'reload': False, 'sections': {}}
+    changed = DataVersion.changed_since(versions, since)
+    # Changement de jour ou de configuration : la mise en page elle-même change
+    if day != date.today().isoformat() or since > versions[DataVersion.GLOBAL] or 'config' in changed:
+        delta['reload'] = True
+        return delta
+
+    sections = delta['sections']
+    if 'absences' in changed:
+        sections['absences'] = render_template('partials/absences.html', absences_by_day=get_week_absences_by_day())
+    if widget_config.show_menu_cantine:
+        if 'menu' in changed:
+            sections['menu'] = render_template('partials/menu.html', menu_items=menu_cache.day())
+        if 'events' in changed:
+            sections['events'] = render_template('partials/events.html', events=Event.get_upcoming_events())
+    if widget_config.has_valid_transport_config() and transport != transport_version():
+        sections['transport'] = render_template(
+            'partials/transport.html',
+            config=widget_config,
+            cts_boards=get_cts_boards(widget_config)
+        )
+    return delta
+
 @app.route('/get_updates')
+@read_only
 def get_updates():
     try:
-        widget_config = WidgetConfig.query.first()
-        if not widget_config:
-            widget_config = WidgetConfig()
-            db.session.add(widget_config)
-            db.session.commit()
-        config_data = {
-            'show_menu_cantine': widget_config.show_menu_cantine
-        }
-        absences = [{
-            'professeur': a.professeur,
-            'lundi': a.lundi,
-            'mardi': a.mardi,
-            'mercredi': a.mercredi,
-            'jeudi': a.jeudi,
-            'vendredi': a.vendredi
-        } for a in Absence.query.all()]
-        events = [{
-            'title': e.title,
-            'date': e.date.strftime('%d/%m/%Y'),
-            'description': e.description
-        } for e in Event.get_upcoming_events()]
-        return jsonify({
-            'absences': absences,
-            'events': events,
-            'widget_config': config_data
-        })
+        widget_config = config_cache.get().widget
+        versions = DataVersion.get_versions()
+        etag = display_etag(versions)
+        if request.if_none_match.contains(etag):
+            response = app.response_class(status=304)
+        else:
+            previous = parse_display_etag(next(iter(request.if_none_match.as_set()), None))
+            if previous:
+                response = jsonify(build_display_delta(widget_config, versions, previous))
+            else:
+                response = jsonify(build_full_update(widget_config))
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
     except Exception as e:
         logger.error(f'Error in get_updates: {str(e)}')
         return jsonify({'error': str(e)}), 500
 
+def build_full_update(widget_config):
+    config_data = {
+        'show_menu_cantine': widget_config.show_menu_cantine
+    }
+    week_start = Absence.week_start()
+    absences = {
+        'week': week_start.isoformat(),
+        'days': Absence.group_by_day(Absence.get_week_absences(week_start), week_start)
+    }
+    events = [{
+        'title': e.title,
+        'date': e.date.strftime('%d/%m/%Y'),
+        'description': e.description
+    } for e in Event.get_upcoming_events()]
+    return {
+        'absences': absences,
+        'events': events,
+        'widget_config': config_data
+    }
+
+def refresh_display_version():
+    """Tâche de fond : détecte les changements de l'affichage (y compris venant d'autres workers)"""
+    etag = display_etag(DataVersion.get_versions())
+    broadcaster.publish(etag)
+    return etag
+
+refresher.add_job('display', app.config['STREAM_POLL_INTERVAL'], refresh_display_version)
+
+@app.route('/stream')
+@read_only
+def stream():
+    subscriber = broadcaster.subscribe()
+    if subscriber is None:
+        logger.warning('Connexion SSE refusée : nombre maximal atteint')
+        return jsonify({'error': 'Trop de connexions'}), 503, {'Retry-After': '30'}
+
+    # Reprise : le client annonce la dernière version reçue (en-tête standard ou paramètre initial)
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    current = display_etag(DataVersion.get_versions())
+    heartbeat = app.config['STREAM_HEARTBEAT']
+
+    def generate():
+        try:
+            yield f"retry: {app.config['STREAM_RETRY_MS']}\n\n"
+            if last_event_id != current:
+                yield format_event(current)
+            while True:
+                try:
+                    event_id = subscriber.get(timeout=heartbeat)
+                except queue.Empty:
+                    yield ": heartbeat\n\n"
+                    continue
+                yield format_event(event_id)
+        finally:
+            broadcaster.unsubscribe(subscriber)
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
 @app.route('/get_weather')
+@read_only
 def get_weather():
     try:
-        weather_config = WeatherConfig.get_config()
+        weather_config = config_cache.get().weather
         if not weather_config.show_weather:
             return jsonify({'error': 'Météo désactivée'}), 200
 
-        response = requests.get(
-            "https://api.openweathermap.org/data/2.5/weather",
-            params={
-                "q": weather_config.city,
-                "appid": weather_config.api_key,
-                "units": "metric",
-                "lang": "fr"
-            }
-        )
-
-        if response.status_code == 200:
-            data = response.json()
-            description = data['weather'][0]['description']
-            description = description[:1].upper() + description[1:]
+        payload = weather_cache.get(weather_config.city, weather_config.api_key)
+        if payload is None:
+            refresher.trigger('weather')
+            return jsonify({'error': 'Données météo non disponibles'}), 503
 
-            return jsonify({
-                'temp': round(data['main']['temp']),
-                'description': description,
-                'icon': data['weather'][0]['icon']
-            })
-        
-        return jsonify({'error': 'Données météo non disponibles'}), 500
+        return jsonify(payload)
     except Exception as e:
         logger.error(f'Erreur météo: {e}')
         return jsonify({'error': str(e)}), 500
 
+@app.route('/get_transport')
+@read_only
+def get_transport():
+    """Tableaux de départs du widget transports, en JSON"""
+    try:
+        widget_config = config_cache.get().widget
+        if not widget_config.has_valid_transport_config():
+            return jsonify({'error': 'Transports désactivés'}), 200
+
+        response = jsonify({
+            'stale': cts_realtime_is_stale(),
+            'boards': [{
+                'code': board['code'],
+                'name': board['name'],
+                'scheduled': board.get('scheduled', False),
+                'departures': [departure.as_dict() for departure in board['departures']]
+            } for board in get_cts_boards(widget_config)]
+        })
+        response.add_etag()
+        response.headers['Cache-Control'] = 'no-cache'
+        return response.make_conditional(request)
+    except Exception as e:
+        logger.error(f'Erreur transports: {e}')
+        return jsonify({'error': str(e)}), 500
+
 def get_weather_description(weather_code):
     weather_codes = {
         0: "Soleil",
@@ -536,6 +1116,7 @@ if __name__ == '__main__':
     try:
         with app.app_context():
             initialize_database()
+        metrics.clear_directory()
             
         try:
             app.run(debug=False, use_reloader=False)
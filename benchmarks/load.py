@@ -0,0 +1,362 @@
+"""Banc de charge reproductible : écrans d'affichage et administrateur sur une base peuplée.
+
+    python benchmarks/load.py [--screens 40] [--duration 60] [--speedup 10] [--workers 2]
+                              [--baseline benchmarks/baseline.json] [--save-baseline]
+
+L'application est servie par Gunicorn (gunicorn.conf.py) sur une base temporaire
+peuplée de volumes réalistes, avec des API CTS/OpenWeather simulées en local
+(upstream_standin.py). Chaque écran charge /, puis interroge /get_updates (ETag)
+toutes les 15 s et /get_weather toutes les 60 s, comme base.html en mode sondage ;
+un administrateur ouvre le tableau de bord et ses listes, puis enregistre une
+modification (rechargement de la seule liste touchée) toutes les 20 s. --speedup divise
+ces intervalles pour comprimer une longue période d'affichage.
+
+Débit et latences p50/p95/p99 sont rapportés par route et comparés à la référence
+enregistrée : le code de sortie vaut 1 en cas de régression.
+"""
+import argparse
+import json
+import os
+import random
+import re
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+sys.path.insert(0, ROOT)
+import upstream_standin  # noqa: E402
+
+# Intervalles réels des écrans (base.html) et de l'administrateur, en secondes
+POLL_INTERVAL = 15
+WEATHER_INTERVAL = 60
+ADMIN_INTERVAL = 20
+ADMIN_SECTIONS = ('absences', 'events', 'menu')
+
+CSRF_TOKEN = re.compile(r'name="csrf_token" type="hidden" value="([^"]+)"')
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def seed_database(args):
+    """Peuple la base avec des volumes réalistes (données déterministes, dates relatives à aujourd'hui)"""
+    from app import app, initialize_database
+    from extensions import db
+    from models import Absence, Event, MenuItem, WidgetConfig, WeatherConfig, DataVersion
+
+    initialize_database()
+    rng = random.Random(args.seed)
+    today = date.today()
+    with app.app_context():
+        widget = WidgetConfig.get_config()
+        widget.show_menu_cantine = True
+        widget.show_transports = True
+        widget.cts_stop_code = '103'
+        widget.cts_api_token = 'bench'
+        widget.cts_stop_display = 'Lycée'
+        weather = WeatherConfig.get_config()
+        weather.show_weather = True
+        weather.city = 'Strasbourg'
+
+        teachers = [f"Professeur {index:03d}" for index in range(120)]
+        absences = set()
+        while len(absences) < args.absences:
+            absences.add((rng.choice(teachers), today + timedelta(days=rng.randint(-3, 180))))
+        for teacher, start in sorted(absences):
+            db.session.add(Absence(professeur=teacher, date_debut=start,
+                                   date_fin=start + timedelta(days=rng.choice((0, 0, 0, 1, 2, 4)))))
+        for index in range(args.events):
+            db.session.add(Event(title=f"Événement {index}", date=today + timedelta(days=rng.randint(-180, 365)),
+                                 description=f"Description de l'événement {index}" * rng.randint(1, 4)))
+        categories = [category for category, _, _ in MenuItem.get_menu_categories()]
+        icons = [icon for icon, _ in MenuItem.get_icons()]
+        for offset in range(-args.menu_days // 2, args.menu_days // 2):
+            day = today + timedelta(days=offset)
+            if day.weekday() == 6:
+                continue
+            for order, category in enumerate(categories + rng.sample(categories, 1)):
+                db.session.add(MenuItem(date=day, category=category, order=order,
+                                        name=f"{category.capitalize()} {offset}",
+                                        description='Produit local',
+                                        icons=''.join(rng.sample(icons, rng.randint(0, 2)))))
+        DataVersion.mark_changed('absences', 'events', 'menu', 'config')
+        db.session.commit()
+        counts = {'absences': Absence.query.count(), 'events': Event.query.count(),
+                  'menu_items': MenuItem.query.count()}
+        db.engine.dispose()
+    return counts
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def record(self, route, elapsed, ok):
+        with self._lock:
+            self.samples.setdefault(route, []).append(elapsed)
+            if not ok:
+                self.errors[route] = self.errors.get(route, 0) + 1
+
+    def timed(self, route, func, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = func(*args, **kwargs)
+        except requests.RequestException:
+            self.record(route, time.perf_counter() - start, False)
+            return None
+        self.record(route, time.perf_counter() - start, response.status_code < 500)
+        return response
+
+    def report(self, duration):
+        routes = {}
+        for route, latencies in sorted(self.samples.items()):
+            routes[route] = {
+                'count': len(latencies),
+                'per_second': round(len(latencies) / duration, 2),
+                'errors': self.errors.get(route, 0),
+                'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+                'p95_ms': round(percentile(latencies, 95) * 1000, 1),
+                'p99_ms': round(percentile(latencies, 99) * 1000, 1),
+            }
+        return routes
+
+
+class AdminSession(requests.Session):
+    """SESSION_COOKIE_SECURE : le cookie de session est renvoyé malgré le HTTP local"""
+
+    def send(self, request, **kwargs):
+        response = super().send(request, **kwargs)
+        for cookie in self.cookies:
+            cookie.secure = False
+        return response
+
+
+def screen(base_url, recorder, stop, interval_scale, ramp, rng):
+    session = requests.Session()
+    # Les écrans s'allument progressivement, pas tous à la même seconde
+    stop.wait(rng.uniform(0, ramp))
+    recorder.timed('GET /', session.get, base_url + '/')
+    etag = None
+    next_poll = next_weather = time.monotonic()
+    while not stop.is_set():
+        now = time.monotonic()
+        if now >= next_poll:
+            headers = {'If-None-Match': etag} if etag else {}
+            response = recorder.timed('GET /get_updates', session.get, base_url + '/get_updates', headers=headers)
+            if response is not None and response.status_code == 200:
+                if etag and response.json().get('reload'):
+                    recorder.timed('GET /', session.get, base_url + '/')
+                etag = response.headers.get('ETag', etag)
+            next_poll = now + POLL_INTERVAL * interval_scale
+        if now >= next_weather:
+            recorder.timed('GET /get_weather', session.get, base_url + '/get_weather')
+            next_weather = now + WEATHER_INTERVAL * interval_scale
+        stop.wait(max(0.0, min(next_poll, next_weather) - time.monotonic()))
+
+
+def admin(base_url, recorder, stop, interval_scale, rng):
+    session = AdminSession()
+    token = CSRF_TOKEN.search(session.get(base_url + '/login').text).group(1)
+    session.post(base_url + '/login', data={'csrf_token': token, 'identifiant': 'admin', 'password': 'admin123'},
+                 allow_redirects=False)
+    n = 0
+    while not stop.wait(ADMIN_INTERVAL * interval_scale):
+        response = recorder.timed('GET /admin-dashboard', session.get, base_url + '/admin-dashboard')
+        match = response is not None and CSRF_TOKEN.search(response.text)
+        if not match:
+            continue
+        # Le tableau de bord charge ensuite la première page de chaque liste
+        for section in ADMIN_SECTIONS:
+            recorder.timed('GET /admin/sections', session.get, f"{base_url}/admin/sections/{section}")
+        day = date.today() + timedelta(days=rng.randint(0, 20))
+        if n % 2:
+            data = {'submit_event': '1', 'title': f"Réunion {n}", 'date': day.isoformat(), 'description': 'Salle 12'}
+        else:
+            data = {'submit_absence': '1', 'professeur': f"Professeur {rng.randint(0, 119):03d}",
+                    'date_debut': day.isoformat(), 'date_fin': day.isoformat()}
+        data['csrf_token'] = match.group(1)
+        response = recorder.timed('POST /admin-dashboard', session.post, base_url + '/admin-dashboard',
+                                  data=data, headers={'Accept': 'application/json'})
+        if response is not None and response.ok:
+            recorder.timed('GET /admin/sections', session.get,
+                           f"{base_url}/admin/sections/{response.json()['section']}")
+        n += 1
+
+
+def wait_ready(base_url, process, log_path, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"Gunicorn s'est arrêté au démarrage (voir {log_path})")
+        try:
+            requests.get(base_url + '/get_updates', timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.2)
+    raise SystemExit("Gunicorn n'a pas répondu à temps")
+
+
+# Nombre minimal d'échantillons pour qu'un percentile soit comparé (sinon il ne reflète que quelques valeurs)
+MIN_SAMPLES = {'p50_ms': 10, 'p95_ms': 40, 'p99_ms': 200}
+
+
+def compare(report, baseline, tolerance, floor_ms):
+    """Liste des régressions : latence au-delà de la tolérance (et d'un écart minimal), nouvelles erreurs"""
+    regressions = []
+    for route, current in report['routes'].items():
+        reference = baseline['routes'].get(route)
+        if reference is None:
+            continue
+        for key, min_samples in MIN_SAMPLES.items():
+            if min(current['count'], reference['count']) < min_samples:
+                continue
+            limit = max(reference[key] * (1 + tolerance), reference[key] + floor_ms)
+            if current[key] > limit:
+                regressions.append(f"{route} {key} : {current[key]} ms (référence {reference[key]} ms)")
+        if current['errors'] > reference['errors']:
+            regressions.append(f"{route} erreurs : {current['errors']} (référence {reference['errors']})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--screens', type=int, default=40)
+    parser.add_argument('--duration', type=float, default=60)
+    parser.add_argument('--speedup', type=float, default=10, help="facteur de compression des intervalles réels")
+    parser.add_argument('--ramp', type=float, default=10, help="durée d'allumage des écrans (s)")
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--upstream-latency', type=float, default=0.05)
+    parser.add_argument('--events', type=int, default=3000)
+    parser.add_argument('--absences', type=int, default=3000)
+    parser.add_argument('--menu-days', type=int, default=400)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help="enregistre ce résultat comme référence")
+    parser.add_argument('--tolerance', type=float, default=0.5, help="hausse de latence tolérée (0.5 = +50 %%)")
+    parser.add_argument('--floor-ms', type=float, default=25, help="écart minimal signalé (ms)")
+    parser.add_argument('--output', help="écrit le rapport JSON dans ce fichier")
+    args = parser.parse_args()
+    args.baseline = os.path.abspath(args.baseline)
+    args.output = args.output and os.path.abspath(args.output)
+
+    workdir = tempfile.mkdtemp(prefix='educinfo-load-')
+    os.chdir(workdir)
+    stub, stub_url, standin = upstream_standin.start(
+        settings=upstream_standin.StandinSettings(latency=args.upstream_latency))
+    port = free_port()
+    os.environ.update({
+        'DATABASE_URL': f"sqlite:///{os.path.join(workdir, 'load.db')}",
+        'SNAPSHOT_DIR': os.path.join(workdir, 'snapshots'),
+        'METRICS_DIR': os.path.join(workdir, 'metrics'),
+        'PROFILE_DIR': os.path.join(workdir, 'profiles'),
+        'CTS_TIMETABLE_PATH': os.path.join(workdir, 'cts_timetable.bin'),
+        'REFRESH_OWNER_LOCK': os.path.join(workdir, 'refresher.lock'),
+        'CTS_BASE_URL': stub_url,
+        'WEATHER_API_URL': f"{stub_url}/data/2.5/weather",
+        'WEB_BIND': f"127.0.0.1:{port}",
+        'WEB_WORKERS': str(args.workers),
+        'WEB_THREADS': str(args.threads),
+        'WEB_ACCESS_LOG': '',
+    })
+    counts = seed_database(args)
+    print(f"Base : {counts['absences']} absences, {counts['events']} événements, {counts['menu_items']} plats")
+
+    log_path = os.path.join(workdir, 'gunicorn.log')
+    with open(log_path, 'w') as log:
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '--config', os.path.join(ROOT, 'gunicorn.conf.py'),
+             '--pythonpath', ROOT, 'app:app'],
+            stdout=log, stderr=subprocess.STDOUT
+        )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        wait_ready(base_url, server, log_path)
+        recorder = Recorder()
+        stop = threading.Event()
+        interval_scale = 1 / args.speedup
+        rng = random.Random(args.seed)
+        threads = [threading.Thread(target=screen, args=(base_url, recorder, stop, interval_scale, args.ramp,
+                                                         random.Random(rng.random())))
+                   for _ in range(args.screens)]
+        threads.append(threading.Thread(target=admin, args=(base_url, recorder, stop, interval_scale,
+                                                            random.Random(rng.random()))))
+        print(f"{args.screens} écrans, 1 administrateur, {args.duration:.0f} s (intervalles ÷ {args.speedup:g}), "
+              f"{args.workers} workers × {args.threads} threads\n")
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        time.sleep(args.duration)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        duration = time.perf_counter() - started
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=30)
+        stub.shutdown()
+
+    report = {
+        'parameters': {name: getattr(args, name) for name in
+                       ('screens', 'duration', 'speedup', 'ramp', 'workers', 'threads', 'upstream_latency',
+                        'events', 'absences', 'menu_days', 'seed')},
+        'routes': recorder.report(duration),
+        'upstream_calls': standin.stats()['calls'],
+    }
+
+    print(f"{'route':<24} {'req/s':>7} {'p50':>9} {'p95':>9} {'p99':>9} {'erreurs':>8}")
+    for route, stats in report['routes'].items():
+        print(f"{route:<24} {stats['per_second']:>7} {stats['p50_ms']:>6} ms {stats['p95_ms']:>6} ms "
+              f"{stats['p99_ms']:>6} ms {stats['errors']:>8}")
+    print(f"\nAppels aux API simulées : {report['upstream_calls']}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+            f.write('\n')
+        print(f"Référence enregistrée dans {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print("Aucune référence : relancer avec --save-baseline pour en enregistrer une")
+        return
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)
+    if baseline['parameters'] != report['parameters']:
+        print("Attention : paramètres différents de ceux de la référence, comparaison indicative")
+    regressions = compare(report, baseline, args.tolerance, args.floor_ms)
+    if regressions:
+        print("\nRégressions par rapport à la référence :")
+        for line in regressions:
+            print(f"  - {line}")
+        sys.exit(1)
+    print("\nAucune régression par rapport à la référence")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+"""Débit de l'affichage pendant des écritures d'administration, avec et sans le profil SQLite.
+
+    python benchmarks/sqlite_concurrency.py [--readers 8] [--writers 2] [--duration 10]
+
+Chaque mode est mesuré dans un processus séparé, sur une base temporaire.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def run_mode(args):
+    """Processus enfant : configure l'application puis mesure lectures et écritures concurrentes"""
+    workdir = tempfile.mkdtemp(prefix='educinfo-bench-')
+    os.chdir(workdir)
+    os.environ.update({
+        'DATABASE_URL': f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        'REFRESH_ENABLED': '0',
+        'HOME_CACHE_ENABLED': '0',
+        'SNAPSHOT_DIR': os.path.join(workdir, 'snapshots'),
+    })
+    sys.path.insert(0, ROOT)
+    from datetime import date, timedelta
+    from app import app, initialize_database
+    from extensions import db
+    from models import Event, MenuItem, WidgetConfig, WeatherConfig, DataVersion
+
+    app.config['WTF_CSRF_ENABLED'] = False
+    initialize_database()
+    with app.app_context():
+        widget = WidgetConfig.get_config()
+        widget.show_menu_cantine = True
+        # Aucun appel réseau pendant la mesure
+        WeatherConfig.get_config().show_weather = False
+        for offset in range(30):
+            db.session.add(Event(title=f"Événement {offset}", date=date.today() + timedelta(days=offset)))
+            db.session.add(MenuItem(category='plat', name=f"Plat {offset}", date=date.today()))
+        DataVersion.mark_changed('events', 'menu', 'config')
+        db.session.commit()
+
+    stop = threading.Event()
+    results = {'read': [], 'write': [], 'errors': 0}
+    lock = threading.Lock()
+
+    def reader():
+        client = app.test_client()
+        paths = ['/get_updates', '/']
+        n = 0
+        while not stop.is_set():
+            start = time.perf_counter()
+            response = client.get(paths[n % 2])
+            elapsed = time.perf_counter() - start
+            with lock:
+                results['read'].append(elapsed)
+                results['errors'] += response.status_code >= 500
+            n += 1
+
+    def writer(index):
+        client = app.test_client()
+        client.post('/login', data={'identifiant': 'admin', 'password': 'admin123'})
+        n = 0
+        while not stop.is_set():
+            day = date.today() + timedelta(days=n % 5)
+            start = time.perf_counter()
+            response = client.post('/admin-dashboard', data={
+                'submit_absence': '1',
+                'professeur': f"Professeur {index}-{n % 50}",
+                'date_debut': day.isoformat(),
+                'date_fin': day.isoformat(),
+            })
+            elapsed = time.perf_counter() - start
+            with lock:
+                results['write'].append(elapsed)
+                results['errors'] += response.status_code >= 500
+            n += 1
+
+    threads = [threading.Thread(target=reader) for _ in range(args.readers)]
+    threads += [threading.Thread(target=writer, args=(i,)) for i in range(args.writers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(args.duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    report = {'errors': results['errors']}
+    for kind in ('read', 'write'):
+        latencies = results[kind]
+        report[kind] = {
+            'count': len(latencies),
+            'per_second': round(len(latencies) / args.duration, 1),
+            'p50_ms': round(percentile(latencies, 50) * 1000, 1) if latencies else None,
+            'p95_ms': round(percentile(latencies, 95) * 1000, 1) if latencies else None,
+            'max_ms': round(max(latencies) * 1000, 1) if latencies else None,
+        }
+    print(json.dumps(report))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_mode(args)
+        return
+
+    print(f"{args.readers} lecteurs, {args.writers} écrivains, {args.duration:.0f} s par mode\n")
+    print(f"{'mode':<12} {'lect./s':>8} {'p95 lect.':>10} {'écr./s':>8} {'p95 écr.':>10} {'max écr.':>10} {'erreurs':>8}")
+    for name, enabled in (('défaut', '0'), ('performance', '1')):
+        env = dict(os.environ, SQLITE_PERFORMANCE_MODE=enabled)
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--child',
+             '--readers', str(args.readers), '--writers', str(args.writers), '--duration', str(args.duration)],
+            env=env, capture_output=True, text=True, check=True
+        ).stdout
+        report = json.loads(output.strip().splitlines()[-1])
+        read, write = report['read'], report['write']
+        print(f"{name:<12} {read['per_second']:>8} {read['p95_ms']:>8} ms {write['per_second']:>8} "
+              f"{write['p95_ms']:>8} ms {write['max_ms']:>8} ms {report['errors']:>8}")
+
+
+if __name__ == '__main__':
+    main()
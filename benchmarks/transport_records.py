@@ -0,0 +1,146 @@
+"""Mémoire et temps de rendu des passages CTS : dictionnaires SIRI complets contre passages projetés.
+
+    python benchmarks/transport_records.py [--stops 20] [--visits 10] [--renders 2000] [--json]
+
+Les réponses stop-monitoring sont produites par upstream_standin.py (sans réseau).
+Pour chaque arrêt, on mesure la mémoire retenue par l'entrée de cache (tracemalloc)
+et le temps de rendu du widget transports : gabarit précédent (clés SIRI imbriquées)
+contre partials/transport.html alimenté par des Departure.
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+from urllib.parse import parse_qs
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from jinja2 import Environment, FileSystemLoader  # noqa: E402
+import upstream_standin  # noqa: E402
+from cts import project_visit  # noqa: E402
+
+# Widget tel qu'il était avant la projection (parcours des clés SIRI de chaque passage)
+SIRI_TEMPLATE = """
+{% if cts_arrivals is none %}
+    <div class="text-center py-8">
+        <span class="text-6xl block mb-4">⏳</span>
+        <p class="text-xl text-gray-600">Horaires en cours de chargement</p>
+    </div>
+{% elif cts_arrivals %}
+    <div class="grid gap-4">
+        {% for visit in cts_arrivals[:6] %}
+            {% set journey = visit.MonitoredVehicleJourney %}
+            <div class="transform hover:scale-[1.02] transition-all duration-200">
+                <div class="bg-blue-50/50 backdrop-blur rounded-xl p-4 shadow-sm hover:shadow-md">
+                    <div class="flex items-center justify-between">
+                        <div class="space-y-1">
+                            <div class="text-2xl font-bold text-blue-800">
+                                {% if journey.VehicleMode == 'bus' %}🚌{% else %}🚊{% endif %}
+                                {{ journey.PublishedLineName }}
+                            </div>
+                            <div class="text-blue-600">
+                                → {{ journey.DestinationName if journey.DestinationName is string else journey.DestinationName|join(', ') }}
+                            </div>
+                        </div>
+                        <div class="arrival-time text-3xl font-bold text-blue-600"
+                            data-time="{{ journey.MonitoredCall.ExpectedArrivalTime }}">
+                        </div>
+                    </div>
+                </div>
+            </div>
+        {% endfor %}
+    </div>
+{% else %}
+    <div class="text-center py-8">
+        <span class="text-6xl block mb-4">🚏</span>
+        <p class="text-xl text-gray-600">Pas de passage prévu</p>
+    </div>
+{% endif %}
+"""
+
+
+def stop_monitoring(standin, stop_code, visits):
+    status, _, payload = standin.handle(
+        '/v1/siri/2.0/stop-monitoring',
+        parse_qs(f"MonitoringRef={stop_code}&PreviewInterval=PT2H&MaximumStopVisits={visits}"),
+        'Basic eDo=')
+    if status != 200:
+        raise RuntimeError(f"stop-monitoring {stop_code} : statut {status}")
+    # Même chemin que l'application : corps JSON reçu puis décodé
+    return json.dumps(payload)
+
+
+def retained(build, bodies):
+    """Octets retenus par les valeurs construites (la réponse décodée est libérée ensuite)"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    values = [build(body) for body in bodies]
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return values, size
+
+
+def per_call(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--stops', type=int, default=20)
+    parser.add_argument('--visits', type=int, default=10)
+    parser.add_argument('--renders', type=int, default=2000)
+    parser.add_argument('--json', action='store_true', help="résultats au format JSON")
+    args = parser.parse_args()
+
+    standin = upstream_standin.Standin(recorded_dir=None)
+    codes = sorted(standin.network.stops)[:args.stops]
+    bodies = [stop_monitoring(standin, code, args.visits) for code in codes]
+
+    def siri_entry(body):
+        return json.loads(body)['ServiceDelivery']['StopMonitoringDelivery'][0]['MonitoredStopVisit']
+
+    def record_entry(body):
+        return [project_visit(visit) for visit in siri_entry(body)]
+
+    siri, siri_bytes = retained(siri_entry, bodies)
+    records, record_bytes = retained(record_entry, bodies)
+    count = sum(len(entry) for entry in records)
+
+    env = Environment(loader=FileSystemLoader(os.path.join(ROOT, 'templates')), autoescape=True)
+    siri_template = env.from_string(SIRI_TEMPLATE)
+    record_template = env.get_template('partials/transport.html')
+    boards = [[{'code': code, 'name': code, 'departures': entry}] for code, entry in zip(codes, records)]
+    renders = max(1, args.renders // len(codes))
+    siri_render = per_call(lambda: [siri_template.render(cts_arrivals=entry) for entry in siri], renders) / len(codes)
+    record_render = per_call(lambda: [record_template.render(cts_boards=board) for board in boards],
+                             renders) / len(codes)
+    projection = per_call(lambda: [record_entry(body) for body in bodies], max(1, renders // 10)) / len(codes)
+
+    results = {
+        'stops': len(codes),
+        'visits': count,
+        'memory_per_stop': {'siri': siri_bytes // len(codes), 'records': record_bytes // len(codes)},
+        'render_ms': {'siri': round(siri_render * 1000, 3), 'records': round(record_render * 1000, 3)},
+        'parse_and_project_ms': round(projection * 1000, 3),
+    }
+    if args.json:
+        print(json.dumps(results, indent=1))
+        return
+    print(f"{results['stops']} arrêts, {count} passages")
+    print(f"{'':<28}{'SIRI':>12}{'Departure':>12}")
+    print(f"{'mémoire par arrêt (octets)':<28}{results['memory_per_stop']['siri']:>12}"
+          f"{results['memory_per_stop']['records']:>12}")
+    print(f"{'rendu par arrêt (ms)':<28}{results['render_ms']['siri']:>12.3f}{results['render_ms']['records']:>12.3f}")
+    print(f"décodage + projection par réponse : {results['parse_and_project_ms']:.3f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+import threading
+import time
+
+
+class _CacheEntry:
+    __slots__ = ('value', 'expires_at')
+
+    def __init__(self, value, expires_at):
+        self.value = value
+        self.expires_at = expires_at
+
+
+class _Flight:
+    """Chargement en cours partagé entre les threads demandant la même clé"""
+    __slots__ = ('event', 'value', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class TTLCache:
+    """Cache mémoire à durée de vie par entrée, avec regroupement des chargements concurrents.
+
+    Le chargeur passé à get_or_load retourne un couple (valeur, ttl en secondes).
+    Un ttl nul ou négatif signifie que la valeur est retournée sans être conservée.
+    """
+
+    def __init__(self, max_entries=256, clock=time.monotonic):
+        self.max_entries = max_entries
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._flights = {}
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.coalesced = 0
+
+    def get(self, key):
+        """Retourne la valeur en cache ou None si elle est absente ou expirée"""
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is None:
+                return None
+            self.hits += 1
+            return entry.value
+
+    def get_or_load(self, key, loader):
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is not None:
+                self.hits += 1
+                return entry.value
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                self.misses += 1
+                flight = self._flights[key] = _Flight()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            value, ttl = loader()
+            flight.value = value
+            if ttl and ttl > 0:
+                self.set(key, value, ttl)
+            return value
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.event.set()
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            if key not in self._entries and len(self._entries) >= self.max_entries:
+                self._evict()
+            self._entries[key] = _CacheEntry(value, self._clock() + ttl)
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'expirations': self.expirations,
+                'coalesced': self.coalesced,
+            }
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at <= self._clock():
+            del self._entries[key]
+            self.expirations += 1
+            return None
+        return entry
+
+    def _evict(self):
+        # Supprime d'abord les entrées expirées, puis la plus proche de l'expiration
+        now = self._clock()
+        expired = [k for k, e in self._entries.items() if e.expires_at <= now]
+        for k in expired:
+            del self._entries[k]
+        self.expirations += len(expired)
+        if len(self._entries) >= self.max_entries:
+            oldest = min(self._entries, key=lambda k: self._entries[k].expires_at)
+            del self._entries[oldest]
@@ -28,10 +28,111 @@ class Config:
     # OpenWeather API configuration
     WEATHER_API_KEY = os.environ.get('WEATHER_API_KEY', '')  # Clé vide par défaut
     WEATHER_CITY = os.environ.get('WEATHER_CITY', 'Paris')
+    WEATHER_API_URL = os.environ.get('WEATHER_API_URL') or 'https://api.openweathermap.org/data/2.5/weather'
+    
+    # Cache météo : revalidation asynchrone après WEATHER_REVALIDATE_AFTER secondes,
+    # données anciennes servies pendant une panne jusqu'à WEATHER_STALE_LIMIT secondes
+    WEATHER_CACHE_SIZE = int(os.environ.get('WEATHER_CACHE_SIZE', 16))
+    WEATHER_REVALIDATE_AFTER = int(os.environ.get('WEATHER_REVALIDATE_AFTER', 300))
+    WEATHER_STALE_LIMIT = int(os.environ.get('WEATHER_STALE_LIMIT', 3 * 3600))
+    WEATHER_CONNECT_TIMEOUT = float(os.environ.get('WEATHER_CONNECT_TIMEOUT', 3))
+    WEATHER_READ_TIMEOUT = float(os.environ.get('WEATHER_READ_TIMEOUT', 5))
     
     # CTS API configuration
     CTS_BASE_URL = os.environ.get('CTS_BASE_URL') or 'https://api.cts-strasbourg.eu'
     CTS_API_TOKEN = os.environ.get('CTS_API_TOKEN', 'default_token')
+    # Catalogue local des arrêts et lignes (recherche dans l'administration) : âge maximal avant rechargement
+    CTS_CATALOGUE_MAX_AGE = int(os.environ.get('CTS_CATALOGUE_MAX_AGE', 86400))
+    # Horaires théoriques (relevés sur le temps réel) affichés quand les passages temps réel ont plus de
+    # CTS_REALTIME_MAX_AGE secondes ; index compilé toutes les CTS_TIMETABLE_INTERVAL secondes
+    CTS_REALTIME_MAX_AGE = int(os.environ.get('CTS_REALTIME_MAX_AGE', 180))
+    CTS_TIMETABLE_INTERVAL = int(os.environ.get('CTS_TIMETABLE_INTERVAL', 3600))
+    CTS_TIMETABLE_PATH = os.environ.get('CTS_TIMETABLE_PATH') or os.path.join(BASE_DIR, 'instance', 'cts_timetable.bin')
+    
+    # Délai maximal (secondes) avant qu'un worker voie une configuration modifiée par un autre
+    CONFIG_CACHE_CHECK_INTERVAL = float(os.environ.get('CONFIG_CACHE_CHECK_INTERVAL', 1))
+    
+    # Cache du HTML de l'accueil (écrans anonymes), renouvelé au moins toutes les HOME_CACHE_BUCKET secondes
+    HOME_CACHE_ENABLED = os.environ.get('HOME_CACHE_ENABLED', '1') == '1'
+    HOME_CACHE_BUCKET = int(os.environ.get('HOME_CACHE_BUCKET', 60))
+    # Page rendue avec un widget hors délai : conservée moins longtemps
+    HOME_CACHE_DEGRADED_TTL = int(os.environ.get('HOME_CACHE_DEGRADED_TTL', 10))
+    
+    # Échéance globale (secondes) des widgets de l'accueil alimentés par des API externes
+    HOME_DEADLINE = float(os.environ.get('HOME_DEADLINE', 1.5))
+    HOME_FANOUT_WORKERS = int(os.environ.get('HOME_FANOUT_WORKERS', 4))
+    
+    # Profil de performance SQLite (WAL, pragmas, pool de lecture séparé, écritures sérialisées)
+    SQLITE_PERFORMANCE_MODE = os.environ.get('SQLITE_PERFORMANCE_MODE', '0') == '1'
+    SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+    SQLITE_CACHE_SIZE_KB = int(os.environ.get('SQLITE_CACHE_SIZE_KB', 20000))
+    SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+    SQLITE_READ_POOL_SIZE = int(os.environ.get('SQLITE_READ_POOL_SIZE', os.environ.get('WEB_THREADS', 8)))
+    
+    # Client HTTP partagé pour les API externes (pool par hôte, délais en secondes)
+    UPSTREAM_POOL_SIZE = int(os.environ.get('UPSTREAM_POOL_SIZE', os.environ.get('WEB_THREADS', 8)))
+    UPSTREAM_CONNECT_TIMEOUT = float(os.environ.get('UPSTREAM_CONNECT_TIMEOUT', 3))
+    UPSTREAM_READ_TIMEOUT = float(os.environ.get('UPSTREAM_READ_TIMEOUT', 5))
+    UPSTREAM_MAX_RETRIES = int(os.environ.get('UPSTREAM_MAX_RETRIES', 2))
+    UPSTREAM_BACKOFF_BASE = 0.2
+    UPSTREAM_BACKOFF_CAP = 2.0
+    UPSTREAM_RETRY_BUDGET_RATIO = 0.2
+    UPSTREAM_RETRY_BUDGET_MAX = 10
+    
+    # Disjoncteur par endpoint externe : ouvert après N échecs consécutifs, nouvel essai après RECOVERY secondes
+    UPSTREAM_BREAKER_THRESHOLD = int(os.environ.get('UPSTREAM_BREAKER_THRESHOLD', 5))
+    UPSTREAM_BREAKER_RECOVERY = int(os.environ.get('UPSTREAM_BREAKER_RECOVERY', 30))
+    
+    # Dernières données valides des API externes, relues au démarrage
+    SNAPSHOT_DIR = os.environ.get('SNAPSHOT_DIR') or os.path.join(BASE_DIR, 'instance', 'snapshots')
+    
+    # Métriques Prometheus (/metrics) : fichiers par worker, agrégés à la lecture
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') == '1'
+    METRICS_DIR = os.environ.get('METRICS_DIR') or os.path.join(BASE_DIR, 'instance', 'metrics')
+    METRICS_FLUSH_INTERVAL = int(os.environ.get('METRICS_FLUSH_INTERVAL', 5))
+    # Jeton optionnel attendu dans l'en-tête Authorization: Bearer <jeton>
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+    
+    # Profilage : ?profile=1 (ou en-tête X-Profile: 1) pour un administrateur, et capture
+    # automatique (échantillonnage des piles + trace SQL) des requêtes plus lentes que le seuil
+    PROFILER_ENABLED = os.environ.get('PROFILER_ENABLED', '0') == '1'
+    PROFILE_DIR = os.environ.get('PROFILE_DIR') or os.path.join(BASE_DIR, 'instance', 'profiles')
+    PROFILE_SLOW_THRESHOLD = float(os.environ.get('PROFILE_SLOW_THRESHOLD', 1.0))
+    PROFILE_SAMPLE_INTERVAL = float(os.environ.get('PROFILE_SAMPLE_INTERVAL', 0.005))
+    PROFILE_MAX_FILES = int(os.environ.get('PROFILE_MAX_FILES', 50))
+    
+    # Cache des réponses CTS (secondes), ajusté par Cache-Control / ValidUntil / ShortestPossibleCycle
+    CTS_CACHE_DEFAULT_TTL = int(os.environ.get('CTS_CACHE_DEFAULT_TTL', 30))
+    CTS_CACHE_MIN_TTL = int(os.environ.get('CTS_CACHE_MIN_TTL', 10))
+    CTS_CACHE_MAX_TTL = int(os.environ.get('CTS_CACHE_MAX_TTL', 120))
+    
+    # Rafraîchissement en arrière-plan des données externes (secondes)
+    REFRESH_ENABLED = os.environ.get('REFRESH_ENABLED', '1') == '1'
+    REFRESH_CTS_INTERVAL = int(os.environ.get('REFRESH_CTS_INTERVAL', 30))
+    REFRESH_WEATHER_INTERVAL = int(os.environ.get('REFRESH_WEATHER_INTERVAL', 600))
+    REFRESH_STALE_FACTOR = 3
+    # Verrou désignant le seul worker qui exécute les tâches d'écriture partagées (purge, horaires théoriques)
+    REFRESH_OWNER_LOCK = os.environ.get('REFRESH_OWNER_LOCK') or os.path.join(BASE_DIR, 'instance', 'refresher.lock')
+    
+    # Threads par worker Gunicorn (même variable dans gunicorn.conf.py)
+    WEB_THREADS = int(os.environ.get('WEB_THREADS', 8))
+    
+    # Diffusion SSE vers les écrans (/stream) : une connexion occupe un thread de worker pendant toute sa
+    # durée. Plafond par worker, ramené si besoin à WEB_THREADS - STREAM_FREE_THREADS pour que l'accueil,
+    # /get_updates et l'administration gardent des threads ; au-delà, les écrans passent au sondage
+    STREAM_MAX_CONNECTIONS = int(os.environ.get('STREAM_MAX_CONNECTIONS', WEB_THREADS // 2))
+    STREAM_FREE_THREADS = 2
+    STREAM_POLL_INTERVAL = int(os.environ.get('STREAM_POLL_INTERVAL', 2))
+    STREAM_HEARTBEAT = 15
+    STREAM_RETRY_MS = 5000
+    
+    # Import en masse (CSV / iCalendar) : lignes par transaction, erreurs conservées dans le bilan
+    IMPORT_BATCH_SIZE = int(os.environ.get('IMPORT_BATCH_SIZE', 500))
+    IMPORT_MAX_ERRORS = 100
+    
+    # Listes du tableau de bord (absences, événements, plats) : lignes par page
+    ADMIN_PAGE_SIZE = int(os.environ.get('ADMIN_PAGE_SIZE', 30))
+    ADMIN_PAGE_MAX = 200
 
 class DevelopmentConfig(Config):
     DEBUG = True
@@ -0,0 +1,95 @@
+import threading
+import time
+from collections import namedtuple
+from extensions import db
+from models import WidgetConfig, SiteConfig, WeatherConfig, DataVersion
+
+ConfigSnapshot = namedtuple('ConfigSnapshot', 'version widget site weather')
+
+
+class FrozenConfig:
+    """Copie immuable d'une ligne de configuration, utilisable hors session.
+
+    Une ligne jamais enregistrée n'a pas encore ses valeurs par défaut (appliquées à
+    l'insertion) : les valeurs par défaut scalaires des colonnes les remplacent.
+    """
+
+    def __init__(self, row):
+        for column in row.__table__.columns:
+            value = getattr(row, column.name)
+            if value is None and column.default is not None and column.default.is_scalar:
+                value = column.default.arg
+            object.__setattr__(self, column.name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} est en lecture seule")
+
+
+class WidgetSettings(FrozenConfig):
+    get_all_active_widgets = WidgetConfig.get_all_active_widgets
+    transport_stops = WidgetConfig.transport_stops
+    transport_lines = WidgetConfig.transport_lines
+    uses_departure_boards = WidgetConfig.uses_departure_boards
+
+    def __init__(self, row):
+        super().__init__(row)
+        object.__setattr__(self, '_transport_ready', WidgetConfig.has_valid_transport_config(self))
+
+    def has_valid_transport_config(self):
+        return self._transport_ready
+
+
+class ConfigCache:
+    """Instantané en mémoire des configurations à ligne unique (widgets, site, météo).
+
+    L'instantané est rechargé quand la version 'config' change : immédiatement après
+    un commit dans ce processus, et au plus tard check_interval secondes après un
+    commit dans un autre worker (une lecture par clé primaire).
+    """
+
+    def __init__(self, check_interval=1.0):
+        self.check_interval = check_interval
+        self._snapshot = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.loads = 0
+
+    def get(self):
+        snapshot = self._snapshot
+        now = time.monotonic()
+        if snapshot is not None and now - self._checked_at < self.check_interval:
+            return snapshot
+
+        row = db.session.get(DataVersion, 'config')
+        version = row.version if row else 0
+        self._checked_at = now
+        if snapshot is not None and snapshot.version == version:
+            return snapshot
+
+        with self._lock:
+            if self._snapshot is None or self._snapshot.version != version:
+                self._snapshot = self._load(version)
+            return self._snapshot
+
+    def invalidate(self):
+        self._snapshot = None
+
+    def _load(self, version):
+        # Lecture seule (routes @read_only, processeur de contexte) : une ligne absente donne
+        # les valeurs par défaut sans être créée, la création revient à initialize_database
+        self.loads += 1
+        return ConfigSnapshot(
+            version=version,
+            widget=WidgetSettings(WidgetConfig.query.first() or WidgetConfig()),
+            site=FrozenConfig(SiteConfig.query.first() or SiteConfig()),
+            weather=FrozenConfig(WeatherConfig.query.first() or WeatherConfig())
+        )
+
+
+config_cache = ConfigCache()
+
+
+@DataVersion.on_commit
+def _invalidate_config(sections):
+    if 'config' in sections:
+        config_cache.invalidate()
@@ -0,0 +1,377 @@
+import bisect
+import heapq
+import json
+import re
+import time
+import zlib
+from datetime import datetime, timezone
+from collections import namedtuple
+from itertools import islice
+import requests
+from flask import current_app
+from cache import TTLCache
+from http_client import upstream
+from extensions import logger
+from snapshots import snapshot_store
+from stop_catalogue import stop_catalogue
+
+# Cache partagé des réponses stop-monitoring, clé : (arrêt, mode, intervalle, nombre de passages)
+stop_monitoring_cache = TTLCache(max_entries=64)
+# Index des réponses estimated-timetable, clé : (lignes, mode, intervalle)
+estimated_timetable_cache = TTLCache(max_entries=16)
+# Tableaux de repli (horaires théoriques, derniers passages connus), clé : (configuration, minute)
+fallback_boards_cache = TTLCache(max_entries=8)
+
+_ISO_DURATION = re.compile(
+    r'^P(?:(?P<days>\d+)D)?(?:T(?:(?P<hours>\d+)H)?(?:(?P<minutes>\d+)M)?(?:(?P<seconds>\d+(?:\.\d+)?)S)?)?$'
+)
+_FRACTION = re.compile(r'\.(\d+)')
+
+
+def parse_duration(value):
+    """Convertit une durée SIRI (ISO-8601 'PT30S' ou 'hh:mm:ss') en secondes"""
+    if not value:
+        return None
+    value = value.strip()
+    match = _ISO_DURATION.match(value)
+    if match and any(match.groupdict().values()):
+        parts = {k: float(v) for k, v in match.groupdict().items() if v}
+        return (parts.get('days', 0) * 86400 + parts.get('hours', 0) * 3600
+                + parts.get('minutes', 0) * 60 + parts.get('seconds', 0))
+    try:
+        hours, minutes, seconds = value.split(':')
+        return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+    except ValueError:
+        return None
+
+
+def parse_timestamp(value):
+    """Convertit un horodatage SIRI en datetime avec fuseau (les fractions > 6 chiffres sont tronquées)"""
+    if not value:
+        return None
+    value = _FRACTION.sub(lambda m: '.' + m.group(1)[:6].ljust(6, '0'), value.strip())
+    if value.endswith('Z'):
+        value = value[:-1] + '+00:00'
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+def parse_max_age(cache_control):
+    """Retourne max-age (ou s-maxage) de l'en-tête Cache-Control, 0 si no-store/no-cache"""
+    if not cache_control:
+        return None
+    directives = {}
+    for part in cache_control.split(','):
+        name, _, value = part.strip().partition('=')
+        directives[name.lower()] = value.strip('"')
+    if 'no-store' in directives or 'no-cache' in directives:
+        return 0
+    for name in ('s-maxage', 'max-age'):
+        try:
+            return int(directives[name])
+        except (KeyError, ValueError):
+            continue
+    return None
+
+
+def compute_ttl(headers, delivery, config):
+    """Calcule la durée de validité d'une réponse CTS.
+
+    La plus courte des durées annoncées (Cache-Control, ValidUntil) est retenue,
+    sans descendre sous ShortestPossibleCycle, puis bornée par la configuration.
+    """
+    candidates = []
+    max_age = parse_max_age(headers.get('Cache-Control'))
+    if max_age is not None:
+        if max_age == 0:
+            return 0
+        candidates.append(max_age)
+
+    valid_until = parse_timestamp(delivery.get('ValidUntil'))
+    if valid_until is not None:
+        reference = parse_timestamp(delivery.get('ResponseTimestamp')) or datetime.now(timezone.utc)
+        candidates.append((valid_until - reference).total_seconds())
+
+    ttl = min(candidates) if candidates else config['CTS_CACHE_DEFAULT_TTL']
+    cycle = parse_duration(delivery.get('ShortestPossibleCycle'))
+    if cycle:
+        ttl = max(ttl, cycle)
+    return max(config['CTS_CACHE_MIN_TTL'], min(ttl, config['CTS_CACHE_MAX_TTL']))
+
+
+class Departure(namedtuple('Departure', 'line destination mode stop_code trip time iso_time realtime aimed')):
+    """Passage projeté : seuls les champs affichés, horodatages analysés et formatés une seule fois.
+
+    Remplace les dictionnaires SIRI complets dans les caches, les instantanés et les
+    gabarits. time est l'horaire annoncé (temps réel si realtime, sinon théorique),
+    aimed l'horaire théorique quand il est connu : leur écart donne le retard.
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def create(cls, line, destination, mode, stop_code, trip, time, realtime, aimed=None):
+        return cls(line, destination, mode, stop_code, trip, time,
+                   time.isoformat(timespec='seconds') if time else None, realtime, aimed)
+
+    @property
+    def delay(self):
+        """Retard (secondes, négatif si en avance) par rapport à l'horaire théorique, ou None"""
+        if self.time is None or self.aimed is None:
+            return None
+        return int((self.time - self.aimed).total_seconds())
+
+    def as_dict(self):
+        return {
+            'line': self.line,
+            'destination': self.destination,
+            'mode': self.mode,
+            'stop_code': self.stop_code,
+            'trip': self.trip,
+            'time': self.iso_time,
+            'aimed': self.aimed.isoformat(timespec='seconds') if self.aimed else None,
+            'delay': self.delay,
+            'realtime': self.realtime,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        if 'MonitoredVehicleJourney' in data:
+            # Instantané enregistré avant la projection : passage SIRI complet
+            return project_visit(data)
+        return cls.create(data['line'], data['destination'], data.get('mode'), data.get('stop_code'),
+                          data.get('trip'), parse_timestamp(data.get('time')), data['realtime'],
+                          parse_timestamp(data.get('aimed')))
+
+
+def _destination(value):
+    return ', '.join(value) if isinstance(value, list) else value
+
+
+def project_visit(visit):
+    """Projette un MonitoredStopVisit de stop-monitoring"""
+    journey = visit.get('MonitoredVehicleJourney') or {}
+    call = journey.get('MonitoredCall') or {}
+    expected = parse_timestamp(call.get('ExpectedDepartureTime') or call.get('ExpectedArrivalTime'))
+    aimed = parse_timestamp(call.get('AimedDepartureTime') or call.get('AimedArrivalTime'))
+    return Departure.create(
+        journey.get('PublishedLineName') or journey.get('LineRef'),
+        _destination(journey.get('DestinationName')),
+        journey.get('VehicleMode'),
+        call.get('StopCode') or visit.get('StopCode') or visit.get('MonitoringRef'),
+        (journey.get('FramedVehicleJourneyRef') or {}).get('DatedVehicleJourneySAERef'),
+        expected or aimed,
+        (call.get('Extension') or {}).get('IsRealTime', expected is not None),
+        aimed,
+    )
+
+
+def project_call(journey, call, expected):
+    """Projette un EstimatedCall d'une course estimated-timetable"""
+    return Departure.create(
+        journey.get('PublishedLineName') or journey.get('LineRef'),
+        _destination(call.get('DestinationName')),
+        (journey.get('Extension') or {}).get('VehicleMode'),
+        call['StopPointRef'],
+        (journey.get('FramedVehicleJourneyRef') or {}).get('DatedVehicleJourneySAERef'),
+        expected,
+        (call.get('Extension') or {}).get('IsRealTime', True),
+        parse_timestamp(call.get('AimedDepartureTime') or call.get('AimedArrivalTime')),
+    )
+
+
+def fetch_stop_monitoring(stop_code, vehicle_mode, api_token, preview_interval='PT2H', max_visits=10):
+    """Retourne les passages (Departure) d'un arrêt, en passant par le cache partagé"""
+    config = current_app.config
+    key = (stop_code, vehicle_mode or 'undefined', preview_interval, max_visits)
+
+    def load():
+        endpoint = f"{config['CTS_BASE_URL']}/v1/siri/2.0/stop-monitoring"
+        params = {
+            "MonitoringRef": stop_code,
+            "VehicleMode": vehicle_mode or "undefined",
+            "PreviewInterval": preview_interval,
+            "MaximumStopVisits": max_visits
+        }
+        logger.info(f"Requête CTS: {endpoint} avec arrêt {stop_code}")
+        response = upstream.get(endpoint, params=params, auth=(api_token, ""))
+        if response.status_code != 200:
+            # Toute réponse autre que 200 est un échec : rien n'est mis en cache
+            logger.error(f"Erreur CTS: statut {response.status_code}, réponse: {response.text}")
+            raise requests.HTTPError(f"Statut {response.status_code} pour {endpoint}", response=response)
+
+        delivery = response.json()["ServiceDelivery"]["StopMonitoringDelivery"][0]
+        departures = [project_visit(visit) for visit in delivery.get("MonitoredStopVisit", [])[:max_visits]]
+        ttl = compute_ttl(response.headers, delivery, config)
+        logger.info(f"Nombre de passages trouvés après limitation : {len(departures)} (cache {ttl:.0f}s)")
+        snapshot_store.save('cts', f"{stop_code}:{vehicle_mode or 'undefined'}",
+                            [departure.as_dict() for departure in departures])
+        return departures, ttl
+
+    return stop_monitoring_cache.get_or_load(key, load)
+
+
+def last_known_arrivals(stop_code, vehicle_mode):
+    """Derniers passages obtenus pour l'arrêt (conservés sur disque), sans ceux déjà passés"""
+    persisted = snapshot_store.load('cts', f"{stop_code}:{vehicle_mode or 'undefined'}")
+    if persisted is None:
+        return []
+    now = datetime.now(timezone.utc)
+    departures = [Departure.from_dict(entry) for entry in persisted[0]]
+    return [departure for departure in departures if departure.time is None or departure.time >= now]
+
+
+class DepartureIndex:
+    """Passages à venir par point d'arrêt, construit une fois par réponse estimated-timetable.
+
+    Une seule réponse couvre toutes les lignes des arrêts affichés : chaque tableau
+    de départs est ensuite une lecture de l'index, sans nouvel appel à l'API. Les
+    passages sont projetés à la construction (la réponse SIRI n'est pas conservée)
+    et triés par horaire ; ceux déjà passés sont écartés à la lecture.
+    """
+
+    def __init__(self, departures):
+        self._times = {}
+        self._departures = {}
+        for stop_code, entries in departures.items():
+            # Un passage sans horaire (instantané partiel) ne peut pas être placé : écarté
+            entries = sorted((departure for departure in entries if departure.time is not None),
+                             key=lambda departure: departure.time)
+            self._times[stop_code] = [departure.time.timestamp() for departure in entries]
+            self._departures[stop_code] = entries
+
+    @classmethod
+    def from_journeys(cls, journeys):
+        departures = {}
+        for journey in journeys:
+            for call in journey.get('EstimatedCalls') or []:
+                # Terminus : descente uniquement, pas de départ à afficher
+                if (call.get('Extension') or {}).get('IsCheckOut'):
+                    continue
+                expected = parse_timestamp(call.get('ExpectedDepartureTime') or call.get('ExpectedArrivalTime'))
+                if expected is None or not call.get('StopPointRef'):
+                    continue
+                departures.setdefault(call['StopPointRef'], []).append(project_call(journey, call, expected))
+        return cls(departures)
+
+    @classmethod
+    def from_payload(cls, payload):
+        if isinstance(payload, list):
+            # Instantané enregistré avant la projection : courses SIRI complètes
+            return cls.from_journeys(payload)
+        return cls({stop_code: [Departure.from_dict(entry) for entry in entries]
+                    for stop_code, entries in payload.items()})
+
+    def to_payload(self):
+        return {stop_code: [departure.as_dict() for departure in entries]
+                for stop_code, entries in self._departures.items()}
+
+    def __len__(self):
+        return sum(len(entries) for entries in self._departures.values())
+
+    def upcoming(self, stop_codes, limit=10, now=None):
+        """Prochains passages, tous quais confondus"""
+        now = time.time() if now is None else now
+        streams = []
+        for stop_code in stop_codes:
+            times = self._times.get(stop_code)
+            if times:
+                streams.append(islice(self._departures[stop_code], bisect.bisect_left(times, now), None))
+        return list(islice(heapq.merge(*streams, key=lambda departure: departure.time), limit))
+
+
+def _timetable_key(line_refs, vehicle_mode):
+    return f"{','.join(line_refs) or '*'}:{vehicle_mode or 'undefined'}"
+
+
+def fetch_estimated_timetable(line_refs, vehicle_mode, api_token, preview_interval='PT1H'):
+    """Index des passages des lignes demandées (tout le réseau si line_refs est vide), en un appel mutualisé"""
+    config = current_app.config
+    line_refs = sorted(line_refs)
+    key = (tuple(line_refs), vehicle_mode or 'undefined', preview_interval)
+
+    def load():
+        endpoint = f"{config['CTS_BASE_URL']}/v1/siri/2.0/estimated-timetable"
+        params = {
+            "VehicleMode": vehicle_mode or "undefined",
+            "PreviewInterval": preview_interval,
+            "RemoveCheckOut": "true"
+        }
+        if line_refs:
+            params["LineRef"] = line_refs
+        logger.info(f"Requête CTS: {endpoint} pour les lignes {', '.join(line_refs) or 'toutes'}")
+        response = upstream.get(endpoint, params=params, auth=(api_token, ""))
+        if response.status_code != 200:
+            # Toute réponse autre que 200 est un échec : rien n'est mis en cache
+            logger.error(f"Erreur CTS: statut {response.status_code}, réponse: {response.text}")
+            raise requests.HTTPError(f"Statut {response.status_code} pour {endpoint}", response=response)
+
+        delivery = response.json()["ServiceDelivery"]["EstimatedTimetableDelivery"][0]
+        journeys = [journey for frame in delivery.get("EstimatedJourneyVersionFrame") or []
+                    for journey in frame.get("EstimatedVehicleJourney") or []]
+        index = DepartureIndex.from_journeys(journeys)
+        ttl = compute_ttl(response.headers, delivery, config)
+        logger.info(f"Nombre de courses trouvées : {len(journeys)}, {len(index)} passages (cache {ttl:.0f}s)")
+        snapshot_store.save('cts_timetable', _timetable_key(line_refs, vehicle_mode), index.to_payload())
+        return index, ttl
+
+    return estimated_timetable_cache.get_or_load(key, load)
+
+
+def resolve_stops(stop_codes):
+    """Arrêts configurés : (code, nom, codes des quais, lignes) d'après le catalogue local.
+
+    Un code d'arrêt logique couvre tous ses quais ; un code de quai ne couvre que lui-même.
+    """
+    resolved = []
+    for code in stop_codes:
+        entry = stop_catalogue.get(code)
+        if entry is None:
+            resolved.append((code, code, (code,), ()))
+        elif entry.code == code:
+            resolved.append((code, entry.name, entry.stop_codes, entry.lines))
+        else:
+            resolved.append((code, entry.name, (code,), entry.lines))
+    return resolved
+
+
+def board_lines(resolved, line_refs):
+    """Lignes à demander : celles configurées, sinon celles desservant les arrêts (vide : tout le réseau)"""
+    if line_refs:
+        return sorted(line_refs)
+    lines = {line for _, _, _, stop_lines in resolved for line in stop_lines}
+    # Un arrêt absent du catalogue empêche de restreindre la demande
+    if any(not stop_lines for _, _, _, stop_lines in resolved):
+        return []
+    return sorted(lines)
+
+
+def build_boards(index, resolved, max_visits=10):
+    return [{'code': code, 'name': name, 'departures': index.upcoming(stop_codes, max_visits)}
+            for code, name, stop_codes, _ in resolved]
+
+
+def boards_digest(boards):
+    """Empreinte entière du contenu des tableaux : identique dans tous les processus pour les mêmes passages"""
+    content = [[board['code'], board.get('scheduled', False), [departure.as_dict() for departure in board['departures']]]
+               for board in boards]
+    return zlib.crc32(json.dumps(content, sort_keys=True).encode('utf-8'))
+
+
+def fetch_departure_boards(stop_codes, line_refs, vehicle_mode, api_token, preview_interval='PT1H', max_visits=10):
+    """Tableaux de départs de plusieurs arrêts, tirés d'un seul appel estimated-timetable"""
+    resolved = resolve_stops(stop_codes)
+    index = fetch_estimated_timetable(board_lines(resolved, line_refs), vehicle_mode, api_token, preview_interval)
+    return build_boards(index, resolved, max_visits)
+
+
+def last_known_boards(stop_codes, line_refs, vehicle_mode, max_visits=10):
+    """Tableaux reconstruits à partir de la dernière réponse estimated-timetable conservée sur disque"""
+    resolved = resolve_stops(stop_codes)
+    persisted = snapshot_store.load('cts_timetable', _timetable_key(board_lines(resolved, line_refs), vehicle_mode))
+    return build_boards(DepartureIndex.from_payload(persisted[0] if persisted else {}), resolved, max_visits)
@@ -24,7 +24,7 @@ else
 endif
 
 TEST_CMD ?= "./docker/test/test.sh"
-RUN_CMD ?= "flask run --host=0.0.0.0"
+RUN_CMD ?= "gunicorn --config gunicorn.conf.py app:app"
 
 # Max CPU and memory
 CPUS ?= 8.0
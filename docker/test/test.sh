@@ -2,3 +2,4 @@
 set -euo pipefail
 
 flask --version
+gunicorn --version
@@ -1,12 +1,24 @@
+from flask import current_app
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
 from flask_login import LoginManager
 from flask_wtf.csrf import CSRFProtect
 import logging
 from logging.handlers import RotatingFileHandler
 import os
 
+class RoutingSession(Session):
+    """Session dirigeant les lectures des routes d'affichage vers le pool en lecture seule, s'il existe"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self.info.get('read_only') and not self._flushing:
+            read_engine = current_app.extensions.get('sqlite_read_engine')
+            if read_engine is not None:
+                return read_engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
 # Initialisation des extensions
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 csrf = CSRFProtect()
 login_manager = LoginManager()
 login_manager.login_view = 'login'
@@ -0,0 +1,154 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from extensions import logger
+
+
+class FanOutResult:
+    """Valeurs obtenues par widget.
+
+    `missed` liste les widgets hors délai (leur chargement continue en arrière-plan),
+    `failed` ceux dont le chargement a échoué : leur valeur de repli est la réponse.
+    """
+
+    def __init__(self, values, missed, failed=()):
+        self.values = values
+        self.missed = missed
+        self.failed = list(failed)
+
+    def __getitem__(self, name):
+        return self.values[name]
+
+
+class PendingWidgets:
+    """Chargements lancés par FanOut.submit, à récupérer avec FanOut.collect avant `expires_at`"""
+
+    def __init__(self, loaders, futures, deadline, expires_at):
+        self.loaders = loaders
+        self.futures = futures
+        self.deadline = deadline
+        self.expires_at = expires_at
+
+
+class WidgetStats:
+    __slots__ = ('calls', 'timeouts', 'errors', 'latency_total')
+
+    def __init__(self):
+        self.calls = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.latency_total = 0.0
+
+    def as_dict(self):
+        completed = self.calls - self.timeouts
+        return {
+            'calls': self.calls,
+            'timeouts': self.timeouts,
+            'errors': self.errors,
+            'avg_latency_ms': round(self.latency_total / completed * 1000, 1) if completed else None,
+        }
+
+
+class FanOut:
+    """Charge en parallèle les widgets alimentés par des API externes, sous une échéance commune.
+
+    Un widget qui n'a pas répondu à l'échéance reçoit sa valeur de repli : la page
+    n'attend jamais l'API la plus lente. Le chargement en retard continue en
+    arrière-plan (il alimente les caches) et n'est pas relancé tant qu'il n'est pas terminé.
+    """
+
+    def __init__(self, max_workers=4, deadline=1.5):
+        self.max_workers = max_workers
+        self.deadline = deadline
+        self._executor = None
+        self._pid = None
+        self._pending = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def configure(self, config):
+        self.max_workers = config['HOME_FANOUT_WORKERS']
+        self.deadline = config['HOME_DEADLINE']
+
+    @property
+    def executor(self):
+        # Les threads du pool n'existent pas dans un processus forké
+        if self._executor is None or self._pid != os.getpid():
+            with self._lock:
+                if self._executor is None or self._pid != os.getpid():
+                    self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix='educinfo-fanout')
+                    self._pid = os.getpid()
+                    self._pending = {}
+        return self._executor
+
+    def submit(self, app, loaders, deadline=None):
+        """Lance {nom: (fonction, repli)} dans un contexte d'application ; l'échéance court dès maintenant"""
+        deadline = self.deadline if deadline is None else deadline
+        expires_at = time.monotonic() + deadline
+        futures = {}
+        executor = self.executor
+        with self._lock:
+            for name, (func, _) in loaders.items():
+                future = self._pending.get(name)
+                if future is None or future.done():
+                    future = self._pending[name] = executor.submit(self._run, app, name, func)
+                futures[name] = future
+                self._widget_stats(name).calls += 1
+        return PendingWidgets(loaders, futures, deadline, expires_at)
+
+    def collect(self, pending):
+        """Attend les widgets pendant le temps restant avant l'échéance (travail local déjà fait compris)"""
+        wait(pending.futures.values(), timeout=max(0.0, pending.expires_at - time.monotonic()))
+
+        values, missed, failed = {}, [], []
+        for name, future in pending.futures.items():
+            fallback = pending.loaders[name][1]
+            if not future.done():
+                missed.append(name)
+                values[name] = fallback
+                with self._lock:
+                    self._widget_stats(name).timeouts += 1
+                logger.warning(f"Widget '{name}' hors délai ({pending.deadline}s), valeur de repli affichée")
+                continue
+            try:
+                values[name] = future.result()
+            except Exception as e:
+                failed.append(name)
+                values[name] = fallback
+                logger.error(f"Erreur du widget '{name}': {e}")
+        return FanOutResult(values, missed, failed)
+
+    def gather(self, app, loaders, deadline=None):
+        """Lance les widgets et attend au plus `deadline` secondes"""
+        return self.collect(self.submit(app, loaders, deadline))
+
+    def stats(self):
+        with self._lock:
+            return {
+                'deadline': self.deadline,
+                'max_workers': self.max_workers,
+                'widgets': {name: s.as_dict() for name, s in self._stats.items()},
+            }
+
+    def _run(self, app, name, func):
+        start = time.perf_counter()
+        try:
+            with app.app_context():
+                return func()
+        except Exception:
+            with self._lock:
+                self._widget_stats(name).errors += 1
+            raise
+        finally:
+            with self._lock:
+                self._widget_stats(name).latency_total += time.perf_counter() - start
+
+    def _widget_stats(self, name):
+        stats = self._stats.get(name)
+        if stats is None:
+            stats = self._stats[name] = WidgetStats()
+        return stats
+
+
+home_fanout = FanOut()
@@ -1,9 +1,15 @@
 from flask_wtf import FlaskForm
+from flask_wtf.file import FileField, FileRequired, FileAllowed
 from wtforms import StringField, PasswordField, BooleanField, TextAreaField, DateField, SubmitField, SelectField
 from wtforms.fields import SelectMultipleField
 from wtforms.validators import DataRequired, Length, ValidationError, Regexp, EqualTo, Optional
 from datetime import date
 from models import ThemeConfig, MenuItem
+from stop_catalogue import stop_catalogue
+
+def split_codes(value):
+    """Liste de codes saisie séparée par des virgules ou des espaces"""
+    return [code for code in (value or '').replace(',', ' ').split() if code]
 
 class LoginForm(FlaskForm):
     identifiant = StringField('Identifiant', validators=[
@@ -20,20 +26,18 @@ class LoginForm(FlaskForm):
 
 class AbsenceForm(FlaskForm):
     professeur = StringField('Professeur', validators=[DataRequired()])
-    jours = SelectMultipleField('Jours d\'absence', choices=[
-        ('lundi', 'Lundi'),
-        ('mardi', 'Mardi'),
-        ('mercredi', 'Mercredi'),
-        ('jeudi', 'Jeudi'),
-        ('vendredi', 'Vendredi'),
-        ('samedi', 'Samedi'),
-    ])
+    date_debut = DateField('Du', validators=[DataRequired()], default=date.today)
+    date_fin = DateField('Au', validators=[DataRequired()], default=date.today)
     submit_absence = SubmitField('Ajouter / Modifier')
     
     def validate_professeur(self, field):
         if len(field.data.strip()) < 2:
             raise ValidationError('Le nom du professeur doit contenir au moins 2 caractères')
 
+    def validate_date_fin(self, field):
+        if self.date_debut.data and field.data < self.date_debut.data:
+            raise ValidationError('La date de fin doit suivre la date de début')
+
 class WidgetConfigForm(FlaskForm):
     show_menu_cantine = BooleanField('Afficher le menu de la cantine')
     show_transports = BooleanField('Afficher les transports')
@@ -45,8 +49,26 @@ class WidgetConfigForm(FlaskForm):
     )
     cts_api_token = StringField("Clé API CTS", validators=[Optional()])
     cts_stop_display = StringField("Texte à afficher (ex: 'Lycée')", validators=[Optional()])
+    cts_stop_codes = StringField("Arrêts supplémentaires (codes séparés par des virgules)",
+                                 validators=[Optional(), Length(max=200)])
+    cts_line_refs = StringField("Lignes affichées (vide : toutes)", validators=[Optional(), Length(max=100)])
     submit_widget = SubmitField('Enregistrer les paramètres')
 
+    def validate_cts_stop_code(self, field):
+        # Vérifié dans le catalogue local, sans appel à l'API ; accepté tel quel si le catalogue n'est pas encore chargé
+        if field.data and stop_catalogue.is_known(field.data) is False:
+            raise ValidationError(f"Arrêt « {field.data} » inconnu du réseau CTS")
+
+    def validate_cts_stop_codes(self, field):
+        unknown = [code for code in split_codes(field.data) if stop_catalogue.is_known(code) is False]
+        if unknown:
+            raise ValidationError(f"Arrêts inconnus du réseau CTS : {', '.join(unknown)}")
+
+    def validate_cts_line_refs(self, field):
+        unknown = [ref for ref in split_codes(field.data) if stop_catalogue.is_known_line(ref) is False]
+        if unknown:
+            raise ValidationError(f"Lignes inconnues du réseau CTS : {', '.join(unknown)}")
+
 class EventForm(FlaskForm):
     title = StringField('Titre', validators=[
         DataRequired(),
@@ -119,3 +141,15 @@ class MenuItemForm(FlaskForm):
                               choices=lambda: [(i[0], f"{i[0]} {i[1]}") for i in MenuItem.get_icons()])
     date = DateField('Date', validators=[DataRequired()], default=date.today)
     submit_menu_item = SubmitField('Ajouter au menu')
+
+class ImportForm(FlaskForm):
+    kind = SelectField('Données', choices=[
+        ('absences', 'Absences (professeur, date_debut, date_fin)'),
+        ('events', 'Événements (title, date, description)'),
+        ('menu', 'Menus (date, category, name, description, icons)')
+    ])
+    file = FileField('Fichier CSV ou iCalendar', validators=[
+        FileRequired(),
+        FileAllowed(['csv', 'ics', 'txt'], 'Fichier CSV ou iCalendar (.ics) uniquement')
+    ])
+    submit_import = SubmitField('Importer')
@@ -0,0 +1,54 @@
+# Configuration Gunicorn pour la production : gunicorn -c gunicorn.conf.py app:app
+#
+# L'application est chargée une seule fois dans le processus maître (preload_app),
+# la base est initialisée avant le fork, puis chaque worker recrée ses propres
+# connexions (base de données, pool HTTP) et son thread de rafraîchissement.
+#
+# Rechargement sans coupure :
+#   kill -HUP <pid maître>   nouveaux workers avec la même version du code
+#   kill -USR2 <pid maître>  nouveau maître avec le nouveau code, puis
+#   kill -WINCH / -QUIT <ancien maître> une fois les nouveaux workers prêts
+import os
+
+bind = os.environ.get('WEB_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('WEB_WORKERS', 2))
+# Même variable que Config.WEB_THREADS, qui borne STREAM_MAX_CONNECTIONS
+threads = int(os.environ.get('WEB_THREADS', 8))
+# Workers à threads : une connexion keep-alive inactive ne retient pas de thread, mais une connexion
+# SSE (/stream) en retient un tant qu'elle reste ouverte. STREAM_MAX_CONNECTIONS (par worker) est donc
+# borné sous `threads` (voir Broadcaster.configure) ; les écrans refusés passent au sondage
+worker_class = 'gthread'
+preload_app = True
+
+timeout = int(os.environ.get('WEB_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('WEB_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('WEB_KEEPALIVE', 5))
+max_requests = int(os.environ.get('WEB_MAX_REQUESTS', 0))
+max_requests_jitter = max_requests // 10
+
+# WEB_ACCESS_LOG vide : journal d'accès désactivé
+accesslog = os.environ.get('WEB_ACCESS_LOG', '-') or None
+errorlog = '-'
+loglevel = os.environ.get('WEB_LOG_LEVEL', 'info')
+forwarded_allow_ips = os.environ.get('FORWARDED_ALLOW_IPS', '127.0.0.1')
+
+
+def on_starting(server):
+    """Maître : initialise la base une fois par déploiement, avant le lancement des workers"""
+    from app import initialize_database, release_process_resources, metrics
+    initialize_database()
+    # Les compteurs repartent de zéro à chaque déploiement
+    metrics.clear_directory()
+    # Aucune connexion ouverte par le maître ne doit être héritée par les workers
+    release_process_resources(close=True)
+
+
+def post_fork(server, worker):
+    from app import release_process_resources
+    release_process_resources()
+    server.log.info(f"Worker {worker.pid} prêt")
+
+
+def worker_exit(server, worker):
+    from app import refresher
+    refresher.stop()
@@ -0,0 +1,291 @@
+import os
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from extensions import logger
+from metrics import metrics
+
+# Statuts pour lesquels une nouvelle tentative a du sens
+RETRY_STATUSES = frozenset({429, 502, 503, 504})
+
+
+class RetryBudget:
+    """Budget global de nouvelles tentatives : chaque requête crédite `ratio` jeton,
+    chaque nouvelle tentative en consomme un. Empêche les tempêtes de retries
+    quand une API est en panne."""
+
+    def __init__(self, ratio=0.2, max_tokens=10):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self._tokens = float(max_tokens)
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def withdraw(self):
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+    @property
+    def tokens(self):
+        return self._tokens
+
+
+class CircuitOpenError(requests.ConnectionError):
+    """Appel refusé sans contacter l'API : le disjoncteur de l'endpoint est ouvert"""
+
+
+class CircuitBreaker:
+    """Disjoncteur d'un endpoint externe.
+
+    Fermé : les appels passent. Après failure_threshold échecs consécutifs
+    (exception, statut 5xx ou 4xx, dont une clé d'API refusée), il
+    s'ouvre et refuse les appels pendant recovery_timeout secondes, puis passe
+    en semi-ouvert : un seul appel d'essai, qui le referme ou le rouvre.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, name, failure_threshold=5, recovery_timeout=30, clock=time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.transitions = 0
+        self.rejected = 0
+        self._probing = False
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.OPEN:
+                if self._clock() - self.opened_at < self.recovery_timeout:
+                    self.rejected += 1
+                    return False
+                self._transition(self.HALF_OPEN)
+            if self.state == self.HALF_OPEN:
+                if self._probing:
+                    self.rejected += 1
+                    return False
+                self._probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._probing = False
+            if self.state != self.CLOSED:
+                self._transition(self.CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.failures >= self.failure_threshold):
+                self.opened_at = self._clock()
+                self._transition(self.OPEN)
+
+    def as_dict(self):
+        with self._lock:
+            retry_in = None
+            if self.state == self.OPEN:
+                retry_in = round(max(0.0, self.recovery_timeout - (self._clock() - self.opened_at)), 1)
+            return {
+                'state': self.state,
+                'failures': self.failures,
+                'transitions': self.transitions,
+                'rejected': self.rejected,
+                'retry_in': retry_in,
+            }
+
+    def _transition(self, state):
+        previous, self.state = self.state, state
+        self.transitions += 1
+        log = logger.info if state == self.CLOSED else logger.warning
+        log(f"Disjoncteur {self.name} : {previous} -> {state} ({self.failures} échec(s) consécutif(s))")
+
+
+class HostStats:
+    __slots__ = ('requests', 'errors', 'retries', 'latency_total', 'latency_max', 'last_status')
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self.last_status = None
+
+    def as_dict(self):
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'retries': self.retries,
+            'avg_latency_ms': round(self.latency_total / self.requests * 1000, 1) if self.requests else None,
+            'max_latency_ms': round(self.latency_max * 1000, 1),
+            'last_status': self.last_status,
+        }
+
+
+class UpstreamClient:
+    """Client HTTP partagé pour les API externes (CTS, OpenWeather).
+
+    Une session keep-alive par processus, avec un pool de connexions par hôte,
+    des délais de connexion/lecture par défaut et des nouvelles tentatives
+    plafonnées avec gigue.
+    """
+
+    def __init__(self):
+        self.pool_size = 8
+        self.connect_timeout = 3.0
+        self.read_timeout = 5.0
+        self.max_retries = 2
+        self.backoff_base = 0.2
+        self.backoff_cap = 2.0
+        self.budget = RetryBudget()
+        self.breaker_threshold = 5
+        self.breaker_recovery = 30
+        self._breakers = {}
+        self._session = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def configure(self, config):
+        self.pool_size = config['UPSTREAM_POOL_SIZE']
+        self.connect_timeout = config['UPSTREAM_CONNECT_TIMEOUT']
+        self.read_timeout = config['UPSTREAM_READ_TIMEOUT']
+        self.max_retries = config['UPSTREAM_MAX_RETRIES']
+        self.backoff_base = config['UPSTREAM_BACKOFF_BASE']
+        self.backoff_cap = config['UPSTREAM_BACKOFF_CAP']
+        self.budget = RetryBudget(config['UPSTREAM_RETRY_BUDGET_RATIO'], config['UPSTREAM_RETRY_BUDGET_MAX'])
+        self.breaker_threshold = config['UPSTREAM_BREAKER_THRESHOLD']
+        self.breaker_recovery = config['UPSTREAM_BREAKER_RECOVERY']
+        self._breakers = {}
+        self.reset()
+
+    @property
+    def session(self):
+        # Les sockets ne doivent pas être partagées entre processus après un fork
+        if self._session is None or self._pid != os.getpid():
+            with self._lock:
+                if self._session is None or self._pid != os.getpid():
+                    self._session = self._build_session()
+                    self._pid = os.getpid()
+        return self._session
+
+    def reset(self):
+        with self._lock:
+            if self._session is not None and self._pid == os.getpid():
+                self._session.close()
+            self._session = None
+            self._pid = None
+
+    def get(self, url, params=None, auth=None, timeout=None, retries=None):
+        """GET avec délais bornés et nouvelles tentatives ; retourne la dernière réponse obtenue"""
+        timeout = timeout or (self.connect_timeout, self.read_timeout)
+        retries = self.max_retries if retries is None else retries
+        parts = urlsplit(url)
+        stats = self._host_stats(parts.netloc)
+        breaker = self.breaker(parts.netloc + parts.path)
+        if not breaker.allow():
+            raise CircuitOpenError(f"Disjoncteur ouvert pour {breaker.name}")
+        try:
+            response = self._get_with_retries(url, params, auth, timeout, retries, parts.netloc, stats)
+        except Exception:
+            breaker.record_failure()
+            raise
+        # 4xx compris : une clé refusée (401/403) ou une requête rejetée à chaque appel
+        # ne doit pas solliciter l'API indéfiniment ; un seul succès referme le compteur
+        if response.status_code >= 400:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        return response
+
+    def breaker(self, endpoint):
+        breaker = self._breakers.get(endpoint)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.setdefault(
+                    endpoint, CircuitBreaker(endpoint, self.breaker_threshold, self.breaker_recovery))
+        return breaker
+
+    def _get_with_retries(self, url, params, auth, timeout, retries, host, stats):
+        self.budget.deposit()
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            try:
+                response = self.session.get(url, params=params, auth=auth, timeout=timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self._record(host, stats, start, None)
+                if not self._should_retry(attempt, retries, stats):
+                    raise
+                logger.warning(f"Nouvelle tentative {attempt + 1}/{retries} vers {url}: {e}")
+            else:
+                self._record(host, stats, start, response.status_code)
+                if response.status_code not in RETRY_STATUSES or not self._should_retry(attempt, retries, stats):
+                    return response
+                logger.warning(f"Nouvelle tentative {attempt + 1}/{retries} vers {url}: statut {response.status_code}")
+                response.close()
+            time.sleep(random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt)))
+            attempt += 1
+
+    def stats(self):
+        with self._lock:
+            hosts = {host: s.as_dict() for host, s in self._stats.items()}
+        return {
+            'pool_size': self.pool_size,
+            'retry_budget_tokens': round(self.budget.tokens, 2),
+            'hosts': hosts,
+            'breakers': {name: breaker.as_dict() for name, breaker in list(self._breakers.items())},
+        }
+
+    def _build_session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.pool_size, max_retries=0)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def _host_stats(self, host):
+        stats = self._stats.get(host)
+        if stats is None:
+            with self._lock:
+                stats = self._stats.setdefault(host, HostStats())
+        return stats
+
+    def _should_retry(self, attempt, retries, stats):
+        if attempt >= retries or not self.budget.withdraw():
+            return False
+        with self._lock:
+            stats.retries += 1
+        return True
+
+    def _record(self, host, stats, start, status):
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            stats.requests += 1
+            stats.latency_total += elapsed
+            stats.latency_max = max(stats.latency_max, elapsed)
+            stats.last_status = status
+            if status is None or status >= 400:
+                stats.errors += 1
+        metrics.observe_upstream(host, status, elapsed)
+
+
+upstream = UpstreamClient()
@@ -0,0 +1,269 @@
+import csv
+import io
+import time
+from datetime import datetime
+from werkzeug.datastructures import MultiDict
+from sqlalchemy.exc import SQLAlchemyError
+from extensions import db, logger
+from forms import AbsenceForm, EventForm, MenuItemForm
+from models import Absence, Event, MenuItem, DataVersion
+
+
+class ImportKind:
+    """Décrit un type de données importable : formulaire de validation, modèle et clé d'unicité"""
+
+    def __init__(self, form_class, model, key, lookup, section, columns):
+        self.form_class = form_class
+        self.model = model
+        self.key = key
+        self.lookup = lookup
+        self.section = section
+        self.columns = columns
+
+
+KINDS = {
+    'absences': ImportKind(AbsenceForm, Absence, ('professeur', 'date_debut'), 'professeur', 'absences',
+                           ('professeur', 'date_debut', 'date_fin')),
+    'events': ImportKind(EventForm, Event, ('title', 'date'), 'date', 'events',
+                         ('title', 'date', 'description')),
+    'menu': ImportKind(MenuItemForm, MenuItem, ('date', 'category', 'name'), 'date', 'menu',
+                       ('date', 'category', 'name', 'description', 'icons')),
+}
+
+
+class ImportReport:
+    """Bilan d'un import : lignes traitées, insertions, mises à jour et erreurs par ligne"""
+
+    def __init__(self, kind, max_errors=100):
+        self.kind = kind
+        self.max_errors = max_errors
+        self.rows = 0
+        self.inserted = 0
+        self.updated = 0
+        self.failed = 0
+        self.batches = 0
+        self.errors = []
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    def add_error(self, line, message):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append((line, message))
+
+    def finish(self):
+        self.elapsed = time.perf_counter() - self.started
+        return self
+
+    @property
+    def rows_per_second(self):
+        return round(self.rows / self.elapsed, 1) if self.elapsed else None
+
+    def summary(self):
+        return (f"Import {self.kind} : {self.inserted} ajout(s), {self.updated} mise(s) à jour, "
+                f"{self.failed} erreur(s) sur {self.rows} ligne(s) en {self.elapsed:.2f} s")
+
+    def as_dict(self):
+        return {
+            'kind': self.kind,
+            'rows': self.rows,
+            'inserted': self.inserted,
+            'updated': self.updated,
+            'failed': self.failed,
+            'batches': self.batches,
+            'errors': [{'line': line, 'message': message} for line, message in self.errors],
+            'elapsed': round(self.elapsed, 3),
+            'rows_per_second': self.rows_per_second,
+        }
+
+
+def iter_csv_rows(stream):
+    """Lit un CSV (séparateur ',' ou ';') ligne par ligne, sans charger le fichier en mémoire"""
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    first = text.readline()
+    delimiter = ';' if first.count(';') > first.count(',') else ','
+    header = next(csv.reader([first], delimiter=delimiter), [])
+    fields = [name.strip().lower() for name in header]
+    for line, values in enumerate(csv.reader(text, delimiter=delimiter), start=2):
+        if any(value.strip() for value in values):
+            yield line, dict(zip(fields, (value.strip() for value in values)))
+
+
+def _unfold_ical(stream):
+    """Reconstitue les lignes iCalendar repliées (RFC 5545 §3.1) au fil de la lecture"""
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    current, start = None, 0
+    for number, raw in enumerate(text, start=1):
+        raw = raw.rstrip('\r\n')
+        if raw[:1] in (' ', '\t') and current is not None:
+            current += raw[1:]
+            continue
+        if current is not None:
+            yield start, current
+        current, start = raw, number
+    if current is not None:
+        yield start, current
+
+
+def _ical_text(value):
+    return (value.replace('\\n', '\n').replace('\\N', '\n')
+            .replace('\\,', ',').replace('\\;', ';').replace('\\\\', '\\'))
+
+
+def iter_ical_events(stream):
+    """Extrait les VEVENT d'un fichier iCalendar sous forme de lignes title/date/description"""
+    event = None
+    for line, content in _unfold_ical(stream):
+        name, _, value = content.partition(':')
+        name, _, params = name.partition(';')
+        name = name.upper()
+        if name == 'BEGIN' and value.upper() == 'VEVENT':
+            event = {'title': '', 'date': '', 'description': ''}
+            start = line
+        elif event is None:
+            continue
+        elif name == 'END' and value.upper() == 'VEVENT':
+            yield start, event
+            event = None
+        elif name == 'SUMMARY':
+            event['title'] = _ical_text(value).strip()
+        elif name == 'DESCRIPTION':
+            event['description'] = _ical_text(value).strip()
+        elif name == 'DTSTART':
+            # Seule la date compte pour l'affichage (DTSTART;VALUE=DATE:20240902 ou 20240902T080000Z)
+            value = value.strip()[:8]
+            event['date'] = f"{value[:4]}-{value[4:6]}-{value[6:8]}" if value.isdigit() else value
+
+
+def _normalize_row(kind, row):
+    """Adapte une ligne du fichier au format attendu par le formulaire"""
+    data = MultiDict()
+    for column in KINDS[kind].columns:
+        value = row.get(column) or ''
+        if column.startswith('date') and '/' in value:
+            # Format français jj/mm/aaaa accepté en plus du format ISO
+            try:
+                value = datetime.strptime(value, '%d/%m/%Y').date().isoformat()
+            except ValueError:
+                pass
+        if column == 'icons':
+            data.setlist('icons', [icon for icon, _ in MenuItem.get_icons() if icon in value])
+        else:
+            data[column] = value
+    if kind == 'absences' and not data.get('date_fin'):
+        data['date_fin'] = data.get('date_debut', '')
+    if kind == 'menu':
+        data['category'] = data.get('category', '').lower()
+    return data
+
+
+def _form_values(kind, form):
+    if kind == 'absences':
+        return {
+            'professeur': form.professeur.data.strip(),
+            'date_debut': form.date_debut.data,
+            'date_fin': form.date_fin.data,
+        }
+    if kind == 'events':
+        return {
+            'title': form.title.data,
+            'date': form.date.data,
+            'description': form.description.data or '',
+        }
+    return {
+        'date': form.date.data,
+        'category': form.category.data,
+        'name': form.name.data,
+        'description': form.description.data,
+        'icons': ''.join(form.icons.data),
+    }
+
+
+class RowValidator:
+    """Valide des lignes avec le formulaire d'administration du type, instancié une seule fois"""
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.form = KINDS[kind].form_class(formdata=None, meta={'csrf': False})
+
+    def __call__(self, row):
+        """Retourne (valeurs, None) si la ligne est valide, sinon (None, message d'erreur)"""
+        form = self.form
+        form.process(_normalize_row(self.kind, row))
+        if not form.validate():
+            return None, '; '.join(f"{form[name].label.text} : {', '.join(errors)}"
+                                   for name, errors in form.errors.items())
+        return _form_values(self.kind, form), None
+
+
+def _flush(kind, batch, report):
+    """Insère ou met à jour un lot de lignes validées dans une seule transaction"""
+    spec = KINDS[kind]
+    model = spec.model
+    lookup_values = {values[spec.lookup] for _, values in batch}
+    existing = {
+        tuple(getattr(obj, column) for column in spec.key): obj
+        for obj in model.query.filter(getattr(model, spec.lookup).in_(lookup_values))
+    }
+    inserted = updated = 0
+    for _, values in batch:
+        key = tuple(values[column] for column in spec.key)
+        obj = existing.get(key)
+        if obj is None:
+            obj = existing[key] = model(**values)
+            db.session.add(obj)
+            inserted += 1
+        else:
+            for column, value in values.items():
+                setattr(obj, column, value)
+            updated += 1
+    try:
+        DataVersion.mark_changed(spec.section)
+        db.session.commit()
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        logger.error(f"Erreur lors de l'import ({kind}), lot ignoré : {e}")
+        for line, _ in batch:
+            report.add_error(line, "Erreur d'enregistrement du lot")
+        return
+    report.inserted += inserted
+    report.updated += updated
+    report.batches += 1
+
+
+def import_rows(kind, rows, batch_size=500, max_errors=100):
+    """Valide chaque ligne avec le formulaire d'administration et enregistre par lots.
+
+    `rows` est un itérable de couples (numéro de ligne, dict), consommé au fil de l'eau.
+    """
+    report = ImportReport(kind, max_errors)
+    validate = RowValidator(kind)
+    batch = []
+    for line, row in rows:
+        report.rows += 1
+        values, error = validate(row)
+        if error:
+            report.add_error(line, error)
+            continue
+        batch.append((line, values))
+        if len(batch) >= batch_size:
+            _flush(kind, batch, report)
+            batch = []
+    if batch:
+        _flush(kind, batch, report)
+    report.finish()
+    logger.info(f"{report.summary()} ({report.rows_per_second} lignes/s)")
+    return report
+
+
+def import_file(kind, stream, filename, batch_size=500, max_errors=100):
+    """Importe un fichier CSV, ou iCalendar (.ics) pour les événements"""
+    if kind not in KINDS:
+        raise ValueError(f"Type d'import inconnu : {kind}")
+    if filename.lower().endswith('.ics'):
+        if kind != 'events':
+            raise ValueError("Les fichiers iCalendar ne peuvent contenir que des événements")
+        rows = iter_ical_events(stream)
+    else:
+        rows = iter_csv_rows(stream)
+    return import_rows(kind, rows, batch_size, max_errors)
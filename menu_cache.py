@@ -0,0 +1,110 @@
+import threading
+import time
+from collections import namedtuple
+from datetime import date, timedelta
+from extensions import db
+from models import MenuItem, DataVersion
+
+MenuEntry = namedtuple('MenuEntry', 'id date category name description icons order')
+MenuSnapshot = namedtuple('MenuSnapshot', 'version start end days')
+
+
+def menu_week_start(day=None):
+    """Lundi de la semaine contenant `day`"""
+    day = day or date.today()
+    return day - timedelta(days=day.weekday())
+
+
+class MenuCache:
+    """Menus de la semaine courante et de la suivante, regroupés par jour, en mémoire.
+
+    Les lectures de l'accueil ne touchent pas MenuItem : le changement de jour ne fait
+    que changer de case, et l'instantané est rechargé au changement de semaine ou quand
+    la version 'menu' change (au plus tard check_interval secondes pour un autre worker).
+    """
+
+    def __init__(self, weeks=2, check_interval=1.0, today=date.today):
+        self.weeks = weeks
+        self.check_interval = check_interval
+        self._today = today
+        self._snapshot = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.fallbacks = 0
+
+    def get(self):
+        snapshot = self._snapshot
+        start = menu_week_start(self._today())
+        now = time.monotonic()
+        if snapshot is not None and snapshot.start == start and now - self._checked_at < self.check_interval:
+            return snapshot
+
+        row = db.session.get(DataVersion, 'menu')
+        version = row.version if row else 0
+        self._checked_at = now
+        if snapshot is not None and snapshot.start == start and snapshot.version == version:
+            return snapshot
+
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is None or snapshot.start != start or snapshot.version != version:
+                snapshot = self._snapshot = self._load(version, start)
+            return snapshot
+
+    def day(self, day=None):
+        """Plats d'un jour (aujourd'hui par défaut), triés par catégorie puis ordre"""
+        day = day or self._today()
+        snapshot = self.get()
+        if snapshot.start <= day < snapshot.end:
+            return snapshot.days.get(day, [])
+        self.fallbacks += 1
+        return [self._entry(item) for item in MenuItem.period_query(day, day + timedelta(days=1))]
+
+    def week(self, week_start):
+        """Plats d'une semaine : {date: {catégorie: [plats]}} pour les 7 jours"""
+        days = {week_start + timedelta(days=offset): {} for offset in range(7)}
+        snapshot = self.get()
+        if snapshot.start <= week_start and week_start + timedelta(days=7) <= snapshot.end:
+            entries = (entry for day in days for entry in snapshot.days.get(day, []))
+        else:
+            self.fallbacks += 1
+            entries = map(self._entry, MenuItem.period_query(week_start, week_start + timedelta(days=7)))
+        for entry in entries:
+            days[entry.date].setdefault(entry.category, []).append(entry)
+        return days
+
+    def invalidate(self):
+        self._snapshot = None
+
+    def stats(self):
+        snapshot = self._snapshot
+        return {
+            'start': snapshot.start.isoformat() if snapshot else None,
+            'days': len(snapshot.days) if snapshot else 0,
+            'items': sum(len(items) for items in snapshot.days.values()) if snapshot else 0,
+            'loads': self.loads,
+            'fallbacks': self.fallbacks,
+        }
+
+    def _load(self, version, start):
+        self.loads += 1
+        end = start + timedelta(weeks=self.weeks)
+        days = {}
+        for item in MenuItem.period_query(start, end):
+            days.setdefault(item.date, []).append(self._entry(item))
+        return MenuSnapshot(version=version, start=start, end=end, days=days)
+
+    @staticmethod
+    def _entry(item):
+        return MenuEntry(item.id, item.date, item.category, item.name,
+                         item.description, item.icons, item.order)
+
+
+menu_cache = MenuCache()
+
+
+@DataVersion.on_commit
+def _invalidate_menu(sections):
+    if 'menu' in sections:
+        menu_cache.invalidate()
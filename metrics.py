@@ -0,0 +1,272 @@
+import glob
+import json
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from flask import request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from extensions import logger
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+HELP = {
+    'educinfo_http_request_duration_seconds': ('histogram', "Durée de traitement des requêtes par endpoint Flask"),
+    'educinfo_http_requests_total': ('counter', "Requêtes traitées par endpoint, méthode et statut"),
+    'educinfo_db_queries_per_request': ('histogram', "Nombre de requêtes SQL par requête HTTP"),
+    'educinfo_db_queries_total': ('counter', "Requêtes SQL exécutées pendant les requêtes HTTP"),
+    'educinfo_db_query_seconds_total': ('counter', "Temps passé dans les requêtes SQL pendant les requêtes HTTP"),
+    'educinfo_upstream_request_duration_seconds': ('histogram', "Durée des appels aux API externes (CTS, OpenWeather)"),
+    'educinfo_upstream_requests_total': ('counter', "Appels aux API externes par hôte et statut"),
+    'educinfo_cache_hits_total': ('counter', "Accès servis par le cache"),
+    'educinfo_cache_misses_total': ('counter', "Accès non servis par le cache"),
+    'educinfo_cache_hit_ratio': ('gauge', "Part des accès servis par le cache, tous workers confondus"),
+}
+
+
+def _labels(**labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class MetricsRegistry:
+    """Métriques du processus, exposées au format texte Prometheus sur /metrics.
+
+    Chaque worker accumule ses compteurs en mémoire (quelques opérations sous verrou
+    par requête) et les écrit toutes les flush_interval secondes dans son propre
+    fichier de METRICS_DIR. /metrics additionne les fichiers de tous les workers,
+    y compris ceux des workers arrêtés : les compteurs restent croissants quand
+    gunicorn recycle un processus.
+    """
+
+    def __init__(self, directory=None, flush_interval=5):
+        self.enabled = False
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._collectors = []
+        self._reset()
+
+    def init_app(self, app):
+        self.enabled = app.config['METRICS_ENABLED']
+        self.directory = app.config['METRICS_DIR']
+        self.flush_interval = app.config['METRICS_FLUSH_INTERVAL']
+        if not self.enabled:
+            return
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    def add_collector(self, func):
+        """Enregistre une fonction retournant [(nom, labels, valeur)] de compteurs cumulés du processus"""
+        self._collectors.append(func)
+        return func
+
+    def reset(self):
+        """À appeler dans un worker forké : les valeurs héritées appartiennent au maître"""
+        with self._lock:
+            self._reset()
+
+    def clear_directory(self):
+        """Efface les fichiers d'un déploiement précédent (maître, avant le lancement des workers)"""
+        if not self.directory:
+            return
+        for path in glob.glob(os.path.join(self.directory, 'metrics-*.json')):
+            try:
+                os.unlink(path)
+            except OSError as e:
+                logger.warning(f"Impossible de supprimer {path}: {e}")
+
+    def observe_upstream(self, host, status, elapsed):
+        labels = _labels(host=host, status=f"{status // 100}xx" if status else 'error')
+        with self._lock:
+            key = ('educinfo_upstream_requests_total', labels)
+            self._counters[key] = self._counters.get(key, 0) + 1
+            self._observe('educinfo_upstream_request_duration_seconds', _labels(host=host), elapsed, LATENCY_BUCKETS)
+
+    def maybe_flush(self):
+        if self.enabled and time.monotonic() >= self._next_flush:
+            self.flush()
+
+    def flush(self):
+        """Écrit les métriques du processus dans son fichier (remplacement atomique)"""
+        self._next_flush = time.monotonic() + self.flush_interval
+        if not self.directory:
+            return
+        data = self._dump()
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.tmp-', suffix='.json')
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump(data, f)
+                os.replace(tmp_path, os.path.join(self.directory, f"metrics-{self._process_id}.json"))
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except OSError as e:
+            logger.error(f"Impossible d'enregistrer les métriques: {e}")
+
+    def render(self):
+        """Texte Prometheus agrégé sur tous les workers"""
+        self.flush()
+        counters, histograms = self._merge()
+        lines = []
+        for name, (kind, help_text) in HELP.items():
+            samples = []
+            if kind == 'counter':
+                for (metric, labels), value in sorted(counters.items()):
+                    if metric == name:
+                        samples.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+            elif kind == 'histogram':
+                for (metric, labels), (bounds, counts, total, count) in sorted(histograms.items()):
+                    if metric != name:
+                        continue
+                    cumulative = 0
+                    for bound, bucket in zip(list(bounds) + [float('inf')], counts):
+                        cumulative += bucket
+                        samples.append(f"{name}_bucket{_format_labels(labels, [('le', _format_value(bound))])} {cumulative}")
+                    samples.append(f"{name}_sum{_format_labels(labels)} {_format_value(total)}")
+                    samples.append(f"{name}_count{_format_labels(labels)} {count}")
+            elif name == 'educinfo_cache_hit_ratio':
+                for (metric, labels), hits in sorted(counters.items()):
+                    if metric != 'educinfo_cache_hits_total':
+                        continue
+                    lookups = hits + counters.get(('educinfo_cache_misses_total', labels), 0)
+                    if lookups:
+                        samples.append(f"{name}{_format_labels(labels)} {_format_value(round(hits / lookups, 4))}")
+            if samples:
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                lines.extend(samples)
+        return '\n'.join(lines) + '\n'
+
+    def _reset(self):
+        self._counters = {}
+        self._histograms = {}
+        self._process_id = f"{os.getpid()}-{int(time.time() * 1000)}"
+        self._next_flush = time.monotonic() + self.flush_interval
+
+    def _observe(self, name, labels, value, buckets):
+        histogram = self._histograms.get((name, labels))
+        if histogram is None:
+            histogram = self._histograms[(name, labels)] = [buckets, [0] * (len(buckets) + 1), 0.0, 0]
+        histogram[1][bisect_left(buckets, value)] += 1
+        histogram[2] += value
+        histogram[3] += 1
+
+    def _dump(self):
+        collected = []
+        for collector in self._collectors:
+            try:
+                collected.extend(collector())
+            except Exception as e:
+                logger.error(f"Erreur de collecte des métriques: {e}")
+        with self._lock:
+            counters = [[name, list(labels), value] for (name, labels), value in self._counters.items()]
+            histograms = [[name, list(labels), list(bounds), list(counts), total, count]
+                          for (name, labels), (bounds, counts, total, count) in self._histograms.items()]
+        counters.extend([name, list(labels), value] for name, labels, value in collected)
+        return {'pid': os.getpid(), 'counters': counters, 'histograms': histograms}
+
+    def _merge(self):
+        counters, histograms = {}, {}
+        for path in glob.glob(os.path.join(self.directory, 'metrics-*.json')):
+            try:
+                with open(path, encoding='utf-8') as f:
+                    data = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Fichier de métriques illisible {path}: {e}")
+                continue
+            for name, labels, value in data['counters']:
+                key = (name, tuple(map(tuple, labels)))
+                counters[key] = counters.get(key, 0) + value
+            for name, labels, bounds, counts, total, count in data['histograms']:
+                key = (name, tuple(map(tuple, labels)))
+                merged = histograms.get(key)
+                if merged is None or merged[0] != bounds:
+                    histograms[key] = (bounds, counts, total, count)
+                else:
+                    histograms[key] = (bounds, [a + b for a, b in zip(merged[1], counts)],
+                                       merged[2] + total, merged[3] + count)
+        return counters, histograms
+
+    # Requêtes HTTP et SQL : état par thread, aucune écriture partagée avant la fin de la requête
+
+    def _before_request(self):
+        local = self._local
+        local.start = time.perf_counter()
+        local.queries = 0
+        local.query_time = 0.0
+        local.active = True
+
+    def _after_request(self, response):
+        self._finish(response.status_code)
+        return response
+
+    def _teardown_request(self, exc):
+        if getattr(self._local, 'active', False):
+            self._finish(500)
+        self.maybe_flush()
+
+    def _finish(self, status):
+        local = self._local
+        if not getattr(local, 'active', False):
+            return
+        local.active = False
+        elapsed = time.perf_counter() - local.start
+        endpoint = request.endpoint or 'unmatched'
+        endpoint_labels = _labels(endpoint=endpoint)
+        with self._lock:
+            key = ('educinfo_http_requests_total', _labels(endpoint=endpoint, method=request.method, status=status))
+            self._counters[key] = self._counters.get(key, 0) + 1
+            self._observe('educinfo_http_request_duration_seconds', endpoint_labels, elapsed, LATENCY_BUCKETS)
+            self._observe('educinfo_db_queries_per_request', endpoint_labels, local.queries, QUERY_COUNT_BUCKETS)
+            if local.queries:
+                key = ('educinfo_db_queries_total', endpoint_labels)
+                self._counters[key] = self._counters.get(key, 0) + local.queries
+                key = ('educinfo_db_query_seconds_total', endpoint_labels)
+                self._counters[key] = self._counters.get(key, 0) + local.query_time
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self._local.query_start = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        local = self._local
+        if getattr(local, 'active', False):
+            local.queries += 1
+            local.query_time += time.perf_counter() - local.query_start
+
+
+metrics = MetricsRegistry()
+
+
+def cache_counters(name, stats, hits=('hits',), misses=('misses',)):
+    """Convertit le dict stats() d'un cache en compteurs succès/échecs pour add_collector"""
+    labels = _labels(cache=name)
+    return [
+        ('educinfo_cache_hits_total', labels, sum(stats[key] for key in hits)),
+        ('educinfo_cache_misses_total', labels, sum(stats[key] for key in misses)),
+    ]
@@ -0,0 +1,141 @@
+from datetime import date, datetime, timedelta
+from sqlalchemy import inspect, text
+from extensions import logger
+
+# Migrations appliquées dans l'ordre aux bases existantes : (version, description, fonction)
+MIGRATIONS = []
+
+
+def migration(version, description):
+    def register(func):
+        MIGRATIONS.append((version, description, func))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return func
+    return register
+
+
+@migration(1, "Index sur les colonnes interrogées par l'affichage")
+def add_display_indexes(conn):
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_event_date ON event (date)"))
+    conn.execute(text(
+        'CREATE INDEX IF NOT EXISTS ix_menu_item_date_category_order ON menu_item (date, category, "order")'
+    ))
+
+
+@migration(2, "Absences stockées en périodes datées")
+def absences_as_date_ranges(conn):
+    columns = {column['name'] for column in inspect(conn).get_columns('absence')}
+    if 'date_debut' not in columns:
+        conn.execute(text("ALTER TABLE absence ADD COLUMN date_debut DATE"))
+        conn.execute(text("ALTER TABLE absence ADD COLUMN date_fin DATE"))
+
+    jours = ['lundi', 'mardi', 'mercredi', 'jeudi', 'vendredi', 'samedi']
+    if 'lundi' in columns:
+        # Les cases cochées concernaient la semaine en cours : chaque suite de jours devient une période
+        from models import Absence
+        week_start = Absence.week_start()
+        rows = conn.execute(text(f"SELECT id, professeur, {', '.join(jours)} FROM absence")).all()
+        for row in rows:
+            periods, start = [], None
+            for index, jour in enumerate(jours + [None]):
+                absent = jour is not None and bool(getattr(row, jour))
+                if absent and start is None:
+                    start = index
+                elif not absent and start is not None:
+                    periods.append((week_start + timedelta(days=start), week_start + timedelta(days=index - 1)))
+                    start = None
+            if not periods:
+                conn.execute(text("DELETE FROM absence WHERE id = :id"), {'id': row.id})
+                continue
+            debut, fin = periods[0]
+            conn.execute(text("UPDATE absence SET date_debut = :d, date_fin = :f WHERE id = :id"),
+                         {'d': debut.isoformat(), 'f': fin.isoformat(), 'id': row.id})
+            for debut, fin in periods[1:]:
+                conn.execute(text("INSERT INTO absence (professeur, date_debut, date_fin) VALUES (:p, :d, :f)"),
+                             {'p': row.professeur, 'd': debut.isoformat(), 'f': fin.isoformat()})
+        for jour in jours:
+            conn.execute(text(f"ALTER TABLE absence DROP COLUMN {jour}"))
+
+    # Contrainte déclarée sur le modèle Absence : les doublons ne sont jamais supprimés d'office,
+    # la migration est refusée (et annulée) tant qu'ils n'ont pas été corrigés à la main
+    duplicates = conn.execute(text(
+        "SELECT professeur, date_debut, COUNT(*) AS n FROM absence "
+        "GROUP BY professeur, date_debut HAVING COUNT(*) > 1"
+    )).all()
+    if duplicates:
+        for row in duplicates:
+            logger.error(f"Absence en double : {row.professeur} au {row.date_debut} ({row.n} saisies)")
+        raise RuntimeError(f"{len(duplicates)} absence(s) en double, migration 2 interrompue")
+    conn.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_absence_professeur_debut ON absence (professeur, date_debut)"
+    ))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_absence_periode ON absence (date_fin, date_debut)"))
+
+
+@migration(3, "Plusieurs arrêts et lignes pour le widget transports")
+def widget_departure_boards(conn):
+    columns = {column['name'] for column in inspect(conn).get_columns('widget_config')}
+    if 'cts_stop_codes' not in columns:
+        conn.execute(text("ALTER TABLE widget_config ADD COLUMN cts_stop_codes VARCHAR(200) DEFAULT ''"))
+    if 'cts_line_refs' not in columns:
+        conn.execute(text("ALTER TABLE widget_config ADD COLUMN cts_line_refs VARCHAR(100) DEFAULT ''"))
+
+
+def _ensure_version_table(conn):
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_version ("
+        "version INTEGER PRIMARY KEY, description VARCHAR(200), applied_at DATETIME)"
+    ))
+
+
+def current_version(engine):
+    with engine.begin() as conn:
+        _ensure_version_table(conn)
+        return conn.execute(text("SELECT COALESCE(MAX(version), 0) FROM schema_version")).scalar()
+
+
+def upgrade(engine):
+    """Applique les migrations manquantes, chacune dans sa propre transaction"""
+    applied = current_version(engine)
+    for version, description, func in MIGRATIONS:
+        if version <= applied:
+            continue
+        with engine.begin() as conn:
+            func(conn)
+            conn.execute(
+                text("INSERT INTO schema_version (version, description, applied_at) VALUES (:v, :d, :t)"),
+                {'v': version, 'd': description, 't': datetime.utcnow()}
+            )
+        logger.info(f"Migration {version} appliquée : {description}")
+        applied = version
+    return applied
+
+
+def explain(engine, query):
+    """Retourne le plan d'exécution SQLite d'une requête SQLAlchemy"""
+    compiled = query.statement.compile(dialect=engine.dialect)
+    params = tuple(compiled.params[name] for name in compiled.positiontup)
+    with engine.connect() as conn:
+        rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", params).all()
+    return [row[-1] for row in rows]
+
+
+def check_hot_queries(engine):
+    """Plans des requêtes de l'affichage ; une requête est signalée si elle parcourt toute la table"""
+    from models import Absence, Event, MenuItem
+    from admin_sections import SECTIONS
+
+    queries = {
+        'Event.get_upcoming_events': Event.upcoming_events_query(),
+        'MenuItem.get_todays_menu': MenuItem.todays_menu_query(),
+        'Absence.get_week_absences': Absence.week_query(Absence.week_start()),
+        'Absence par professeur': Absence.query.filter_by(professeur='', date_debut=date.today()),
+    }
+    for name, section in SECTIONS.items():
+        queries[f"Tableau de bord : {name}"] = section.query({}).order_by(*section.order_by).limit(1)
+    report = []
+    for name, query in queries.items():
+        plan = explain(engine, query)
+        full_scan = any(line.startswith('SCAN') for line in plan)
+        report.append({'query': name, 'plan': plan, 'uses_index': not full_scan})
+    return report
@@ -3,6 +3,7 @@ from datetime import date, datetime, timedelta
 from werkzeug.security import generate_password_hash, check_password_hash
 from extensions import db
 from flask import current_app
+from sqlalchemy import event
 
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
@@ -30,14 +31,62 @@ class User(UserMixin, db.Model):
         return self.role == 'admin'
 
 class Absence(db.Model):
+    __table_args__ = (
+        db.Index('uq_absence_professeur_debut', 'professeur', 'date_debut', unique=True),
+        db.Index('ix_absence_periode', 'date_fin', 'date_debut'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     professeur = db.Column(db.String(100), nullable=False)
-    lundi = db.Column(db.Boolean, default=False)
-    mardi = db.Column(db.Boolean, default=False)
-    mercredi = db.Column(db.Boolean, default=False)
-    jeudi = db.Column(db.Boolean, default=False)
-    vendredi = db.Column(db.Boolean, default=False)
-    samedi = db.Column(db.Boolean, default=False)
+    date_debut = db.Column(db.Date, nullable=False)
+    date_fin = db.Column(db.Date, nullable=False)
+
+    JOURS = [
+        ('lundi', 'Lundi'),
+        ('mardi', 'Mardi'),
+        ('mercredi', 'Mercredi'),
+        ('jeudi', 'Jeudi'),
+        ('vendredi', 'Vendredi'),
+        ('samedi', 'Samedi')
+    ]
+
+    @staticmethod
+    def week_start(day=None):
+        """Lundi de la semaine affichée (le dimanche, la semaine suivante)"""
+        day = day or date.today()
+        if day.weekday() == 6:
+            day += timedelta(days=1)
+        return day - timedelta(days=day.weekday())
+
+    @staticmethod
+    def week_query(week_start):
+        week_end = week_start + timedelta(days=len(Absence.JOURS) - 1)
+        return Absence.query.filter(
+            Absence.date_fin >= week_start,
+            Absence.date_debut <= week_end
+        )
+
+    @staticmethod
+    def get_week_absences(week_start=None):
+        # Tri en mémoire : un ORDER BY professeur ferait préférer l'index d'unicité à celui des périodes
+        absences = Absence.week_query(week_start or Absence.week_start()).all()
+        return sorted(absences, key=lambda absence: absence.professeur.lower())
+
+    @staticmethod
+    def group_by_day(absences, week_start):
+        """Regroupe en un seul passage les professeurs absents par jour de la semaine"""
+        days = {jour: [] for jour, _ in Absence.JOURS}
+        last = len(Absence.JOURS) - 1
+        for absence in absences:
+            first_index = max((absence.date_debut - week_start).days, 0)
+            last_index = min((absence.date_fin - week_start).days, last)
+            for index in range(first_index, last_index + 1):
+                days[Absence.JOURS[index][0]].append(absence.professeur)
+        return days
+
+    @staticmethod
+    def purge_before(day):
+        """Supprime les absences terminées avant `day`"""
+        return Absence.query.filter(Absence.date_fin < day).delete(synchronize_session=False)
 
 class WidgetConfig(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -47,11 +96,26 @@ class WidgetConfig(db.Model):
     cts_vehicle_mode = db.Column(db.String(20), default="undefined")
     cts_api_token = db.Column(db.String(64), default="")
     cts_stop_display = db.Column(db.String(50), default="")
+    # Arrêts supplémentaires et lignes affichées, codes séparés par des virgules
+    cts_stop_codes = db.Column(db.String(200), default="")
+    cts_line_refs = db.Column(db.String(100), default="")
 
     @staticmethod
     def get_config():
         return WidgetConfig.query.first() or WidgetConfig()
 
+    def transport_stops(self):
+        """Arrêt principal puis arrêts supplémentaires, sans doublon"""
+        codes = [self.cts_stop_code or ''] + (self.cts_stop_codes or '').split(',')
+        return list(dict.fromkeys(code.strip() for code in codes if code.strip()))
+
+    def transport_lines(self):
+        return list(dict.fromkeys(ref.strip() for ref in (self.cts_line_refs or '').split(',') if ref.strip()))
+
+    def uses_departure_boards(self):
+        """Plusieurs arrêts ou un filtre de lignes : une requête estimated-timetable remplace stop-monitoring"""
+        return len(self.transport_stops()) > 1 or bool(self.transport_lines())
+
     def has_valid_transport_config(self):
         """Vérifie si la configuration des transports est valide"""
         return bool(
@@ -75,6 +139,7 @@ class WidgetConfig(db.Model):
         for key, value in settings.items():
             if hasattr(self, key):
                 setattr(self, key, value)
+        DataVersion.mark_changed('config')
         db.session.commit()
 
 class ThemeConfig(db.Model):
@@ -120,6 +185,9 @@ class WeatherConfig(db.Model):
         return cls.query.first() or cls()
 
 class Event(db.Model):
+    __table_args__ = (
+        db.Index('ix_event_date', 'date'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
     date = db.Column(db.Date, nullable=False)
@@ -129,14 +197,21 @@ class Event(db.Model):
         return self.date >= date.today()
 
     @staticmethod
-    def get_upcoming_events(days=30):
+    def upcoming_events_query(days=30):
         future_date = date.today() + timedelta(days=days)
         return Event.query.filter(
             Event.date >= date.today(),
             Event.date <= future_date
-        ).order_by(Event.date).all()
+        ).order_by(Event.date)
+
+    @staticmethod
+    def get_upcoming_events(days=30):
+        return Event.upcoming_events_query(days).all()
 
 class MenuItem(db.Model):
+    __table_args__ = (
+        db.Index('ix_menu_item_date_category_order', 'date', 'category', 'order'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     category = db.Column(db.String(50), nullable=False)
     name = db.Column(db.String(100), nullable=False)
@@ -167,6 +242,90 @@ class MenuItem(db.Model):
             ('🌶️', 'Épicé'),
         ]
 
+    @staticmethod
+    def todays_menu_query():
+        return MenuItem.query.filter_by(date=date.today()).order_by(MenuItem.category, MenuItem.order)
+
     @staticmethod
     def get_todays_menu():
-        return MenuItem.query.filter_by(date=date.today()).order_by(MenuItem.category, MenuItem.order).all()
\ No newline at end of file
+        return MenuItem.todays_menu_query().all()
+
+    @staticmethod
+    def period_query(start, end):
+        """Plats du `start` inclus au `end` exclu, dans l'ordre d'affichage"""
+        return MenuItem.query.filter(
+            MenuItem.date >= start,
+            MenuItem.date < end
+        ).order_by(MenuItem.date, MenuItem.category, MenuItem.order)
+
+    @staticmethod
+    def replace_days(days):
+        """Remplace les plats des jours donnés ({date: [valeurs]}), sans valider la transaction"""
+        MenuItem.query.filter(MenuItem.date.in_(list(days))).delete(synchronize_session=False)
+        for day, items in days.items():
+            positions = {}
+            for values in items:
+                order = positions[values['category']] = positions.get(values['category'], -1) + 1
+                db.session.add(MenuItem(**dict(values, date=day, order=order)))
+
+class DataVersion(db.Model):
+    """Compteur de versions des données affichées, incrémenté à chaque écriture admin"""
+    __tablename__ = 'data_version'
+    section = db.Column(db.String(20), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    # Sections versionnées séparément ; 'global' porte la dernière version attribuée
+    SECTIONS = ('absences', 'events', 'menu', 'config')
+    GLOBAL = 'global'
+
+    # Fonctions appelées avec les sections modifiées après chaque commit
+    _commit_listeners = []
+
+    @classmethod
+    def on_commit(cls, callback):
+        cls._commit_listeners.append(callback)
+        return callback
+
+    @classmethod
+    def mark_changed(cls, *sections):
+        """Attribue une nouvelle version aux sections modifiées, dans la transaction en cours.
+
+        L'UPDATE atomique du compteur global garantit des versions strictement
+        croissantes même avec plusieurs processus.
+        """
+        updated = cls.query.filter_by(section=cls.GLOBAL).update({cls.version: cls.version + 1})
+        if not updated:
+            db.session.add(cls(section=cls.GLOBAL, version=1))
+            db.session.flush()
+        version = db.session.get(cls, cls.GLOBAL, populate_existing=True).version
+        db.session.info.setdefault('changed_sections', set()).update(sections)
+
+        for section in sections:
+            row = db.session.get(cls, section)
+            if row is None:
+                db.session.add(cls(section=section, version=version))
+            else:
+                row.version = version
+        return version
+
+    @classmethod
+    def get_versions(cls):
+        """Retourne {section: version}, 0 pour une section jamais modifiée"""
+        versions = dict.fromkeys(cls.SECTIONS + (cls.GLOBAL,), 0)
+        versions.update(db.session.query(cls.section, cls.version).all())
+        return versions
+
+    @classmethod
+    def changed_since(cls, versions, since):
+        return [section for section in cls.SECTIONS if versions[section] > since]
+
+@event.listens_for(db.session, 'after_commit')
+def _notify_data_changes(session):
+    sections = session.info.pop('changed_sections', None)
+    if sections:
+        for callback in DataVersion._commit_listeners:
+            callback(frozenset(sections))
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_data_changes(session):
+    session.info.pop('changed_sections', None)
@@ -0,0 +1,87 @@
+import gzip
+import threading
+import time
+from flask import Response
+
+
+class CachedPage:
+    __slots__ = ('body', 'gzip_body', 'render_time', 'expires_at')
+
+    def __init__(self, body, render_time, expires_at=None):
+        self.body = body.encode('utf-8')
+        self.gzip_body = gzip.compress(self.body, compresslevel=6)
+        self.render_time = render_time
+        self.expires_at = expires_at
+
+
+class PageCache:
+    """Cache du HTML rendu, avec une version compressée préparée à l'avance.
+
+    Les clés sont construites par l'appelant à partir de données déjà en mémoire :
+    un succès ne fait aucune requête en base. Toute écriture dans ce processus vide
+    le cache ; les écritures des autres workers changent la clé (version des données).
+    Une page rendue avec une valeur de repli (API lente ou en panne) est conservée
+    ttl secondes seulement, pour reprendre les vraies données dès leur retour.
+    """
+
+    def __init__(self, max_entries=8):
+        self.max_entries = max_entries
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.render_time_saved = 0.0
+        self.render_time_total = 0.0
+
+    def get(self, key):
+        page = self._entries.get(key)
+        with self._lock:
+            if page is not None and page.expires_at is not None and page.expires_at <= time.monotonic():
+                if self._entries.get(key) is page:
+                    del self._entries[key]
+                page = None
+            if page is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.render_time_saved += page.render_time
+        return page
+
+    def put(self, key, body, render_time, ttl=None):
+        page = CachedPage(body, render_time, time.monotonic() + ttl if ttl is not None else None)
+        with self._lock:
+            self.render_time_total += render_time
+            if len(self._entries) >= self.max_entries:
+                self._entries.clear()
+            self._entries[key] = page
+        return page
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+
+    def response(self, page, request, status='MISS'):
+        if 'gzip' in request.accept_encodings:
+            response = Response(page.gzip_body, mimetype='text/html')
+            response.headers['Content-Encoding'] = 'gzip'
+        else:
+            response = Response(page.body, mimetype='text/html')
+        response.headers['Vary'] = 'Accept-Encoding'
+        response.headers['X-Cache'] = status
+        return response
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            renders = self.misses or 1
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else None,
+                'avg_render_ms': round(self.render_time_total / renders * 1000, 1),
+                'render_time_saved_s': round(self.render_time_saved, 3),
+            }
+
+
+home_page_cache = PageCache()
@@ -0,0 +1,254 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import secrets
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from flask import request
+from flask_login import current_user
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from extensions import logger
+
+PROFILE_FLAG_HEADER = 'X-Profile'
+PROFILE_FLAG_ARG = 'profile'
+
+
+class RequestTrace:
+    """État d'une requête suivie : requêtes SQL ordonnées, profil cProfile ou pile échantillonnée"""
+
+    def __init__(self, mode):
+        self.mode = mode
+        self.start = time.perf_counter()
+        self.started_at = time.time()
+        self.status = None
+        self.sql = []
+        self.sql_start = None
+        self.profile = None
+        self.samples = Counter()
+
+
+class RequestProfiler:
+    """Profilage à la demande et capture automatique des requêtes lentes.
+
+    - un administrateur ajoute ?profile=1 (ou l'en-tête X-Profile: 1) : la requête
+      est profilée avec cProfile et ses requêtes SQL sont tracées ;
+    - toutes les requêtes sont échantillonnées par un thread unique (piles des threads
+      en cours toutes les sample_interval secondes) ; seules celles qui dépassent
+      slow_threshold sont enregistrées, avec leurs requêtes SQL.
+
+    Les résultats sont écrits dans PROFILE_DIR et téléchargeables depuis l'administration.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.directory = None
+        self.slow_threshold = 1.0
+        self.sample_interval = 0.005
+        self.max_files = 50
+        self.excluded_endpoints = {'static', 'stream'}
+        self._local = threading.local()
+        self._active = {}
+        self._lock = threading.Lock()
+        self._cprofile_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._sampler_pid = None
+
+    def init_app(self, app):
+        self.enabled = app.config['PROFILER_ENABLED']
+        self.directory = app.config['PROFILE_DIR']
+        self.slow_threshold = app.config['PROFILE_SLOW_THRESHOLD']
+        self.sample_interval = app.config['PROFILE_SAMPLE_INTERVAL']
+        self.max_files = app.config['PROFILE_MAX_FILES']
+        if not self.enabled:
+            return
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    def list_profiles(self):
+        """Profils enregistrés, du plus récent au plus ancien (métadonnées seulement)"""
+        profiles = []
+        for name in self._files('.json'):
+            try:
+                with open(os.path.join(self.directory, name), encoding='utf-8') as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            data.pop('sql', None)
+            data.pop('stats', None)
+            data.pop('stacks', None)
+            profiles.append(data)
+        return sorted(profiles, key=lambda p: p['created'], reverse=True)
+
+    def path(self, profile_id, extension='.json'):
+        """Chemin du fichier d'un profil, ou None si l'identifiant est invalide ou inconnu"""
+        if not self.directory or not profile_id.replace('-', '').replace('_', '').isalnum():
+            return None
+        path = os.path.join(self.directory, profile_id + extension)
+        return path if os.path.isfile(path) else None
+
+    # Cycle de vie de la requête
+
+    def _before_request(self):
+        self._local.trace = None
+        if request.endpoint in self.excluded_endpoints:
+            return
+        trace = None
+        if self._requested() and self._cprofile_lock.acquire(blocking=False):
+            # Un seul cProfile actif à la fois par processus ; les autres requêtes restent échantillonnées
+            trace = RequestTrace('cprofile')
+            trace.profile = cProfile.Profile()
+            trace.profile.enable()
+        elif self.slow_threshold > 0:
+            trace = RequestTrace('sample')
+            self._ensure_sampler()
+            with self._lock:
+                self._active[threading.get_ident()] = trace
+            self._wake.set()
+        self._local.trace = trace
+
+    def _after_request(self, response):
+        trace = getattr(self._local, 'trace', None)
+        if trace is not None:
+            trace.status = response.status_code
+        return response
+
+    def _teardown_request(self, exc):
+        trace = getattr(self._local, 'trace', None)
+        if trace is None:
+            return
+        self._local.trace = None
+        duration = time.perf_counter() - trace.start
+        if trace.mode == 'cprofile':
+            trace.profile.disable()
+            self._cprofile_lock.release()
+        else:
+            with self._lock:
+                self._active.pop(threading.get_ident(), None)
+            if duration < self.slow_threshold:
+                return
+        try:
+            self._save(trace, duration, 500 if exc is not None and trace.status is None else trace.status)
+        except (OSError, TypeError, ValueError) as e:
+            logger.error(f"Impossible d'enregistrer le profil de {request.path}: {e}")
+
+    def _requested(self):
+        flag = request.headers.get(PROFILE_FLAG_HEADER) or request.args.get(PROFILE_FLAG_ARG)
+        if flag != '1':
+            return False
+        return current_user.is_authenticated and current_user.role == 'admin'
+
+    # Trace SQL : instructions dans l'ordre d'exécution, sans les paramètres (mots de passe, etc.)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        trace = getattr(self._local, 'trace', None)
+        if trace is not None:
+            trace.sql_start = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        trace = getattr(self._local, 'trace', None)
+        if trace is not None and trace.sql_start is not None:
+            end = time.perf_counter()
+            trace.sql.append({
+                'offset_ms': round((trace.sql_start - trace.start) * 1000, 2),
+                'duration_ms': round((end - trace.sql_start) * 1000, 3),
+                'statement': statement,
+                'executemany': executemany,
+            })
+            trace.sql_start = None
+
+    # Échantillonnage statistique
+
+    def _ensure_sampler(self):
+        if self._sampler_pid == os.getpid():
+            return
+        with self._lock:
+            if self._sampler_pid == os.getpid():
+                return
+            self._sampler_pid = os.getpid()
+            threading.Thread(target=self._sample_loop, name='educinfo-profiler', daemon=True).start()
+
+    def _sample_loop(self):
+        while True:
+            with self._lock:
+                active = dict(self._active)
+            if not active:
+                self._wake.wait()
+                self._wake.clear()
+                continue
+            frames = sys._current_frames()
+            for ident, trace in active.items():
+                frame = frames.get(ident)
+                if frame is not None:
+                    trace.samples[self._collapse(frame)] += 1
+            time.sleep(self.sample_interval)
+
+    @staticmethod
+    def _collapse(frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        return ';'.join(reversed(stack))
+
+    # Stockage
+
+    def _save(self, trace, duration, status):
+        created = datetime.fromtimestamp(trace.started_at)
+        endpoint = request.endpoint or 'unmatched'
+        profile_id = f"{created:%Y%m%d-%H%M%S}-{endpoint}-{secrets.token_hex(3)}"
+        data = {
+            'id': profile_id,
+            'created': created.isoformat(timespec='seconds'),
+            'mode': trace.mode,
+            'method': request.method,
+            'path': request.full_path.rstrip('?'),
+            'endpoint': endpoint,
+            'status': status,
+            'duration_ms': round(duration * 1000, 1),
+            'sql_count': len(trace.sql),
+            'sql_time_ms': round(sum(q['duration_ms'] for q in trace.sql), 2),
+            'sql': trace.sql,
+        }
+        os.makedirs(self.directory, exist_ok=True)
+        if trace.mode == 'cprofile':
+            text = io.StringIO()
+            stats = pstats.Stats(trace.profile, stream=text)
+            stats.sort_stats('cumulative').print_stats(40)
+            data['stats'] = text.getvalue()
+            stats.dump_stats(os.path.join(self.directory, profile_id + '.prof'))
+        else:
+            # Format « piles repliées » : lisible par flamegraph.pl / speedscope
+            data['sample_interval_ms'] = self.sample_interval * 1000
+            data['stacks'] = [f"{stack} {count}" for stack, count in trace.samples.most_common()]
+        with open(os.path.join(self.directory, profile_id + '.json'), 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=1)
+        logger.info(f"Profil {trace.mode} enregistré : {data['path']} en {data['duration_ms']} ms ({profile_id})")
+        self._prune()
+
+    def _files(self, extension):
+        if not self.directory or not os.path.isdir(self.directory):
+            return []
+        return [name for name in os.listdir(self.directory) if name.endswith(extension)]
+
+    def _prune(self):
+        names = sorted(self._files('.json'))
+        for name in names[:max(0, len(names) - self.max_files)]:
+            base = os.path.join(self.directory, name[:-len('.json')])
+            for extension in ('.json', '.prof'):
+                try:
+                    os.unlink(base + extension)
+                except FileNotFoundError:
+                    pass
+
+
+profiler = RequestProfiler()
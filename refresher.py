@@ -0,0 +1,172 @@
+import os
+import threading
+import time
+from extensions import logger
+
+try:
+    import fcntl
+except ImportError:  # Windows : un seul processus, toujours propriétaire
+    fcntl = None
+
+
+class RefreshJob:
+    """Tâche périodique alimentant une entrée de l'instantané"""
+
+    def __init__(self, name, interval, func, single_owner=False):
+        self.name = name
+        self.interval = interval
+        self.func = func
+        self.single_owner = single_owner
+        self.next_run = 0.0
+        self.last_run = None
+        self.last_success = None
+        self.last_error = None
+        self.failures = 0
+
+
+class Refresher:
+    """Rafraîchit les données externes en arrière-plan dans un instantané en mémoire.
+
+    Les routes ne lisent que l'instantané : une API lente ou en panne ne bloque
+    jamais le rendu d'une page.
+
+    Les tâches single_owner (écritures partagées : purge, fichiers communs) ne
+    tournent que dans un processus, celui qui détient le verrou owner_lock_path.
+    Le verrou est libéré par le système à la fin du processus : un autre worker
+    le reprend à son prochain passage.
+    """
+
+    def __init__(self):
+        self._jobs = {}
+        self._snapshot = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._owner_file = None
+        self._owner_pid = None
+        self.owner_lock_path = None
+        self.app = None
+
+    def configure(self, config):
+        self.owner_lock_path = config['REFRESH_OWNER_LOCK']
+
+    def add_job(self, name, interval, func, single_owner=False):
+        self._jobs[name] = RefreshJob(name, interval, func, single_owner)
+
+    def ensure_started(self, app):
+        """Démarre le thread une fois par processus (y compris après un fork)"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self.app = app
+            self._pid = os.getpid()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='educinfo-refresher', daemon=True)
+            self._thread.start()
+            logger.info(f"Rafraîchissement en arrière-plan démarré ({', '.join(self._jobs)})")
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def trigger(self, name):
+        """Demande l'exécution immédiate d'une tâche (ex: après un changement de configuration)"""
+        job = self._jobs.get(name)
+        if job:
+            job.next_run = 0.0
+            self._wake.set()
+
+    def get(self, name, default=None):
+        entry = self._snapshot.get(name)
+        return entry[0] if entry else default
+
+    def set(self, name, value):
+        # L'horodatage ne change que si le contenu change
+        entry = self._snapshot.get(name)
+        if entry is None or entry[0] != value:
+            self._snapshot[name] = (value, time.time())
+
+    def updated_at(self, name):
+        entry = self._snapshot.get(name)
+        return entry[1] if entry else None
+
+    def is_owner(self):
+        """Vrai si ce processus exécute les tâches single_owner (tentative non bloquante)"""
+        if self._owner_pid == os.getpid():
+            return True
+        if fcntl is None or not self.owner_lock_path:
+            self._owner_pid = os.getpid()
+            return True
+        try:
+            os.makedirs(os.path.dirname(self.owner_lock_path) or '.', exist_ok=True)
+            owner_file = open(self.owner_lock_path, 'a')
+        except OSError as e:
+            logger.error(f"Verrou des tâches partagées inaccessible: {e}")
+            return False
+        try:
+            fcntl.flock(owner_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            owner_file.close()
+            return False
+        # Conservé ouvert jusqu'à la fin du processus
+        self._owner_file, self._owner_pid = owner_file, os.getpid()
+        logger.info(f"Processus {os.getpid()} propriétaire des tâches partagées")
+        return True
+
+    def last_success(self, name):
+        job = self._jobs.get(name)
+        return job.last_success if job else None
+
+    def status(self):
+        now = time.time()
+        stale_factor = self.app.config['REFRESH_STALE_FACTOR'] if self.app else 3
+        owner = self._owner_pid == os.getpid()
+        jobs = []
+        for job in self._jobs.values():
+            age = now - job.last_success if job.last_success else None
+            # Tâche exécutée par un autre worker : pas d'âge significatif ici
+            delegated = job.single_owner and not owner
+            jobs.append({
+                'name': job.name,
+                'interval': job.interval,
+                'last_run': job.last_run,
+                'last_success': job.last_success,
+                'age': round(age, 1) if age is not None else None,
+                'stale': not delegated and (age is None or age > job.interval * stale_factor),
+                'single_owner': job.single_owner,
+                'failures': job.failures,
+                'last_error': job.last_error
+            })
+        return {'running': bool(self._thread and self._thread.is_alive()), 'owner': owner, 'jobs': jobs}
+
+    def _run(self):
+        while not self._stop.is_set():
+            for job in list(self._jobs.values()):
+                if job.next_run <= time.monotonic():
+                    self._run_job(job)
+            delay = min((j.next_run for j in self._jobs.values()), default=60) - time.monotonic()
+            self._wake.wait(max(delay, 0.5))
+            self._wake.clear()
+
+    def _run_job(self, job):
+        job.next_run = time.monotonic() + job.interval
+        if job.single_owner and not self.is_owner():
+            return
+        job.last_run = time.time()
+        try:
+            with self.app.app_context():
+                self.set(job.name, job.func())
+            job.last_success = time.time()
+            job.last_error = None
+            job.failures = 0
+        except Exception as e:
+            job.failures += 1
+            job.last_error = str(e)
+            logger.error(f"Erreur de rafraîchissement '{job.name}': {e}")
+
+
+refresher = Refresher()
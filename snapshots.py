@@ -0,0 +1,93 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from extensions import logger
+
+
+class SnapshotStore:
+    """Dernières réponses valides des API externes, conservées sur disque.
+
+    Chaque écriture passe par un fichier temporaire renommé (remplacement atomique) :
+    un arrêt brutal ou un autre worker ne peut jamais lire un fichier à moitié écrit.
+    Les fichiers sont relus au premier accès après un redémarrage, ce qui permet
+    d'afficher des données immédiatement, avant le premier appel réussi. La copie en
+    mémoire est associée à l'identité du fichier (inode, date, taille) : un fichier
+    remplacé par un autre worker est relu au prochain accès.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._memory = {}
+
+    def configure(self, config):
+        self.directory = config['SNAPSHOT_DIR']
+        self._memory = {}
+
+    def save(self, kind, key, payload):
+        entry = {'kind': kind, 'key': key, 'saved_at': time.time(), 'payload': payload}
+        if not self.directory:
+            with self._lock:
+                self._memory[(kind, key)] = (entry, None)
+            return
+        path = self._path(kind, key)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.tmp-', suffix='.json')
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump(entry, f, ensure_ascii=False)
+                    f.flush()
+                    os.fsync(f.fileno())
+                    signature = _signature(os.fstat(f.fileno()))
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except OSError as e:
+            signature = None
+            logger.error(f"Impossible d'enregistrer l'instantané {kind}/{key}: {e}")
+        with self._lock:
+            self._memory[(kind, key)] = (entry, signature)
+
+    def load(self, kind, key):
+        """Retourne (données, horodatage de la sauvegarde) ou None"""
+        cached = self._memory.get((kind, key))
+        entry = cached[0] if cached else None
+        if self.directory:
+            path = self._path(kind, key)
+            try:
+                signature = _signature(os.stat(path))
+            except OSError:
+                signature = None
+            # Copie en mémoire à jour, ou fichier absent (écriture impossible) : pas de lecture
+            if signature is not None and (cached is None or cached[1] != signature):
+                try:
+                    with open(path, encoding='utf-8') as f:
+                        entry = json.load(f)
+                        signature = _signature(os.fstat(f.fileno()))
+                except FileNotFoundError:
+                    pass
+                except (OSError, ValueError) as e:
+                    logger.warning(f"Instantané {kind}/{key} illisible: {e}")
+                else:
+                    with self._lock:
+                        self._memory[(kind, key)] = (entry, signature)
+        if entry is None:
+            return None
+        return entry['payload'], entry['saved_at']
+
+    def _path(self, kind, key):
+        digest = hashlib.sha1(str(key).encode('utf-8')).hexdigest()[:16]
+        return os.path.join(self.directory, f"{kind}-{digest}.json")
+
+
+def _signature(stat):
+    # os.replace donne un nouvel inode à chaque écriture
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+snapshot_store = SnapshotStore()
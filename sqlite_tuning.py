@@ -0,0 +1,110 @@
+import threading
+import time
+from functools import wraps
+from sqlalchemy import create_engine, event
+from extensions import db, logger
+
+_WRITE_STATEMENTS = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+
+class SQLiteTuning:
+    """Profil de performance SQLite (optionnel, SQLITE_PERFORMANCE_MODE=1).
+
+    - WAL, synchronous=NORMAL, cache et mmap agrandis, busy_timeout sur chaque connexion ;
+    - un second pool en lecture seule (query_only) pour les routes d'affichage : avec WAL,
+      leurs lectures ne sont jamais bloquées par une écriture en cours ;
+    - les transactions d'écriture sont sérialisées par SQLite : BEGIN IMMEDIATE juste avant
+      la première écriture, au lieu du BEGIN différé implicite. Un écrivain attend son tour
+      (busy_timeout) au lieu d'échouer sur « database is locked » lors de la promotion du
+      verrou, et le verrou n'est tenu que du premier INSERT/UPDATE/DELETE au commit.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.read_engine = None
+        self.pragmas = {}
+        self._lock = threading.Lock()
+        self.writes = 0
+        self.write_wait_total = 0.0
+        self.write_wait_max = 0.0
+
+    def init_app(self, app):
+        uri = app.config['SQLALCHEMY_DATABASE_URI']
+        if not app.config['SQLITE_PERFORMANCE_MODE'] or not uri.startswith('sqlite'):
+            return
+        self.enabled = True
+        self.pragmas = {
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',
+            'busy_timeout': app.config['SQLITE_BUSY_TIMEOUT_MS'],
+            'cache_size': -app.config['SQLITE_CACHE_SIZE_KB'],
+            'mmap_size': app.config['SQLITE_MMAP_SIZE'],
+            'temp_store': 'MEMORY',
+        }
+        with app.app_context():
+            write_engine = db.engine
+            event.listen(write_engine, 'connect', self._configure_connection)
+            event.listen(write_engine, 'before_cursor_execute', self._begin_immediate)
+            self.read_engine = create_engine(
+                write_engine.url,
+                pool_size=app.config['SQLITE_READ_POOL_SIZE'],
+                max_overflow=0,
+                pool_timeout=app.config['SQLITE_BUSY_TIMEOUT_MS'] / 1000,
+                connect_args={'check_same_thread': False}
+            )
+            event.listen(self.read_engine, 'connect', self._configure_read_connection)
+        app.extensions['sqlite_read_engine'] = self.read_engine
+        logger.info(f"Mode performance SQLite activé ({write_engine.url.database})")
+
+    def dispose(self, close=True):
+        if self.read_engine is not None:
+            self.read_engine.dispose(close=close)
+
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'pragmas': self.pragmas,
+            'write_transactions': self.writes,
+            'avg_write_wait_ms': round(self.write_wait_total / self.writes * 1000, 2) if self.writes else None,
+            'max_write_wait_ms': round(self.write_wait_max * 1000, 2),
+            'read_pool': self.read_engine.pool.status() if self.read_engine is not None else None,
+        }
+
+    def _configure_connection(self, dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in self.pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+    def _configure_read_connection(self, dbapi_connection, connection_record):
+        self._configure_connection(dbapi_connection, connection_record)
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA query_only=ON")
+        cursor.close()
+
+    def _begin_immediate(self, conn, cursor, statement, parameters, context, executemany):
+        if not statement.lstrip()[:7].upper().startswith(_WRITE_STATEMENTS):
+            return
+        if conn.connection.dbapi_connection.in_transaction:
+            return
+        start = time.perf_counter()
+        cursor.execute('BEGIN IMMEDIATE')
+        waited = time.perf_counter() - start
+        with self._lock:
+            self.writes += 1
+            self.write_wait_total += waited
+            self.write_wait_max = max(self.write_wait_max, waited)
+
+
+sqlite_tuning = SQLiteTuning()
+
+
+def read_only(view):
+    """Route d'affichage : ses lectures passent par le pool en lecture seule"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if sqlite_tuning.enabled:
+            db.session.info['read_only'] = True
+        return view(*args, **kwargs)
+    return wrapper
+
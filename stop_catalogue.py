@@ -0,0 +1,287 @@
+import bisect
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter
+from flask import current_app
+from extensions import logger
+from http_client import upstream
+from snapshots import snapshot_store
+
+_SEPARATORS = re.compile(r'[^a-z0-9]+')
+
+
+def normalize(text):
+    """Minuscules sans accents ni ponctuation : « Étoile-Bourse » devient « etoile bourse »"""
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    stripped = ''.join(c for c in decomposed if not unicodedata.combining(c))
+    return ' '.join(_SEPARATORS.split(stripped.lower())).strip()
+
+
+def trigrams(key):
+    padded = f" {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class StopEntry:
+    """Arrêt logique (toutes directions) et ses points d'arrêt (un par quai)"""
+
+    __slots__ = ('code', 'name', 'key', 'tokens', 'stop_codes', 'lines', 'modes', 'latitude', 'longitude')
+
+    def __init__(self, code, name, stop_codes, lines, modes, latitude=None, longitude=None):
+        self.code = code
+        self.name = name
+        self.key = normalize(name)
+        self.tokens = tuple(self.key.split())
+        self.stop_codes = tuple(stop_codes)
+        self.lines = tuple(lines)
+        self.modes = frozenset(modes)
+        self.latitude = latitude
+        self.longitude = longitude
+
+    def as_dict(self):
+        return {
+            'code': self.code,
+            'name': self.name,
+            'stop_codes': list(self.stop_codes),
+            'lines': list(self.lines),
+            'modes': sorted(self.modes),
+            'latitude': self.latitude,
+            'longitude': self.longitude,
+        }
+
+
+class StopIndex:
+    """Index en mémoire, immuable une fois construit (remplacé en bloc à chaque rafraîchissement).
+
+    - codes : dictionnaire code de quai / code logique -> arrêt ;
+    - préfixes : liste triée des mots des noms normalisés, parcourue par dichotomie ;
+    - approximatif : trigrammes des noms, pour les fautes de frappe.
+    """
+
+    def __init__(self, stops, lines):
+        self.stops = sorted(stops, key=lambda stop: stop.key)
+        self.lines = lines
+        self._by_code = {}
+        words = []
+        self._trigrams = {}
+        self._trigram_counts = []
+        for position, stop in enumerate(self.stops):
+            self._by_code[stop.code] = stop
+            for stop_code in stop.stop_codes:
+                self._by_code[stop_code] = stop
+            for token in set(stop.tokens):
+                words.append((token, position))
+            stop_trigrams = trigrams(stop.key)
+            self._trigram_counts.append(len(stop_trigrams))
+            for trigram in stop_trigrams:
+                self._trigrams.setdefault(trigram, []).append(position)
+        words.sort()
+        self._words = [word for word, _ in words]
+        self._word_stops = [position for _, position in words]
+
+    @classmethod
+    def from_discovery(cls, stop_points, lines):
+        """Construit l'index à partir des réponses stoppoints-discovery et lines-discovery"""
+        line_info = {}
+        for line in lines.get('LinesDelivery', {}).get('AnnotatedLineRef') or []:
+            extension = line.get('Extension') or {}
+            line_info[line['LineRef']] = {
+                'name': line.get('LineName') or line['LineRef'],
+                'mode': extension.get('RouteType') or 'undefined',
+                'color': extension.get('RouteColor'),
+                'text_color': extension.get('RouteTextColor'),
+            }
+
+        grouped = {}
+        for point in stop_points.get('StopPointsDelivery', {}).get('AnnotatedStopPointRef') or []:
+            extension = point.get('Extension') or {}
+            stop_code = extension.get('StopCode') or point.get('StopPointRef')
+            if not stop_code:
+                continue
+            code = extension.get('LogicalStopCode') or stop_code
+            entry = grouped.setdefault(code, {'name': point.get('StopName') or code, 'stop_codes': [],
+                                              'lines': [], 'modes': set(), 'location': point.get('Location') or {}})
+            if stop_code not in entry['stop_codes']:
+                entry['stop_codes'].append(stop_code)
+            for line in point.get('Lines') or []:
+                ref = line.get('LineRef')
+                if ref and ref not in entry['lines']:
+                    entry['lines'].append(ref)
+                mode = (line.get('Extension') or {}).get('RouteType') or line_info.get(ref, {}).get('mode')
+                if mode and mode != 'undefined':
+                    entry['modes'].add(mode)
+
+        stops = [
+            StopEntry(code, entry['name'], sorted(entry['stop_codes']), entry['lines'], entry['modes'],
+                      entry['location'].get('Latitude'), entry['location'].get('Longitude'))
+            for code, entry in grouped.items()
+        ]
+        return cls(stops, line_info)
+
+    @classmethod
+    def from_payload(cls, payload):
+        stops = [StopEntry(s['code'], s['name'], s['stop_codes'], s['lines'], s['modes'],
+                           s.get('latitude'), s.get('longitude')) for s in payload['stops']]
+        return cls(stops, payload['lines'])
+
+    def to_payload(self):
+        return {'stops': [stop.as_dict() for stop in self.stops], 'lines': self.lines}
+
+    def get(self, code):
+        return self._by_code.get((code or '').strip())
+
+    def search(self, query, line=None, mode=None, limit=10):
+        """Arrêts dont chaque mot de la recherche commence un mot du nom, complétés par une recherche approximative"""
+        def accepted(stop):
+            return (not line or line in stop.lines) and (not mode or mode in stop.modes)
+
+        key = normalize(query)
+        if not key:
+            return [stop for stop in self.stops if accepted(stop)][:limit]
+
+        exact = self.get(query)
+        results = [exact] if exact is not None and accepted(exact) else []
+        tokens = key.split()
+        for position in self._prefix_positions(max(tokens, key=len)):
+            stop = self.stops[position]
+            if stop in results or not accepted(stop):
+                continue
+            if all(any(word.startswith(token) for word in stop.tokens) for token in tokens):
+                results.append(stop)
+        # Noms commençant par la recherche en premier, puis ordre alphabétique
+        results.sort(key=lambda stop: (stop is not exact, not stop.key.startswith(key), stop.key))
+
+        if len(results) < limit and len(key) >= 3:
+            results.extend(self._fuzzy(key, accepted, set(results), limit - len(results)))
+        return results[:limit]
+
+    def _prefix_positions(self, token):
+        start = bisect.bisect_left(self._words, token)
+        end = bisect.bisect_left(self._words, token + '\uffff', start)
+        return set(self._word_stops[start:end])
+
+    def _fuzzy(self, key, accepted, excluded, limit, threshold=0.5):
+        query_trigrams = trigrams(key)
+        shared = Counter()
+        for trigram in query_trigrams:
+            shared.update(self._trigrams.get(trigram, ()))
+        scored = []
+        for position, count in shared.items():
+            stop = self.stops[position]
+            # Part des trigrammes de la recherche présents dans le nom, puis indice de Jaccard (noms courts d'abord)
+            coverage = count / len(query_trigrams)
+            if coverage >= threshold and stop not in excluded and accepted(stop):
+                jaccard = count / (len(query_trigrams) + self._trigram_counts[position] - count)
+                scored.append((-coverage, -jaccard, stop.key, position))
+        scored.sort()
+        return [self.stops[entry[-1]] for entry in scored[:limit]]
+
+
+class StopCatalogue:
+    """Catalogue des arrêts et lignes CTS, recherché localement sans appel réseau.
+
+    Alimenté par une tâche de fond (stoppoints-discovery et lines-discovery), conservé
+    sur disque par snapshot_store : un redémarrage ou un nouveau worker dispose du
+    catalogue immédiatement, et ne le redemande que lorsqu'il a plus de max_age secondes.
+    Seul le worker propriétaire interroge l'API ; les autres relisent le catalogue enregistré
+    quand le leur a plus de max_age secondes. Sans catalogue enregistré (ou sans version plus
+    récente), le disque n'est relu qu'après missing_retry secondes : les recherches et
+    validations restent sans entrée/sortie en attendant le rafraîchissement.
+    """
+
+    missing_retry = 30
+
+    def __init__(self):
+        self.max_age = 86400
+        self._index = None
+        self._loaded_at = None
+        self._missing_at = None
+        self._lock = threading.Lock()
+        self.searches = 0
+        self.refreshes = 0
+
+    def configure(self, config):
+        self.max_age = config['CTS_CATALOGUE_MAX_AGE']
+
+    @property
+    def index(self):
+        if self._should_load():
+            with self._lock:
+                if self._should_load():
+                    self._load_persisted()
+        return self._index
+
+    def _is_fresh(self):
+        return self._index is not None and time.time() - self._loaded_at < self.max_age
+
+    def _should_load(self):
+        if self._is_fresh():
+            return False
+        return self._missing_at is None or time.monotonic() - self._missing_at >= self.missing_retry
+
+    def search(self, query, line=None, mode=None, limit=10):
+        index = self.index
+        self.searches += 1
+        return index.search(query, line, mode, limit) if index else []
+
+    def get(self, code):
+        index = self.index
+        return index.get(code) if index else None
+
+    def is_known(self, code):
+        """True/False si le catalogue est chargé, None s'il ne l'a jamais été (validation impossible)"""
+        index = self.index
+        return None if index is None else index.get(code) is not None
+
+    def is_known_line(self, line_ref):
+        index = self.index
+        return None if index is None else line_ref in index.lines
+
+    def refresh(self, api_token, force=False):
+        """Tâche de fond : recharge le catalogue depuis l'API s'il est absent ou trop ancien"""
+        index = self.index
+        if not force and index is not None and time.time() - self._loaded_at < self.max_age:
+            return self._summary()
+        base_url = current_app.config['CTS_BASE_URL']
+        responses = {}
+        for name, params in (('stoppoints-discovery', {'includeLinesDestinations': 'true'}),
+                             ('lines-discovery', {})):
+            response = upstream.get(f"{base_url}/v1/siri/2.0/{name}", params=params, auth=(api_token, ""))
+            response.raise_for_status()
+            responses[name] = response.json()
+        index = StopIndex.from_discovery(responses['stoppoints-discovery'], responses['lines-discovery'])
+        if not index.stops:
+            raise ValueError("Catalogue CTS vide, index précédent conservé")
+        snapshot_store.save('cts_catalogue', 'index', index.to_payload())
+        with self._lock:
+            self._index, self._loaded_at = index, time.time()
+            self.refreshes += 1
+        logger.info(f"Catalogue CTS : {len(index.stops)} arrêts, {len(index.lines)} lignes")
+        return self._summary()
+
+    def stats(self):
+        return dict(self._summary(), searches=self.searches, refreshes=self.refreshes)
+
+    def _summary(self):
+        index = self._index
+        return {
+            'stops': len(index.stops) if index else 0,
+            'lines': len(index.lines) if index else 0,
+            'loaded_at': self._loaded_at,
+        }
+
+    def _load_persisted(self):
+        persisted = snapshot_store.load('cts_catalogue', 'index')
+        if persisted is not None and (self._loaded_at is None or persisted[1] > self._loaded_at):
+            try:
+                self._index = StopIndex.from_payload(persisted[0])
+                self._loaded_at = persisted[1]
+            except (KeyError, TypeError) as e:
+                logger.warning(f"Catalogue CTS enregistré illisible: {e}")
+        if not self._is_fresh():
+            self._missing_at = time.monotonic()
+
+
+stop_catalogue = StopCatalogue()
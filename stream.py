@@ -0,0 +1,82 @@
+import json
+import queue
+import threading
+from extensions import logger
+
+
+class Broadcaster:
+    """Diffuse les changements de l'affichage aux écrans connectés en Server-Sent Events.
+
+    Chaque processus surveille la version en base (voir la tâche 'display' du
+    rafraîchissement) : plusieurs workers derrière la même base diffusent donc
+    les mêmes changements, quel que soit le worker ayant reçu l'écriture.
+    max_connections s'entend par worker ; une connexion refusée reçoit 503 et
+    l'écran revient au sondage de /get_updates.
+    """
+
+    def __init__(self, max_connections=50):
+        self.max_connections = max_connections
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self.last_event_id = None
+        self.published = 0
+        self.rejected = 0
+
+    def configure(self, config):
+        # Avec des workers à threads, chaque connexion SSE retient un thread : le plafond reste sous WEB_THREADS
+        limit = max(1, config['WEB_THREADS'] - config['STREAM_FREE_THREADS'])
+        self.max_connections = min(config['STREAM_MAX_CONNECTIONS'], limit)
+        if config['STREAM_MAX_CONNECTIONS'] > limit:
+            logger.warning(f"STREAM_MAX_CONNECTIONS ramené à {limit} : chaque connexion SSE occupe un des "
+                           f"{config['WEB_THREADS']} threads du worker")
+
+    def subscribe(self):
+        """Retourne une file d'événements, ou None si le worker est saturé"""
+        with self._lock:
+            if len(self._subscribers) >= self.max_connections:
+                self.rejected += 1
+                return None
+            subscriber = queue.Queue(maxsize=8)
+            self._subscribers.add(subscriber)
+            return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def publish(self, event_id):
+        """Notifie tous les abonnés si l'état affiché a changé"""
+        with self._lock:
+            if event_id == self.last_event_id:
+                return
+            self.last_event_id = event_id
+            self.published += 1
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(event_id)
+            except queue.Full:
+                # Un client lent n'a besoin que de la dernière version
+                try:
+                    subscriber.get_nowait()
+                    subscriber.put_nowait(event_id)
+                except (queue.Empty, queue.Full):
+                    pass
+
+    def stats(self):
+        with self._lock:
+            return {
+                'connections': len(self._subscribers),
+                'max_connections': self.max_connections,
+                'published': self.published,
+                'rejected': self.rejected,
+                'last_event_id': self.last_event_id,
+            }
+
+
+def format_event(event_id, event='update', data=None):
+    payload = json.dumps(data if data is not None else {'version': event_id})
+    return f"id: {event_id}\nevent: {event}\ndata: {payload}\n\n"
+
+
+broadcaster = Broadcaster()
@@ -0,0 +1,37 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# config.py lit l'environnement à l'import : base, instantanés et fichiers partagés dans un
+# dossier temporaire, sans tâches de fond ni API externe joignable
+_instance = tempfile.mkdtemp(prefix='educinfo-tests-')
+os.environ.update({
+    'DATABASE_URL': f"sqlite:///{os.path.join(_instance, 'educinfo.db')}",
+    'SNAPSHOT_DIR': os.path.join(_instance, 'snapshots'),
+    'REFRESH_ENABLED': '0',
+    'REFRESH_OWNER_LOCK': os.path.join(_instance, 'refresher.lock'),
+    'CTS_TIMETABLE_PATH': os.path.join(_instance, 'cts_timetable.bin'),
+    'METRICS_ENABLED': '0',
+    'METRICS_DIR': os.path.join(_instance, 'metrics'),
+    'PROFILE_DIR': os.path.join(_instance, 'profiles'),
+    'CTS_BASE_URL': 'http://127.0.0.1:9',
+    'WEATHER_API_URL': 'http://127.0.0.1:9/data/2.5/weather',
+    'UPSTREAM_MAX_RETRIES': '0',
+})
+
+
+@pytest.fixture(scope='session')
+def app():
+    from app import app as flask_app, initialize_database
+    initialize_database()
+    return flask_app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
@@ -0,0 +1,92 @@
+import threading
+import time
+
+import pytest
+
+from cache import TTLCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_entry_expires_after_its_ttl():
+    clock = FakeClock()
+    cache = TTLCache(clock=clock)
+    cache.set('a', 1, ttl=10)
+
+    clock.now = 9.9
+    assert cache.get('a') == 1
+    clock.now = 10
+    assert cache.get('a') is None
+    assert cache.stats()['expirations'] == 1
+
+
+def test_loader_ttl_zero_is_not_stored():
+    cache = TTLCache()
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return 'valeur', 0
+
+    assert cache.get_or_load('a', loader) == 'valeur'
+    assert cache.get_or_load('a', loader) == 'valeur'
+    assert len(calls) == 2
+
+
+def test_concurrent_misses_share_one_load():
+    cache = TTLCache()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def loader():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return 'valeur', 60
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_load('a', loader))) for _ in range(8)]
+    threads[0].start()
+    started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    # Les suiveurs attendent le chargement en cours
+    while cache.stats()['coalesced'] < 7:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert calls == [1]
+    assert results == ['valeur'] * 8
+    assert cache.stats()['coalesced'] == 7
+
+
+def test_loader_error_is_raised_and_not_cached():
+    cache = TTLCache()
+
+    def failing():
+        raise RuntimeError('API indisponible')
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_load('a', failing)
+    assert cache.get_or_load('a', lambda: ('ok', 60)) == 'ok'
+
+
+def test_eviction_prefers_expired_then_soonest():
+    clock = FakeClock()
+    cache = TTLCache(max_entries=2, clock=clock)
+    cache.set('court', 1, ttl=5)
+    cache.set('long', 2, ttl=50)
+    cache.set('nouveau', 3, ttl=20)
+
+    assert cache.get('court') is None
+    assert cache.get('long') == 2
+    assert cache.get('nouveau') == 3
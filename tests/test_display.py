@@ -0,0 +1,104 @@
+import time
+from datetime import date, timedelta
+
+import pytest
+
+import app as app_module
+from extensions import db
+from models import DataVersion, Event, WidgetConfig
+from page_cache import home_page_cache
+from refresher import refresher
+
+
+@pytest.fixture(scope='module', autouse=True)
+def events_shown(app):
+    """Les événements s'affichent à côté du menu de la cantine"""
+    with app.app_context():
+        WidgetConfig.query.first().show_menu_cantine = True
+        DataVersion.mark_changed('config')
+        db.session.commit()
+
+
+@pytest.fixture
+def home_cache(app):
+    """Accueil cachable : version de l'affichage connue, comme après le premier passage de la tâche de fond"""
+    with app.app_context():
+        refresher.set('display', app_module.refresh_display_version())
+    home_page_cache.invalidate()
+    yield home_page_cache
+    home_page_cache.invalidate()
+
+
+def cached_home_page(app):
+    with app.test_request_context('/'):
+        return home_page_cache.get(app_module.home_cache_key())
+
+
+def add_event(app, title):
+    with app.app_context():
+        db.session.add(Event(title=title, date=date.today() + timedelta(days=1), description=''))
+        DataVersion.mark_changed('events')
+        db.session.commit()
+
+
+def test_get_updates_returns_304_for_current_etag(client):
+    response = client.get('/get_updates')
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+    assert response.headers['Cache-Control'] == 'no-cache'
+
+    response = client.get('/get_updates', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.headers['ETag'] == etag
+    assert not response.data
+
+
+def test_get_updates_sends_changed_sections_after_a_write(app, client):
+    etag = client.get('/get_updates').headers['ETag']
+    add_event(app, 'Conseil de classe')
+
+    response = client.get('/get_updates', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    delta = response.get_json()
+    assert delta['reload'] is False
+    assert 'Conseil de classe' in delta['sections']['events']
+
+
+def test_get_updates_full_payload_without_etag(client):
+    payload = client.get('/get_updates').get_json()
+    assert {'absences', 'events', 'widget_config'} <= set(payload)
+
+
+def test_home_page_with_failing_widget_is_cached(app, client, home_cache, monkeypatch):
+    def failing_loaders(configs):
+        return {'en_erreur': (lambda: 1 / 0, None)}
+    monkeypatch.setattr(app_module, 'home_widget_loaders', failing_loaders)
+
+    assert client.get('/').headers['X-Cache'] == 'MISS'
+    assert client.get('/').headers['X-Cache'] == 'HIT'
+    page = cached_home_page(app)
+    assert page.expires_at is None
+
+
+def test_home_page_with_late_widget_is_cached_briefly(app, client, home_cache, monkeypatch):
+    def slow_loaders(configs):
+        return {'lent': (lambda: time.sleep(0.5), None)}
+    monkeypatch.setattr(app_module, 'home_widget_loaders', slow_loaders)
+    monkeypatch.setattr(app_module.home_fanout, 'deadline', 0.05)
+
+    assert client.get('/').headers['X-Cache'] == 'MISS'
+    assert client.get('/').headers['X-Cache'] == 'HIT'
+    page = cached_home_page(app)
+    assert page.expires_at - time.monotonic() <= app.config['HOME_CACHE_DEGRADED_TTL']
+
+
+def test_write_invalidates_cached_home_page(app, client, home_cache):
+    assert client.get('/').headers['X-Cache'] == 'MISS'
+    add_event(app, 'Sortie scolaire')
+    with app.app_context():
+        refresher.set('display', app_module.refresh_display_version())
+
+    response = client.get('/')
+    assert response.headers['X-Cache'] == 'MISS'
+    assert 'Sortie scolaire' in response.get_data(as_text=True)
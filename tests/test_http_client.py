@@ -0,0 +1,118 @@
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+from http_client import CircuitBreaker, CircuitOpenError, RetryBudget, UpstreamClient
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_breaker_opens_after_threshold_and_probes_once():
+    clock = FakeClock()
+    breaker = CircuitBreaker('api', failure_threshold=3, recovery_timeout=30, clock=clock)
+    for _ in range(3):
+        assert breaker.allow()
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+    clock.now = 30
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    # Un seul appel d'essai à la fois
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.failures == 0
+
+
+def test_breaker_failed_probe_reopens():
+    clock = FakeClock()
+    breaker = CircuitBreaker('api', failure_threshold=1, recovery_timeout=10, clock=clock)
+    breaker.record_failure()
+    clock.now = 10
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+
+def test_retry_budget_is_bounded():
+    budget = RetryBudget(ratio=0.5, max_tokens=2)
+    assert budget.withdraw()
+    assert budget.withdraw()
+    assert not budget.withdraw()
+    budget.deposit()
+    budget.deposit()
+    assert budget.withdraw()
+
+
+@pytest.fixture
+def stub_server():
+    """Serveur local répondant le statut demandé ; compte les requêtes reçues"""
+    state = {'status': 200, 'hits': 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            state['hits'] += 1
+            self.send_response(state['status'])
+            self.send_header('Content-Length', '2')
+            self.end_headers()
+            self.wfile.write(b'{}')
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    state['url'] = f"http://127.0.0.1:{server.server_port}/data/2.5/weather"
+    yield state
+    server.shutdown()
+    server.server_close()
+
+
+def make_client():
+    client = UpstreamClient()
+    client.max_retries = 0
+    client.breaker_threshold = 3
+    return client
+
+
+@pytest.mark.parametrize('status', [401, 403, 404, 500])
+def test_repeated_error_statuses_open_the_breaker(stub_server, status):
+    stub_server['status'] = status
+    client = make_client()
+    rejected = 0
+    for _ in range(6):
+        try:
+            client.get(stub_server['url'])
+        except CircuitOpenError:
+            rejected += 1
+
+    assert stub_server['hits'] == 3
+    assert rejected == 3
+    breaker = client.stats()['breakers']
+    assert [b['state'] for b in breaker.values()] == ['open']
+
+
+def test_success_resets_failure_count(stub_server):
+    client = make_client()
+    stub_server['status'] = 401
+    client.get(stub_server['url'])
+    client.get(stub_server['url'])
+    stub_server['status'] = 200
+    client.get(stub_server['url'])
+    stub_server['status'] = 401
+    client.get(stub_server['url'])
+    client.get(stub_server['url'])
+
+    assert stub_server['hits'] == 5
+    assert [b['state'] for b in client.stats()['breakers'].values()] == ['closed']
@@ -0,0 +1,85 @@
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import create_engine, inspect, text
+
+import migrations
+from models import Absence
+
+JOURS = ('lundi', 'mardi', 'mercredi', 'jeudi', 'vendredi', 'samedi')
+
+
+@pytest.fixture
+def old_engine(tmp_path):
+    """Base au schéma d'avant les migrations : absences cochées par jour de la semaine"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'ancienne.db'}")
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE absence (id INTEGER PRIMARY KEY, professeur VARCHAR(100) NOT NULL, "
+            + ', '.join(f"{jour} BOOLEAN" for jour in JOURS) + ")"
+        ))
+        conn.execute(text("CREATE TABLE event (id INTEGER PRIMARY KEY, title VARCHAR(200), date DATE)"))
+        conn.execute(text(
+            'CREATE TABLE menu_item (id INTEGER PRIMARY KEY, category VARCHAR(50), name VARCHAR(100), '
+            'date DATE, "order" INTEGER)'
+        ))
+        conn.execute(text("CREATE TABLE widget_config (id INTEGER PRIMARY KEY)"))
+    return engine
+
+
+def add_absence(engine, professeur, *jours):
+    columns = ', '.join(('professeur',) + JOURS)
+    values = ', '.join([':p'] + ['1' if jour in jours else '0' for jour in JOURS])
+    with engine.begin() as conn:
+        conn.execute(text(f"INSERT INTO absence ({columns}) VALUES ({values})"), {'p': professeur})
+
+
+def test_upgrade_converts_weekdays_to_periods(old_engine):
+    add_absence(old_engine, 'Dupont', 'lundi', 'mardi', 'jeudi')
+    add_absence(old_engine, 'Martin', 'vendredi')
+    add_absence(old_engine, 'Durand')
+
+    assert migrations.upgrade(old_engine) == migrations.MIGRATIONS[-1][0]
+
+    week = Absence.week_start()
+    with old_engine.connect() as conn:
+        rows = conn.execute(text(
+            "SELECT professeur, date_debut, date_fin FROM absence ORDER BY professeur, date_debut"
+        )).all()
+    assert [tuple(row) for row in rows] == [
+        ('Dupont', week.isoformat(), (week + timedelta(days=1)).isoformat()),
+        ('Dupont', (week + timedelta(days=3)).isoformat(), (week + timedelta(days=3)).isoformat()),
+        ('Martin', (week + timedelta(days=4)).isoformat(), (week + timedelta(days=4)).isoformat()),
+    ]
+    indexes = {index['name'] for index in inspect(old_engine).get_indexes('absence')}
+    assert {'uq_absence_professeur_debut', 'ix_absence_periode'} <= indexes
+    assert 'uq_absence_professeur' not in indexes
+    columns = {column['name'] for column in inspect(old_engine).get_columns('widget_config')}
+    assert {'cts_stop_codes', 'cts_line_refs'} <= columns
+
+
+def test_upgrade_is_idempotent(old_engine):
+    add_absence(old_engine, 'Dupont', 'mercredi')
+    version = migrations.upgrade(old_engine)
+
+    assert migrations.upgrade(old_engine) == version
+    with old_engine.connect() as conn:
+        assert conn.execute(text("SELECT COUNT(*) FROM schema_version")).scalar() == len(migrations.MIGRATIONS)
+        assert conn.execute(text("SELECT COUNT(*) FROM absence")).scalar() == 1
+
+
+def test_duplicate_absences_stop_the_upgrade_without_data_loss(old_engine):
+    add_absence(old_engine, 'Dupont', 'lundi', 'mardi')
+    add_absence(old_engine, 'Dupont', 'lundi')
+
+    with pytest.raises(RuntimeError, match='en double'):
+        migrations.upgrade(old_engine)
+
+    assert migrations.current_version(old_engine) == 1
+    with old_engine.connect() as conn:
+        assert conn.execute(text("SELECT COUNT(*) FROM absence WHERE professeur = 'Dupont'")).scalar() == 2
+
+    # Doublon corrigé à la main : la migration reprend
+    with old_engine.begin() as conn:
+        conn.execute(text("DELETE FROM absence WHERE id = 2"))
+    assert migrations.upgrade(old_engine) == migrations.MIGRATIONS[-1][0]
@@ -0,0 +1,71 @@
+import pytest
+
+from weather import WeatherCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeApi:
+    def __init__(self):
+        self.calls = 0
+        self.error = None
+
+    def __call__(self, city, api_key, timeout, url):
+        self.calls += 1
+        if self.error:
+            raise self.error
+        return {'temp': 12, 'description': 'Nuageux', 'icon': '04d'}
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def api():
+    return FakeApi()
+
+
+def test_failure_is_not_retried_within_revalidate_window(clock, api):
+    api.error = RuntimeError('401 Unauthorized')
+    cache = WeatherCache(revalidate_after=300, fetch=api, clock=clock)
+
+    with pytest.raises(RuntimeError):
+        cache.refresh('Echecville', 'mauvaise-cle')
+    for _ in range(4):
+        assert cache.refresh('Echecville', 'mauvaise-cle') is None
+    assert api.calls == 1
+    assert cache.stats()['suppressed'] == 4
+
+    clock.now = 300
+    with pytest.raises(RuntimeError):
+        cache.refresh('Echecville', 'mauvaise-cle')
+    assert api.calls == 2
+
+
+def test_failure_is_remembered_per_api_key(clock, api):
+    api.error = RuntimeError('401 Unauthorized')
+    cache = WeatherCache(fetch=api, clock=clock)
+    with pytest.raises(RuntimeError):
+        cache.refresh('Clefville', 'ancienne-cle')
+
+    api.error = None
+    assert cache.refresh('Clefville', 'nouvelle-cle')['temp'] == 12
+    assert api.calls == 2
+
+
+def test_cached_payload_is_served_without_call(clock, api):
+    cache = WeatherCache(revalidate_after=300, fetch=api, clock=clock)
+    cache.refresh('Cacheville', 'cle')
+
+    clock.now = 100
+    assert cache.get('Cacheville', 'cle')['description'] == 'Nuageux'
+    assert api.calls == 1
+    assert cache.get('Autreville', 'cle') is None
@@ -0,0 +1,312 @@
+import array
+import bisect
+import heapq
+import json
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta
+from flask import current_app
+from cts import Departure, parse_timestamp, resolve_stops
+from extensions import logger
+from http_client import upstream
+from snapshots import snapshot_store
+from stop_catalogue import stop_catalogue
+
+DAY_TYPES = ('weekday', 'saturday', 'sunday')
+_MAGIC = b'EDTT'
+_PREFIX = struct.Struct('<4sI')
+
+
+def day_type(day):
+    """Type de jour de service : semaine, samedi ou dimanche (jours fériés non distingués)"""
+    return DAY_TYPES[max(0, day.weekday() - 4)]
+
+
+def write_schedule(path, departures, meta):
+    """Compile {(point d'arrêt, type de jour): [(minute, ligne, destination, mode)]} dans un fichier binaire.
+
+    Format : préfixe (signature, taille de l'en-tête), en-tête JSON (motifs ligne/destination/mode,
+    plage de chaque arrêt et type de jour), puis deux tableaux d'entiers 16 bits non signés
+    (ordre natif) de même longueur : minutes depuis minuit, triées dans chaque plage, et motifs.
+    """
+    patterns, pattern_ids = [], {}
+    minutes, refs = array.array('H'), array.array('H')
+    ranges = {}
+    for (stop_code, kind), entries in sorted(departures.items()):
+        start = len(minutes)
+        for minute, line, destination, mode in sorted(set(entries)):
+            pattern = (line, destination, mode)
+            if pattern not in pattern_ids:
+                pattern_ids[pattern] = len(patterns)
+                patterns.append(pattern)
+            minutes.append(minute)
+            refs.append(pattern_ids[pattern])
+        ranges.setdefault(stop_code, {})[kind] = [start, len(minutes)]
+
+    header = json.dumps(dict(meta, patterns=patterns, stops=ranges, count=len(minutes)),
+                        ensure_ascii=False).encode('utf-8')
+    header += b' ' * (-len(header) % 4)
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-', suffix='.bin')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(_PREFIX.pack(_MAGIC, len(header)))
+            f.write(header)
+            minutes.tofile(f)
+            refs.tofile(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return len(minutes)
+
+
+class ScheduleIndex:
+    """Index compilé, projeté en mémoire en lecture seule : les workers partagent les mêmes pages.
+
+    Seul l'en-tête est décodé ; les horaires sont lus directement dans le fichier.
+    Une recherche est une dichotomie dans la plage de chaque point d'arrêt.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, length = _PREFIX.unpack_from(self._map, 0)
+        if magic != _MAGIC:
+            raise ValueError(f"{path} n'est pas un index d'horaires")
+        offset = _PREFIX.size
+        header = json.loads(self._map[offset:offset + length])
+        offset += length
+        count = header['count']
+        view = memoryview(self._map)
+        self.minutes = view[offset:offset + 2 * count].cast('H')
+        self.pattern_refs = view[offset + 2 * count:offset + 4 * count].cast('H')
+        self.patterns = [tuple(pattern) for pattern in header['patterns']]
+        self.stops = header['stops']
+        self.compiled_at = header.get('compiled_at')
+        self.dates = header.get('dates', {})
+
+    def __len__(self):
+        return len(self.minutes)
+
+    def departures(self, stop_codes, after, limit=10):
+        """Prochains départs théoriques après `after` (heure locale), tous points d'arrêt confondus.
+
+        Retourne des (datetime local, (ligne, destination, mode), point d'arrêt), jusqu'au lendemain.
+        """
+        results = []
+        minute = after.hour * 60 + after.minute
+        for offset in range(2):
+            day = after.date() + timedelta(days=offset)
+            kind = day_type(day)
+            midnight = datetime(day.year, day.month, day.day)
+            streams = []
+            for stop_code in stop_codes:
+                bounds = self.stops.get(stop_code, {}).get(kind)
+                if not bounds:
+                    continue
+                start, end = bounds
+                start = bisect.bisect_left(self.minutes, minute, start, end)
+                streams.append(((self.minutes[i], i, stop_code) for i in range(start, end)))
+            for value, i, stop_code in heapq.merge(*streams):
+                results.append((midnight + timedelta(minutes=value), self.patterns[self.pattern_refs[i]], stop_code))
+                if len(results) >= limit:
+                    return results
+            minute = 0
+        return results
+
+
+def scheduled_departure(departure, pattern, stop_code):
+    """Départ théorique : horaire prévu seulement, sans horaire temps réel"""
+    line, destination, mode = pattern
+    local = departure.astimezone()
+    return Departure.create(line, destination, mode, stop_code, None, local, False, local)
+
+
+class OfflineTimetable:
+    """Horaires théoriques des arrêts affichés, servis quand le temps réel est indisponible.
+
+    L'endpoint timetable-file ne renvoie que des liens vers les fiches horaires (documents)
+    et leurs périodes de validité. Les horaires sont donc relevés sur les passages temps réel
+    reçus : chaque course est retenue une fois par jour, à sa dernière heure annoncée, par
+    point d'arrêt. Pour chaque type de jour, le jour le mieux couvert sur les history_days
+    derniers jours est compilé, sans les relevés antérieurs à la fiche horaire en vigueur.
+    Relevés et compilation écrivent des fichiers communs : seul le processus propriétaire
+    des tâches partagées (refresher.is_owner) appelle observe et refresh, les autres
+    workers ne font que lire l'index compilé.
+    """
+
+    history_days = 21
+    save_interval = 300
+    reload_check_interval = 30
+
+    def __init__(self):
+        self.path = None
+        self._days = None
+        self._dirty = set()
+        self._saved_at = 0.0
+        self._index = None
+        self._index_mtime = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.compilations = 0
+
+    def configure(self, config):
+        self.path = config['CTS_TIMETABLE_PATH']
+        self._index = None
+        self._index_mtime = None
+        self._checked_at = 0.0
+
+    @property
+    def index(self):
+        now = time.monotonic()
+        if now - self._checked_at >= self.reload_check_interval:
+            self._checked_at = now
+            self._reload()
+        return self._index
+
+    def observe(self, boards):
+        """Relève les départs temps réel des tableaux (appelé à chaque rafraîchissement CTS)"""
+        with self._lock:
+            days = self._observations()
+            for board in boards:
+                for departure in board['departures']:
+                    # Horaires théoriques calculés ici (sans course) : rien à relever
+                    if departure.time is None or not departure.stop_code or not (departure.realtime or departure.trip):
+                        continue
+                    # L'horaire prévu, pas l'estimation temps réel : un bus en retard ne décale pas la fiche
+                    local = (departure.aimed or departure.time).astimezone()
+                    trip = departure.trip or f"{departure.line}:{departure.destination}:{local:%H%M}"
+                    day = local.date().isoformat()
+                    days.setdefault(day, {}).setdefault(departure.stop_code, {})[trip] = [
+                        local.hour * 60 + local.minute, departure.line, departure.destination, departure.mode]
+                    self._dirty.add(day)
+            if time.time() - self._saved_at >= self.save_interval:
+                self._save()
+
+    def refresh(self, api_token, stop_codes, today=None):
+        """Tâche de fond : périodes de validité (timetable-file) puis compilation de l'index"""
+        today = today or date.today()
+        validity = self._validity(api_token, stop_codes, today)
+        with self._lock:
+            days = self._observations()
+            oldest = (today - timedelta(days=self.history_days)).isoformat()
+            for day in [day for day in days if day < oldest]:
+                del days[day]
+            self._save()
+            chosen = {}
+            for day, stops in days.items():
+                kind = day_type(date.fromisoformat(day))
+                for stop_code, trips in stops.items():
+                    if stop_code in validity and day < validity[stop_code]:
+                        continue
+                    best = chosen.get((stop_code, kind))
+                    if best is None or (len(trips), day) > best[0]:
+                        chosen[(stop_code, kind)] = ((len(trips), day), trips)
+
+        departures = {key: [tuple(entry) for entry in trips.values()] for key, (_, trips) in chosen.items()}
+        dates = {f"{stop_code}:{kind}": best[1] for (stop_code, kind), (best, _) in chosen.items()}
+        count = write_schedule(self.path, departures, {'compiled_at': time.time(), 'dates': dates})
+        self.compilations += 1
+        self._checked_at = 0.0
+        logger.info(f"Horaires théoriques compilés : {count} départs, {len(departures)} arrêts et types de jour")
+        return {'departures': count, 'stops': len({stop_code for stop_code, _ in departures}),
+                'validity': validity}
+
+    def boards(self, stop_codes, limit=10, now=None):
+        """Tableaux de départs théoriques des arrêts configurés (vides si l'index ne les couvre pas)"""
+        index = self.index
+        now = now or datetime.now()
+        boards = []
+        for code, name, quay_codes, _ in resolve_stops(stop_codes):
+            departures = []
+            if index is not None:
+                self.lookups += 1
+                departures = [scheduled_departure(departure, pattern, stop_code)
+                          for departure, pattern, stop_code in index.departures(quay_codes, now, limit)]
+            boards.append({'code': code, 'name': name, 'departures': departures, 'scheduled': True})
+        return boards
+
+    def stats(self):
+        index = self.index
+        return {
+            'departures': len(index) if index else 0,
+            'stops': len(index.stops) if index else 0,
+            'compiled_at': index.compiled_at if index else None,
+            'observed_days': len(self._days) if self._days is not None else None,
+            'lookups': self.lookups,
+            'compilations': self.compilations,
+        }
+
+    def _observations(self):
+        if self._days is None:
+            self._days = {}
+            today = date.today()
+            for offset in range(self.history_days + 1):
+                day = (today - timedelta(days=offset)).isoformat()
+                persisted = snapshot_store.load('cts_observed', day)
+                if persisted is not None:
+                    self._days[day] = persisted[0]
+        return self._days
+
+    def _save(self):
+        for day in self._dirty:
+            if day in self._days:
+                snapshot_store.save('cts_observed', day, self._days[day])
+        self._dirty.clear()
+        self._saved_at = time.time()
+
+    def _validity(self, api_token, stop_codes, today):
+        """Début de la fiche horaire en vigueur par point d'arrêt, d'après timetable-file"""
+        base_url = current_app.config['CTS_BASE_URL']
+        validity = {}
+        logical_codes = []
+        for code in stop_codes:
+            entry = stop_catalogue.get(code)
+            logical = entry.code if entry else code
+            if logical not in logical_codes:
+                logical_codes.append(logical)
+        for logical in logical_codes:
+            try:
+                response = upstream.get(f"{base_url}/v1/cts/timetable-file", params={'logicalStopCode': logical},
+                                        auth=(api_token, ""))
+                response.raise_for_status()
+                files = response.json().get('TimetablesFiles') or []
+                snapshot_store.save('cts_timetable_files', logical, files)
+            except Exception as e:
+                persisted = snapshot_store.load('cts_timetable_files', logical)
+                files = persisted[0] if persisted else []
+                logger.warning(f"Fiches horaires CTS indisponibles pour {logical}, dernières connues utilisées: {e}")
+            for timetable_file in files:
+                start = parse_timestamp(timetable_file.get('StartValidity'))
+                end = parse_timestamp(timetable_file.get('EndValidity'))
+                stop_code = timetable_file.get('StopCode')
+                if not stop_code or start is None or start.date() > today or (end and end.date() < today):
+                    continue
+                start = start.date().isoformat()
+                validity[stop_code] = max(validity.get(stop_code, start), start)
+        return validity
+
+    def _reload(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except (OSError, TypeError):
+            self._index, self._index_mtime = None, None
+            return
+        if mtime == self._index_mtime:
+            return
+        try:
+            self._index, self._index_mtime = ScheduleIndex(self.path), mtime
+        except (OSError, ValueError) as e:
+            logger.warning(f"Index des horaires théoriques illisible: {e}")
+
+
+offline_timetable = OfflineTimetable()
@@ -0,0 +1,703 @@
+"""Serveur local remplaçant les API CTS et OpenWeather (développement, mesures, pannes simulées).
+
+    python upstream_standin.py [--port 8900] [--latency 0.05] [--jitter 0] [--error-rate 0]
+                               [--max-age 30] [--max-age-for stop-monitoring=20] [--rate-limit 0]
+    python upstream_standin.py record --token <jeton CTS> --stop 103 [--city Strasbourg --appid <clé>]
+
+Les routes CTS sont celles de swagger.json : paramètres obligatoires et types y sont
+vérifiés comme par l'API réelle (400 sinon). Les réponses sont générées à partir du
+réseau fictif de fixtures/cts_network.json, ou rejouées depuis fixtures/recorded/
+(réponses enregistrées par la commande record, horodatages décalés à l'instant présent).
+
+Latence, taux d'erreur, Cache-Control et limite de débit se modifient en cours de route :
+    curl -X POST localhost:8900/_standin/settings -d '{"latency": 2, "error_rate": 0.2}'
+    curl localhost:8900/_standin/stats
+
+Pointer l'application dessus avec :
+    CTS_BASE_URL=http://127.0.0.1:8900 WEATHER_API_URL=http://127.0.0.1:8900/data/2.5/weather
+"""
+import argparse
+import base64
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+SWAGGER_PATH = os.path.join(BASE_DIR, 'swagger.json')
+NETWORK_PATH = os.path.join(BASE_DIR, 'fixtures', 'cts_network.json')
+RECORDED_DIR = os.path.join(BASE_DIR, 'fixtures', 'recorded')
+
+WEATHER_PATH = '/data/2.5/weather'
+CTS_ENDPOINTS = ('stop-monitoring', 'estimated-timetable', 'stoppoints-discovery', 'lines-discovery', 'general-message',
+                 'timetable-file')
+
+_DURATION = re.compile(r'^PT?(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?$')
+_TIMESTAMP = re.compile(r'^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}')
+
+
+def parse_duration(value, default):
+    match = _DURATION.match(value or '')
+    if not match or not any(match.groups()):
+        return default
+    hours, minutes, seconds = (int(part or 0) for part in match.groups())
+    return timedelta(hours=hours, minutes=minutes, seconds=seconds)
+
+
+def iso(moment):
+    return moment.isoformat(timespec='seconds')
+
+
+def distance_m(lat1, lon1, lat2, lon2):
+    """Distance approximative en mètres (équirectangulaire, suffisante à l'échelle d'une ville)"""
+    x = math.radians(lon2 - lon1) * math.cos(math.radians((lat1 + lat2) / 2))
+    y = math.radians(lat2 - lat1)
+    return 6371000 * math.hypot(x, y)
+
+
+class StandinSettings:
+    """Comportement simulé, modifiable pendant l'exécution (POST /_standin/settings)"""
+
+    FIELDS = ('latency', 'jitter', 'error_rate', 'error_status', 'max_age', 'rate_limit', 'token')
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, error_status=500, max_age=None,
+                 rate_limit=0, token=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        # Durée Cache-Control par endpoint ('*' par défaut) ; None : pas d'en-tête, 0 : no-cache
+        self.max_age = max_age if max_age is not None else {'*': 30}
+        self.rate_limit = rate_limit
+        self.token = token
+
+    def update(self, values):
+        for name, value in values.items():
+            if name not in self.FIELDS:
+                raise ValueError(f"Paramètre inconnu : {name}")
+            if name == 'max_age' and not isinstance(value, dict):
+                value = {'*': value}
+            setattr(self, name, value)
+
+    def max_age_for(self, endpoint):
+        return self.max_age.get(endpoint, self.max_age.get('*'))
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.FIELDS}
+
+
+class SwaggerRoutes:
+    """Routes GET et paramètres de requête déclarés dans swagger.json"""
+
+    def __init__(self, path=SWAGGER_PATH):
+        with open(path, encoding='utf-8') as f:
+            spec = json.load(f)
+        self.routes = {}
+        for route, operations in spec['paths'].items():
+            if 'get' in operations:
+                self.routes[route] = {
+                    param['name']: (param.get('required', False), param.get('schema', {}).get('type'))
+                    for param in operations['get'].get('parameters', []) if param.get('in') == 'query'
+                }
+
+    def validate(self, route, query):
+        """Retourne un message d'erreur (comme l'API : 400) ou None"""
+        params = self.routes[route]
+        for name, (required, kind) in params.items():
+            values = query.get(name)
+            if not values:
+                if required:
+                    return f"The {name} field is required."
+                continue
+            for value in values:
+                if kind == 'integer' and not re.fullmatch(r'-?\d+', value):
+                    return f"The value '{value}' is not valid for {name}."
+                if kind == 'number':
+                    try:
+                        float(value)
+                    except ValueError:
+                        return f"The value '{value}' is not valid for {name}."
+                if kind == 'boolean' and value.lower() not in ('true', 'false'):
+                    return f"The value '{value}' is not valid for {name}."
+        return None
+
+
+class CTSNetwork:
+    """Réseau fictif : passages calculés à partir des fréquences et temps de parcours des lignes.
+
+    Chaque arrêt logique (ex: 103) a un point d'arrêt par sens de circulation (103A, 103B).
+    Les horaires sont déterministes : deux appels au même instant renvoient les mêmes passages.
+    """
+
+    def __init__(self, path=NETWORK_PATH):
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        self.stops = {stop['code']: stop for stop in data['stops']}
+        self.lines = data['lines']
+        self.messages = data['messages']
+        self.service_start = self._minutes(data['service_start'])
+        self.service_end = self._minutes(data['service_end'])
+        if self.service_end <= self.service_start:
+            self.service_end += 24 * 60
+
+    @staticmethod
+    def _minutes(value):
+        hours, minutes = value.split(':')
+        return int(hours) * 60 + int(minutes)
+
+    def directions(self, line):
+        """(sens, suite d'arrêts, lettre du point d'arrêt) pour les deux sens de la ligne"""
+        return ((1, line['stops'], 'A'), (2, list(reversed(line['stops'])), 'B'))
+
+    def _lines(self, line_refs=None, vehicle_mode=None):
+        for line in self.lines:
+            if line_refs and line['ref'] not in line_refs:
+                continue
+            if vehicle_mode and vehicle_mode != 'undefined' and line['mode'] != vehicle_mode:
+                continue
+            yield line
+
+    def _trips(self, line, start, end, offset_minutes):
+        """Départs du terminus dont le passage (départ + offset) tombe dans [start, end]"""
+        headway = line['headway']
+        day = start.replace(hour=0, minute=0, second=0, microsecond=0)
+        for service_day in (day - timedelta(days=1), day):
+            first = service_day + timedelta(minutes=self.service_start)
+            last = service_day + timedelta(minutes=self.service_end)
+            k = max(0, math.ceil((start - first - timedelta(minutes=offset_minutes)).total_seconds() / 60 / headway))
+            while True:
+                departure = first + timedelta(minutes=k * headway)
+                passing = departure + timedelta(minutes=offset_minutes)
+                if departure > last or passing > end:
+                    break
+                yield departure, passing
+                k += 1
+
+    @staticmethod
+    def _delay(trip_ref):
+        # Retard stable par course, de 0 à 2 minutes
+        return timedelta(seconds=int(hashlib.sha1(trip_ref.encode()).hexdigest()[:4], 16) % 150)
+
+    def _trip_ref(self, line, direction, departure):
+        return f"{line['ref']}-{direction}-{departure:%Y%m%d%H%M}"
+
+    def stop_visits(self, refs, now, preview, max_visits=None, line_ref=None, vehicle_mode=None, direction_ref=None):
+        visits = []
+        for line in self._lines([line_ref] if line_ref else None, vehicle_mode):
+            for direction, stops, letter in self.directions(line):
+                if direction_ref and int(direction_ref) != direction:
+                    continue
+                for index, code in enumerate(stops[:-1]):
+                    point = code + letter
+                    monitoring_ref = next((ref for ref in refs if ref in (code, point)), None)
+                    if monitoring_ref is None:
+                        continue
+                    for departure, passing in self._trips(line, now - timedelta(minutes=2), now + preview,
+                                                          index * line['travel']):
+                        trip_ref = self._trip_ref(line, direction, departure)
+                        expected = passing + self._delay(trip_ref)
+                        if expected < now:
+                            continue
+                        visits.append((expected, self._visit(line, direction, stops, index, point, monitoring_ref,
+                                                             trip_ref, expected, now)))
+        visits.sort(key=lambda item: item[0])
+        return [visit for _, visit in visits][:max_visits]
+
+    def _visit(self, line, direction, stops, index, point, monitoring_ref, trip_ref, expected, now):
+        destination = self.stops[stops[-1]]['name']
+        return {
+            'RecordedAtTime': iso(now),
+            'MonitoringRef': monitoring_ref,
+            'StopCode': point,
+            'MonitoredVehicleJourney': {
+                'LineRef': line['ref'],
+                'DirectionRef': direction,
+                'FramedVehicleJourneyRef': {'DatedVehicleJourneySAERef': trip_ref},
+                'VehicleMode': line['mode'],
+                'PublishedLineName': line['name'],
+                'DestinationName': destination,
+                'DestinationShortName': destination,
+                'Via': self.stops[stops[(index + len(stops)) // 2]]['name'],
+                'MonitoredCall': {
+                    'StopPointName': self.stops[stops[index]]['name'],
+                    'StopCode': point,
+                    'Order': index + 1,
+                    'ExpectedDepartureTime': iso(expected),
+                    'ExpectedArrivalTime': iso(expected),
+                    'Extension': {'IsRealTime': True, 'DataSource': 'standin'},
+                },
+            },
+        }
+
+    def journeys(self, now, preview, line_refs=None, vehicle_mode=None, direction_ref=None):
+        """Courses en circulation ou partant dans l'intervalle, avec leurs passages restants"""
+        journeys = []
+        for line in self._lines(line_refs, vehicle_mode):
+            duration = (len(line['stops']) - 1) * line['travel']
+            for direction, stops, letter in self.directions(line):
+                if direction_ref and int(direction_ref) != direction:
+                    continue
+                for departure, _ in self._trips(line, now - timedelta(minutes=duration), now + preview, 0):
+                    trip_ref = self._trip_ref(line, direction, departure)
+                    delay = self._delay(trip_ref)
+                    calls = []
+                    for index, code in enumerate(stops):
+                        expected = departure + timedelta(minutes=index * line['travel']) + delay
+                        if expected < now:
+                            continue
+                        calls.append({
+                            'StopPointRef': code + letter,
+                            'StopPointName': self.stops[code]['name'],
+                            'DestinationName': self.stops[stops[-1]]['name'],
+                            'DestinationShortName': self.stops[stops[-1]]['name'],
+                            'Via': self.stops[stops[len(stops) // 2]]['name'],
+                            'ExpectedDepartureTime': iso(expected),
+                            'ExpectedArrivalTime': iso(expected),
+                            'Extension': {'IsRealTime': True, 'IsCheckOut': index == len(stops) - 1,
+                                          'DataSource': 'standin'},
+                        })
+                    if calls:
+                        journeys.append({
+                            'LineRef': line['ref'],
+                            'DirectionRef': direction,
+                            'FramedVehicleJourneyRef': {'DatedVehicleJourneySAERef': trip_ref},
+                            'PublishedLineName': line['name'],
+                            'IsCompleteStopSequence': len(calls) == len(stops),
+                            'EstimatedCalls': calls,
+                            'Extension': {'VehicleMode': line['mode']},
+                        })
+        return journeys
+
+    def timetable_files(self, logical_code, now):
+        """Fiches horaires d'un arrêt logique (une par ligne et par sens), valables pour l'année scolaire"""
+        start = now.replace(year=now.year if now.month >= 9 else now.year - 1, month=9, day=1,
+                            hour=0, minute=0, second=0, microsecond=0)
+        end = start.replace(year=start.year + 1) - timedelta(seconds=1)
+        files = []
+        for line in self.lines:
+            for direction, stops, letter in self.directions(line):
+                if logical_code not in stops[:-1]:
+                    continue
+                files.append({
+                    'Url': f"/_standin/timetables/{line['ref']}-{logical_code}{letter}.pdf",
+                    'StopCode': logical_code + letter,
+                    'LineRef': line['ref'],
+                    'DestinationName': self.stops[stops[-1]]['name'],
+                    'StartValidity': iso(start),
+                    'EndValidity': iso(end),
+                })
+        return files
+
+    def stop_points(self, stop_code=None, latitude=None, longitude=None, distance=None, include_lines=False):
+        points = []
+        for line in self.lines:
+            for direction, stops, letter in self.directions(line):
+                for code in stops[:-1]:
+                    points.append((code, code + letter, line, direction, stops[-1]))
+        annotated = {}
+        for code, point, line, direction, terminus in points:
+            stop = self.stops[code]
+            if stop_code and stop_code not in (code, point):
+                continue
+            meters = None
+            if latitude is not None and longitude is not None:
+                meters = round(distance_m(latitude, longitude, stop['latitude'], stop['longitude']))
+                if distance is not None and meters > distance:
+                    continue
+            entry = annotated.setdefault(point, {
+                'StopPointRef': point,
+                'Lines': [],
+                'Location': {'Longitude': stop['longitude'], 'Latitude': stop['latitude']},
+                'StopName': stop['name'],
+                'Extension': {'StopCode': point, 'LogicalStopCode': code, 'IsFlexhopStop': False,
+                              'distance': meters},
+            })
+            if include_lines:
+                entry['Lines'].append({
+                    'LineRef': line['ref'],
+                    'LineName': line['name'],
+                    'Destinations': [{'DirectionRef': direction, 'DestinationName': [self.stops[terminus]['name']]}],
+                    'Extension': {'RouteType': line['mode'], 'RouteColor': line['color'],
+                                  'RouteTextColor': line['text_color']},
+                })
+        entries = list(annotated.values())
+        if latitude is not None and longitude is not None:
+            entries.sort(key=lambda entry: entry['Extension']['distance'])
+        return entries
+
+    def annotated_lines(self):
+        return [{
+            'LineRef': line['ref'],
+            'LineName': line['name'],
+            'Destinations': [{'DirectionRef': direction, 'DestinationName': [self.stops[stops[-1]]['name']]}
+                             for direction, stops, _ in self.directions(line)],
+            'Extension': {'RouteType': line['mode'], 'RouteColor': line['color'], 'RouteTextColor': line['text_color']},
+        } for line in self.lines]
+
+    def info_messages(self, now, line_refs=None, channels=None):
+        day = now.replace(minute=0, second=0, microsecond=0)
+        messages = []
+        for message in self.messages:
+            if line_refs and not set(line_refs) & set(message['lines']):
+                continue
+            if channels and message['channel'] not in channels:
+                continue
+            start = day + timedelta(hours=message['starts_in_hours'])
+            end = day + timedelta(hours=message['ends_in_hours'])
+            messages.append({
+                'formatRef': 'STIF-IDF',
+                'RecordedAtTime': iso(start),
+                'ItemIdentifier': message['id'],
+                'InfoMessageIdentifier': message['id'],
+                'InfoChannelRef': message['channel'],
+                'ValidUntilTime': iso(end),
+                'Content': {
+                    'ImpactStartDateTime': iso(start),
+                    'ImpactEndDateTime': iso(end),
+                    'ImpactedLineRef': message['lines'],
+                    'Priority': message['priority'],
+                    'Message': [{'MessageZoneRef': 'Global',
+                                 'MessageText': [{'Value': message['text'], 'Lang': 'FR'}]}],
+                },
+            })
+        return messages
+
+
+def shift_timestamps(payload, delta):
+    """Décale tous les horodatages ISO d'une réponse enregistrée (rejouée comme si elle était récente)"""
+    if isinstance(payload, dict):
+        return {key: shift_timestamps(value, delta) for key, value in payload.items()}
+    if isinstance(payload, list):
+        return [shift_timestamps(value, delta) for value in payload]
+    if isinstance(payload, str) and _TIMESTAMP.match(payload):
+        try:
+            moment = datetime.fromisoformat(re.sub(r'(\.\d{6})\d+', r'\1', payload).replace('Z', '+00:00'))
+        except ValueError:
+            return payload
+        return iso(moment + delta)
+    return payload
+
+
+def _response_timestamp(payload):
+    for key in ('ServiceDelivery', 'StopPointsDelivery', 'LinesDelivery'):
+        value = payload.get(key, {}).get('ResponseTimestamp') if isinstance(payload, dict) else None
+        if value:
+            return datetime.fromisoformat(re.sub(r'(\.\d{6})\d+', r'\1', value).replace('Z', '+00:00'))
+    return None
+
+
+class Standin:
+    """Production des réponses ; indépendant du serveur HTTP pour pouvoir être appelé directement"""
+
+    def __init__(self, settings=None, network_path=NETWORK_PATH, recorded_dir=RECORDED_DIR,
+                 swagger_path=SWAGGER_PATH, clock=None):
+        self.settings = settings or StandinSettings()
+        self.network = CTSNetwork(network_path)
+        self.swagger = SwaggerRoutes(swagger_path)
+        self.recorded_dir = recorded_dir
+        self._clock = clock or (lambda: datetime.now().astimezone())
+        self._lock = threading.Lock()
+        self._recent = deque()
+        self._rng = random.Random()
+        self.calls = {}
+        self.errors = {}
+
+    def handle(self, path, query, authorization):
+        """Retourne (statut, en-têtes, corps JSON) pour une requête GET"""
+        settings = self.settings
+        name = path.rsplit('/', 1)[-1]
+        with self._lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+            limited = self._rate_limited(settings.rate_limit)
+        if limited:
+            return self._error(name, 429, 'Too many requests', {'Retry-After': '60'})
+        if settings.error_rate and self._rng.random() < settings.error_rate:
+            return self._error(name, settings.error_status, 'Erreur simulée par le serveur de remplacement')
+
+        if path == WEATHER_PATH:
+            return self._weather(query)
+        if path not in self.swagger.routes:
+            return self._error(name, 404, f"Route inconnue : {path}")
+        if not authorization or (settings.token and not self._token_matches(authorization, settings.token)):
+            return self._error(name, 401, 'Authorization has been denied for this request.')
+        message = self.swagger.validate(path, query)
+        if message:
+            return self._error(name, 400, message)
+
+        payload = self._recorded(name)
+        if payload is None:
+            builder = getattr(self, '_' + name.replace('-', '_'), None)
+            if builder is None:
+                return self._error(name, 501, f"{path} n'est pas simulé")
+            payload = builder({key: values[0] for key, values in query.items()}, query, self._clock())
+        headers = {}
+        max_age = settings.max_age_for(name)
+        if max_age is not None:
+            headers['Cache-Control'] = f"max-age={max_age}" if max_age > 0 else 'no-cache'
+        return 200, headers, payload
+
+    def delay(self):
+        settings = self.settings
+        return max(0.0, settings.latency + (self._rng.uniform(-settings.jitter, settings.jitter) if settings.jitter else 0))
+
+    def stats(self):
+        with self._lock:
+            return {'calls': dict(self.calls), 'errors': dict(self.errors), 'settings': self.settings.as_dict()}
+
+    def _rate_limited(self, limit):
+        if not limit:
+            return False
+        now = time.monotonic()
+        while self._recent and now - self._recent[0] > 60:
+            self._recent.popleft()
+        if len(self._recent) >= limit:
+            return True
+        self._recent.append(now)
+        return False
+
+    @staticmethod
+    def _token_matches(authorization, token):
+        scheme, _, value = authorization.partition(' ')
+        if scheme.lower() != 'basic':
+            return False
+        try:
+            user = base64.b64decode(value).decode('utf-8').partition(':')[0]
+        except ValueError:
+            return False
+        return user == token
+
+    def _error(self, name, status, message, headers=None):
+        with self._lock:
+            self.errors[name] = self.errors.get(name, 0) + 1
+        return status, headers or {}, {'error': message}
+
+    def _recorded(self, name):
+        path = os.path.join(self.recorded_dir, f"{name}.json") if self.recorded_dir else None
+        if not path or not os.path.isfile(path):
+            return None
+        with open(path, encoding='utf-8') as f:
+            payload = json.load(f)
+        recorded_at = _response_timestamp(payload)
+        return shift_timestamps(payload, self._clock() - recorded_at) if recorded_at else payload
+
+    def _delivery(self, now, cycle=30):
+        return {
+            'version': '2.0',
+            'ResponseTimestamp': iso(now),
+            'ValidUntil': iso(now + timedelta(seconds=cycle)),
+            'ShortestPossibleCycle': f"PT{cycle}S",
+        }
+
+    def _stop_monitoring(self, params, query, now):
+        refs = [ref for value in query['MonitoringRef'] for ref in value.split(',')]
+        visits = self.network.stop_visits(
+            refs, now, parse_duration(params.get('PreviewInterval'), timedelta(hours=1)),
+            int(params['MaximumStopVisits']) if params.get('MaximumStopVisits') else None,
+            params.get('LineRef'), params.get('VehicleMode'), params.get('DirectionRef'))
+        delivery = dict(self._delivery(now), MonitoringRef=refs, MonitoredStopVisit=visits)
+        return {'ServiceDelivery': {'ResponseTimestamp': iso(now), 'RequestMessageRef': params.get('MessageIdentifier'),
+                                    'StopMonitoringDelivery': [delivery]}}
+
+    def _estimated_timetable(self, params, query, now):
+        journeys = self.network.journeys(
+            now, parse_duration(params.get('PreviewInterval'), timedelta(hours=1)),
+            [ref for value in query.get('LineRef', []) for ref in value.split(',')] or None,
+            params.get('VehicleMode'), params.get('DirectionRef'))
+        delivery = dict(self._delivery(now), EstimatedJourneyVersionFrame=[
+            {'RecordedAtTime': iso(now), 'EstimatedVehicleJourney': journeys}])
+        return {'ServiceDelivery': {'ResponseTimestamp': iso(now), 'RequestMessageRef': params.get('MessageIdentifier'),
+                                    'EstimatedTimetableDelivery': [delivery]}}
+
+    def _stoppoints_discovery(self, params, query, now):
+        points = self.network.stop_points(
+            params.get('stopCode'),
+            float(params['latitude']) if params.get('latitude') else None,
+            float(params['longitude']) if params.get('longitude') else None,
+            int(params['distance']) if params.get('distance') else None,
+            params.get('includeLinesDestinations', '').lower() == 'true')
+        return {'StopPointsDelivery': {'ResponseTimestamp': iso(now), 'RequestMessageRef': params.get('MessageIdentifier'),
+                                       'AnnotatedStopPointRef': points}}
+
+    def _lines_discovery(self, params, query, now):
+        return {'LinesDelivery': {'ResponseTimestamp': iso(now), 'RequestMessageRef': params.get('MessageIdentifier'),
+                                  'ValidUntil': iso(now + timedelta(days=1)), 'ShortestPossibleCycle': 'PT3600S',
+                                  'AnnotatedLineRef': self.network.annotated_lines()}}
+
+    def _general_message(self, params, query, now):
+        line_refs = [ref for key in ('LineRef', 'ImpactedLineRef') for value in query.get(key, [])
+                     for ref in value.split(',')]
+        messages = self.network.info_messages(now, line_refs or None, query.get('InfoChannelRef'))
+        delivery = {'version': '2.0', 'ResponseTimestamp': iso(now), 'ShortestPossibleCycle': 'PT60S',
+                    'InfoMessage': messages}
+        return {'ServiceDelivery': {'ResponseTimestamp': iso(now), 'RequestMessageRef': params.get('MessageIdentifier'),
+                                    'GeneralMessageDelivery': [delivery]}}
+
+    def _timetable_file(self, params, query, now):
+        return {'TimetablesFiles': self.network.timetable_files(params['logicalStopCode'], now)}
+
+    def _weather(self, query):
+        params = {key: values[0] for key, values in query.items()}
+        if not params.get('appid'):
+            return self._error('weather', 401, 'Invalid API key.')
+        if not params.get('q'):
+            return self._error('weather', 400, 'Nothing to geocode')
+        payload = self._recorded('weather')
+        if payload is None:
+            now = self._clock()
+            # Météo stable pour une ville pendant une heure
+            seed = int(hashlib.sha1(f"{params['q'].lower()}{now:%Y%m%d%H}".encode()).hexdigest()[:8], 16)
+            conditions = [(800, 'Clear', 'ciel dégagé', '01d'), (802, 'Clouds', 'partiellement nuageux', '03d'),
+                          (804, 'Clouds', 'couvert', '04d'), (500, 'Rain', 'légère pluie', '10d')]
+            code, main, description, icon = conditions[seed % len(conditions)]
+            payload = {
+                'name': params['q'],
+                'weather': [{'id': code, 'main': main, 'description': description, 'icon': icon}],
+                'main': {'temp': round(5 + seed % 200 / 10, 1), 'humidity': 40 + seed % 50},
+                'dt': int(now.timestamp()),
+            }
+        max_age = self.settings.max_age_for('weather')
+        headers = {'Cache-Control': f"max-age={max_age}"} if max_age else {}
+        return 200, headers, payload
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    standin = None
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        if parts.path == '/_standin/stats':
+            self._send(200, {}, self.standin.stats())
+            return
+        if parts.path == '/_standin/settings':
+            self._send(200, {}, self.standin.settings.as_dict())
+            return
+        delay = self.standin.delay()
+        if delay:
+            time.sleep(delay)
+        status, headers, payload = self.standin.handle(parts.path, parse_qs(parts.query),
+                                                       self.headers.get('Authorization'))
+        self._send(status, headers, payload)
+
+    def do_POST(self):
+        if urlsplit(self.path).path != '/_standin/settings':
+            self._send(404, {}, {'error': 'not found'})
+            return
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            self.standin.settings.update(json.loads(self.rfile.read(length) or b'{}'))
+        except ValueError as e:
+            self._send(400, {}, {'error': str(e)})
+            return
+        self._send(200, {}, self.standin.settings.as_dict())
+
+    def _send(self, status, headers, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start(port=0, settings=None, recorded_dir=RECORDED_DIR, host='127.0.0.1'):
+    """Démarre le serveur dans un thread ; retourne (serveur, URL de base, Standin)"""
+    standin = Standin(settings, recorded_dir=recorded_dir)
+    handler = type('Handler', (StandinHandler,), {'standin': standin})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='upstream-standin', daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}", standin
+
+
+def record(args):
+    """Enregistre une réponse réelle de chaque endpoint dans fixtures/recorded/ (une seule requête par endpoint)"""
+    import requests
+    os.makedirs(args.output, exist_ok=True)
+    base = args.cts_base_url.rstrip('/')
+    requests_to_record = {
+        'stop-monitoring': {'MonitoringRef': args.stop, 'PreviewInterval': 'PT1H', 'MaximumStopVisits': 10},
+        'estimated-timetable': {'LineRef': args.line, 'PreviewInterval': 'PT30M'},
+        'stoppoints-discovery': {'includeLinesDestinations': 'true'},
+        'lines-discovery': {},
+        'general-message': {},
+    }
+    for name, params in requests_to_record.items():
+        response = requests.get(f"{base}/v1/siri/2.0/{name}", params=params, auth=(args.token, ''), timeout=(3, 15))
+        response.raise_for_status()
+        with open(os.path.join(args.output, f"{name}.json"), 'w', encoding='utf-8') as f:
+            json.dump(response.json(), f, ensure_ascii=False, indent=1)
+        print(f"{name} : {len(response.content)} octets enregistrés")
+    if args.appid:
+        response = requests.get('https://api.openweathermap.org' + WEATHER_PATH, timeout=(3, 10),
+                                params={'q': args.city, 'appid': args.appid, 'units': 'metric', 'lang': 'fr'})
+        response.raise_for_status()
+        with open(os.path.join(args.output, 'weather.json'), 'w', encoding='utf-8') as f:
+            json.dump(response.json(), f, ensure_ascii=False, indent=1)
+        print(f"weather : {len(response.content)} octets enregistrés")
+
+
+def _max_age_option(value):
+    name, _, seconds = value.partition('=')
+    if not seconds or name not in CTS_ENDPOINTS + ('weather',):
+        raise argparse.ArgumentTypeError(f"attendu <endpoint>=<secondes>, endpoint parmi {', '.join(CTS_ENDPOINTS)}, weather")
+    return name, int(seconds)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(dest='command')
+    recorder = subparsers.add_parser('record', help="enregistre des réponses réelles comme fixtures")
+    recorder.add_argument('--token', required=True, help="jeton de l'API CTS")
+    recorder.add_argument('--stop', required=True, help="code d'arrêt enregistré")
+    recorder.add_argument('--line', default='A')
+    recorder.add_argument('--city', default='Strasbourg')
+    recorder.add_argument('--appid', help="clé OpenWeather (météo non enregistrée sinon)")
+    recorder.add_argument('--cts-base-url', default='https://api.cts-strasbourg.eu')
+    recorder.add_argument('--output', default=RECORDED_DIR)
+
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8900)
+    parser.add_argument('--latency', type=float, default=0.05, help="latence de chaque réponse (s)")
+    parser.add_argument('--jitter', type=float, default=0.0, help="variation aléatoire de la latence (± s)")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="part des réponses en erreur (0 à 1)")
+    parser.add_argument('--error-status', type=int, default=500)
+    parser.add_argument('--max-age', type=int, default=30, help="Cache-Control max-age (0 : no-cache, -1 : absent)")
+    parser.add_argument('--max-age-for', type=_max_age_option, action='append', default=[], metavar='ENDPOINT=S')
+    parser.add_argument('--rate-limit', type=int, default=0, help="requêtes par minute avant 429 (0 : illimité)")
+    parser.add_argument('--token', help="jeton CTS exigé (n'importe lequel sinon)")
+    parser.add_argument('--recorded', default=RECORDED_DIR, help="répertoire des réponses enregistrées")
+    args = parser.parse_args()
+
+    if args.command == 'record':
+        record(args)
+        return
+
+    max_age = {'*': None if args.max_age < 0 else args.max_age}
+    max_age.update(dict(args.max_age_for))
+    settings = StandinSettings(args.latency, args.jitter, args.error_rate, args.error_status, max_age,
+                               args.rate_limit, args.token)
+    server, url, _ = start(args.port, settings, args.recorded, args.host)
+    print(f"API CTS et OpenWeather simulées sur {url} (Ctrl+C pour arrêter)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,211 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from extensions import logger
+from http_client import upstream
+from snapshots import snapshot_store
+
+OPENWEATHER_URL = "https://api.openweathermap.org/data/2.5/weather"
+
+
+def fetch_weather(city, api_key, timeout=(3, 5), url=OPENWEATHER_URL):
+    """Interroge OpenWeather et retourne les données affichées par le bandeau"""
+    response = upstream.get(
+        url,
+        params={
+            "q": city,
+            "appid": api_key,
+            "units": "metric",
+            "lang": "fr"
+        },
+        timeout=timeout
+    )
+    response.raise_for_status()
+
+    data = response.json()
+    description = data['weather'][0]['description']
+    description = description[:1].upper() + description[1:]
+
+    return {
+        'temp': round(data['main']['temp']),
+        'description': description,
+        'icon': data['weather'][0]['icon']
+    }
+
+
+def cache_key(city, api_key):
+    """Clé d'une ville, propre à la clé d'API (empreinte seulement : la clé n'est pas écrite sur disque)"""
+    digest = hashlib.sha1((api_key or '').encode('utf-8')).hexdigest()[:12]
+    return f"{city.strip().lower()}:{digest}"
+
+
+class WeatherCache:
+    """Cache météo par ville, servi immédiatement puis revalidé en arrière-plan (stale-while-revalidate).
+
+    Au-delà de revalidate_after secondes, une requête déclenche une revalidation
+    asynchrone tout en recevant la dernière donnée connue ; au-delà de stale_limit,
+    la donnée est considérée comme perdue. Le nombre de villes est borné (LRU).
+    Changer de clé d'API change la clé du cache : rien de ce qui a été obtenu avec
+    l'ancienne clé n'est servi. Un échec (clé refusée, API en panne) est retenu
+    revalidate_after secondes : pendant ce délai, aucun nouvel appel pour la même
+    ville et la même clé, refresh() retourne None.
+    """
+
+    def __init__(self, max_cities=16, revalidate_after=300, stale_limit=3600,
+                 timeout=(3, 5), fetch=fetch_weather, clock=time.monotonic):
+        self.max_cities = max_cities
+        self.revalidate_after = revalidate_after
+        self.stale_limit = stale_limit
+        self.timeout = timeout
+        self.url = OPENWEATHER_URL
+        self._fetch = fetch
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        # Villes sans instantané sur disque : pas de nouvelle lecture avant revalidate_after
+        self._absent = OrderedDict()
+        # Derniers échecs par ville et clé : pas de nouvel appel avant revalidate_after
+        self._failures = OrderedDict()
+        self._revalidating = set()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.errors = 0
+        self.suppressed = 0
+        self.evictions = 0
+
+    def configure(self, config):
+        self.max_cities = config['WEATHER_CACHE_SIZE']
+        self.revalidate_after = config['WEATHER_REVALIDATE_AFTER']
+        self.stale_limit = config['WEATHER_STALE_LIMIT']
+        self.timeout = (config['WEATHER_CONNECT_TIMEOUT'], config['WEATHER_READ_TIMEOUT'])
+        self.url = config['WEATHER_API_URL']
+
+    def get(self, city, api_key):
+        """Retourne la dernière météo connue pour la ville, ou None"""
+        key = cache_key(city, api_key)
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            # Lecture disque hors verrou
+            entry = self._load_persisted(key)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            payload, fetched_at = entry
+            age = self._clock() - fetched_at
+            if age > self.stale_limit:
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            if age <= self.revalidate_after:
+                self.hits += 1
+                return payload
+            self.stale_hits += 1
+            start = key not in self._revalidating and not self._failed_recently(key)
+            if start:
+                self._revalidating.add(key)
+
+        if start:
+            threading.Thread(
+                target=self._revalidate, args=(key, city, api_key),
+                name='educinfo-weather-revalidate', daemon=True
+            ).start()
+        return payload
+
+    def refresh(self, city, api_key):
+        """Récupère la météo de façon synchrone et la met en cache ; None si un échec récent est retenu"""
+        key = cache_key(city, api_key)
+        with self._lock:
+            if self._failed_recently(key):
+                self.suppressed += 1
+                return None
+        try:
+            payload = self._fetch(city, api_key, timeout=self.timeout, url=self.url)
+        except Exception:
+            with self._lock:
+                self.errors += 1
+                self._remember(self._failures, key)
+            raise
+        self._store(key, payload)
+        return payload
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'stale_hits': self.stale_hits,
+                'misses': self.misses,
+                'revalidations': self.revalidations,
+                'errors': self.errors,
+                'suppressed': self.suppressed,
+                'evictions': self.evictions,
+            }
+
+    def _store(self, key, payload):
+        with self._lock:
+            self._insert(key, (payload, self._clock()))
+        snapshot_store.save('weather', key, payload)
+
+    def _insert(self, key, entry):
+        # Appelé sous self._lock : seul chemin d'insertion, borné à max_cities (LRU)
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        self._absent.pop(key, None)
+        self._failures.pop(key, None)
+        while len(self._entries) > self.max_cities:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _load_persisted(self, key):
+        # Après un redémarrage : dernière météo enregistrée, avec son âge réel (revalidée si ancienne)
+        now = self._clock()
+        with self._lock:
+            checked_at = self._absent.get(key)
+            if checked_at is not None and now - checked_at < self.revalidate_after:
+                return None
+        persisted = snapshot_store.load('weather', key)
+        age = max(0.0, time.time() - persisted[1]) if persisted else None
+        with self._lock:
+            if persisted is None or age > self.stale_limit:
+                self._remember(self._absent, key)
+                return None
+            entry = (persisted[0], now - age)
+            self._insert(key, entry)
+        return entry
+
+    def _remember(self, table, key):
+        # Appelé sous self._lock : horodatage borné à max_cities entrées
+        table[key] = self._clock()
+        table.move_to_end(key)
+        while len(table) > self.max_cities:
+            table.popitem(last=False)
+
+    def _failed_recently(self, key):
+        # Appelé sous self._lock
+        failed_at = self._failures.get(key)
+        return failed_at is not None and self._clock() - failed_at < self.revalidate_after
+
+    def _revalidate(self, key, city, api_key):
+        try:
+            self._store(key, self._fetch(city, api_key, timeout=self.timeout, url=self.url))
+            with self._lock:
+                self.revalidations += 1
+        except Exception as e:
+            # La donnée précédente reste servie jusqu'à stale_limit
+            with self._lock:
+                self.errors += 1
+                self._remember(self._failures, key)
+            logger.warning(f"Revalidation météo impossible pour {city}: {e}")
+        finally:
+            with self._lock:
+                self._revalidating.discard(key)
+
+
+weather_cache = WeatherCache()